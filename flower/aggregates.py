@@ -0,0 +1,89 @@
+# coding: utf-8
+'''
+Counts and totals over a World kept up to date as it changes.
+
+    aggregates = Aggregates().attach(world)
+    aggregates.count(Flower)
+    aggregates.count_in_state(Flower, 'blooming')
+    aggregates.count_in_state(Egg, 'to_ripe')    # not fertilized yet
+    aggregates.total_fixed()['kledis']
+
+Every answer is a dict lookup.  The counts follow entities joining and
+leaving the world, PlantParts changing state through update_state()
+and Growths maxing out.  The total of _fixed_materials follows
+PlantPart.fix_materials() and clear_fixed_materials(); materials fixed
+by a GrowthEngine count once the engine flushes them to the parts.
+'''
+
+from soil import *
+
+
+class Aggregates(WorldListener):
+    def __init__(self):
+        self.world = None
+        # class -> number of entities
+        self._counts = {}
+        # (class, state) -> number of entities
+        self._states = {}
+        # class -> number of times a Growth of the class maxed out
+        self._maxed = {}
+        self._fixed = Materials()
+
+    def attach(self, world):
+        self.world = world
+        world.aggregates = self
+        world.listen(self)
+        for e in world.entities:
+            self.entity_added(e)
+        return self
+
+    def entity_added(self, entity):
+        self._change(entity, 1)
+
+    def entity_removed(self, entity):
+        self._change(entity, -1)
+
+    def _change(self, entity, sign):
+        cls = type(entity)
+        self._counts[cls] = self._counts.get(cls, 0) + sign
+        state = getattr(entity, '_state', None)
+        if state is not None:
+            key = (cls, state)
+            self._states[key] = self._states.get(key, 0) + sign
+        fixed = getattr(entity, '_fixed_materials', None)
+        if fixed is not None:
+            self._fixed.add(fixed, sign)
+
+    def _counted(self, part):
+        # parts made during a tick are counted when they join the world after it
+        return part in self.world.entities
+
+    def state_changed(self, part, previous):
+        if not self._counted(part): return
+        cls = type(part)
+        self._states[(cls, previous)] -= 1
+        key = (cls, part._state)
+        self._states[key] = self._states.get(key, 0) + 1
+
+    def fixed(self, part, materials, factor):
+        if not self._counted(part): return
+        self._fixed.add(materials, factor)
+
+    def maxed(self, part):
+        cls = type(part)
+        self._maxed[cls] = self._maxed.get(cls, 0) + 1
+
+    def count(self, cls):
+        '''the number of entities of exactly cls'''
+        return self._counts.get(cls, 0)
+
+    def count_in_state(self, cls, state):
+        return self._states.get((cls, state), 0)
+
+    def count_maxed(self, cls):
+        '''how many times a Growth of a part of cls has maxed out'''
+        return self._maxed.get(cls, 0)
+
+    def total_fixed(self):
+        '''the materials fixed in all parts in the world, do not modify'''
+        return self._fixed
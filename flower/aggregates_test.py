@@ -0,0 +1,66 @@
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+from aggregates import *
+
+
+def scan(world):
+    counts = {}
+    states = {}
+    fixed = Materials()
+    for e in world.entities:
+        counts[type(e)] = counts.get(type(e), 0) + 1
+        if getattr(e, '_state', None) is not None:
+            states[(type(e), e.state())] = states.get((type(e), e.state()), 0) + 1
+        if isinstance(e, PlantPart):
+            fixed.add(e._fixed_materials)
+    return counts, states, fixed
+
+
+class AggregatesTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.params = Params.plant_parameters()
+
+    def assert_same_as_scan(self, aggregates):
+        counts, states, fixed = scan(self.world)
+        for cls in [Seed, Root, Flower, Pollen, Egg]:
+            assert_that(aggregates.count(cls), is_(counts.get(cls, 0)), cls.__name__)
+        for (cls, state), count in states.items():
+            assert_that(aggregates.count_in_state(cls, state), is_(count), '%s %s' % (cls.__name__, state))
+        for name in Materials.NAMES:
+            assert_that(aggregates.total_fixed()[name], close_to(fixed[name], 1e-9), name)
+
+    def test_follows_a_flower_to_its_seed(self):
+        Seed({'kledis': 100.0}, self.params)
+        flower = Flower(Vein(), self.params)
+        aggregates = Aggregates().attach(self.world)
+        flower.take_in_from_environment({'kledis': 21.0})
+        tickn(10)
+        self.assert_same_as_scan(aggregates)
+        assert_that(aggregates.count_in_state(Flower, 'blooming'), is_(1))
+        assert_that(aggregates.count_in_state(Egg, 'to_ripe'), is_(1))
+
+        egg = flower._vein.part('egg')[0]
+        ReproducingRule().mate(egg, flower._vein.part('pollen')[0])
+        assert_that(aggregates.count(Pollen), is_(9))
+        assert_that(aggregates.count_in_state(Egg, 'to_ripe'), is_(0))
+        tickn(10)
+        self.assert_same_as_scan(aggregates)
+        assert_that(aggregates.count_in_state(Egg, 'seeded'), is_(1))
+        assert_that(aggregates.count(Seed), is_(2))
+        assert_that(aggregates.count_maxed(Egg), is_(2))
+
+    def test_removed_parts_leave_the_totals(self):
+        flower = Flower(Vein(), self.params)
+        flower.take_in_from_environment({'kledis': 21.0})
+        tickn(10)
+        aggregates = Aggregates().attach(self.world)
+        for pollen in list(flower._vein.part('pollen')):
+            pollen.remove()
+        flower._vein.part('egg')[0].remove()
+        self.assert_same_as_scan(aggregates)
+        assert_that(aggregates.count(Pollen), is_(0))
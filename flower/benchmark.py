@@ -0,0 +1,266 @@
+# coding: utf-8
+'''
+Benchmarks for the simulation.
+
+    python benchmark.py materials
+    python benchmark.py memory
+    python benchmark.py suite --max-plants 1000 --output results.json
+
+The suite grows worlds with the parameter sets of designed_plant_params
+and measures ticks per second, the cost of one entity tick and the peak
+memory and the objects left for the garbage collector to track in
+each scenario.  memory reports the bytes each entity takes in the
+scenarios, not counting what entities share like their parameters.
+Every scenario runs in a fresh process so that peak memory is its own.
+Results are written as JSON.
+'''
+
+import argparse
+import gc
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import timeit
+import types
+
+from soil import *
+from designed_plant import *
+from designed_plant_params import Params
+from plant import ParameterNode
+
+
+class DictMaterials(object):
+    '''The dict based Materials as it used to be.  Kept as the baseline.'''
+    NAMES = Materials.NAMES
+
+    def __init__(self, d=None):
+        self._contents = d if d else {}
+
+    def __getitem__(self, key):
+        return self._contents.get(key, 0)
+
+    def __setitem__(self, key, val):
+        self._contents[key] = val
+
+    def __iter__(self):
+        return self._contents.__iter__()
+
+    def __mul__(self, number):
+        return DictMaterials(dict([(k, self._contents[k] * number) for k in self._contents]))
+
+    def __ge__(self, other):
+        return all(self[name] >= other[name] for name in DictMaterials.NAMES)
+
+
+def leaves_tick_with_dict(pooled, take_in, consumption, product, volume):
+    # what Leaves.tick did to the pool: three products and two pool updates
+    taken = take_in * volume
+    for name in taken:
+        pooled[name] += taken[name]
+    source = consumption * volume
+    assert pooled >= source
+    for name in source:
+        pooled[name] -= source[name]
+    produced = product * volume
+    for name in produced:
+        pooled[name] += produced[name]
+
+
+def leaves_tick_with_materials(pooled, take_in, consumption, product, volume):
+    pooled.add(take_in, volume)
+    assert pooled >= consumption * volume
+    pooled.subtract(consumption, volume)
+    pooled.add(product, volume)
+
+
+def instance_size(materials):
+    size = sys.getsizeof(materials)
+    if hasattr(materials, '__dict__'):
+        size += sys.getsizeof(materials.__dict__)
+        size += sys.getsizeof(materials._contents)
+    else:
+        size += sys.getsizeof(materials._values)
+    return size
+
+
+def bench_materials(number=100000):
+    results = {}
+    for label, cls, tick in [('dict', DictMaterials, leaves_tick_with_dict),
+                             ('slots', Materials, leaves_tick_with_materials)]:
+        pooled = cls({'kledis': 1.0e9, 'heplon': 1.0e9, 'mygen': 1.0e9, 'water': 1.0e9})
+        take_in = cls({'mygen': 1.0})
+        consumption = cls({'mygen': 1.0, 'heplon': 1.0})
+        product = cls({'kledis': 1.0})
+        seconds = min(timeit.repeat(lambda: tick(pooled, take_in, consumption, product, 0.5), number=number, repeat=3))
+        results[label] = {
+            'usec_per_tick': seconds / number * 1.0e6,
+            'bytes_per_instance': instance_size(cls({'kledis': 1.0, 'water': 1.0})),
+        }
+    return results
+
+
+def build_seeds(plants):
+    params = Params.plant_parameters()
+    for i in xrange(plants):
+        Seed({'kledis': 100.0}, params)
+
+
+def build_seeds_in_bulk(plants):
+    Seed.plant_many([{'kledis': 100.0}] * plants, Params.plant_parameters())
+
+
+def build_bloomed(plants):
+    params = Params.plant_parameters()
+    for i in xrange(plants):
+        flower = Flower(Vein(), params)
+        flower.take_in_from_environment({'kledis': 21.0})
+    # 10 pollen and a ripe egg per flower
+    world = World.current()
+    for i in xrange(10):
+        world.tick()
+
+
+def build_fertilizing(plants):
+    params = Params.plant_parameters()
+    Pollination(radius=1.0)
+    columns = int(plants ** 0.5) + 1
+    for i in xrange(plants):
+        flower = Flower(Vein(), params)
+        flower.location = (float(i % columns), float(i / columns))
+        flower.take_in_from_environment({'kledis': 21.0})
+    world = World.current()
+    for i in xrange(5):
+        world.tick()
+
+
+def build_fertilizing_pooled(plants):
+    PartPool().attach(World.current())
+    build_fertilizing(plants)
+
+
+SCENARIOS = [
+    ('seeds', build_seeds),
+    ('seeds_in_bulk', build_seeds_in_bulk),
+    ('bloomed', build_bloomed),
+    ('fertilizing', build_fertilizing),
+    ('fertilizing_pooled', build_fertilizing_pooled),
+]
+
+PLANTS = [1, 1000, 100000, 1000000]
+
+
+def bytes_per_entity(world):
+    '''
+    The size of the objects reachable from the entities of world, per
+    entity.  Shared read-only objects, e.g. parameters, classes and the
+    world itself, are not counted.
+    '''
+    shared = (World, ParameterNode, type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+    seen = set()
+    total = 0
+    stack = list(world.entities)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, shared): continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total / float(len(world.entities)) if len(world.entities) else 0.0
+
+
+def bench_memory(plants=100):
+    results = {}
+    for name, build in SCENARIOS:
+        world = World.reset()
+        build(plants)
+        results[name] = bytes_per_entity(world)
+    return results
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_scenario(name, plants, ticks):
+    build = dict(SCENARIOS)[name]
+    rss_before = max_rss_kb()
+    world = World.reset()
+    build(plants)
+    entities_before = len(world.entities)
+    started = time.time()
+    for i in xrange(ticks):
+        world.tick()
+    seconds = time.time() - started
+    entity_ticks = (entities_before + len(world.entities)) / 2.0 * ticks
+    return {
+        'scenario': name,
+        'plants': plants,
+        'ticks': ticks,
+        'entities': len(world.entities),
+        'seconds': seconds,
+        'ticks_per_second': ticks / seconds if seconds else None,
+        'usec_per_entity_tick': seconds / entity_ticks * 1.0e6 if entity_ticks else None,
+        'peak_rss_kb': max_rss_kb(),
+        'scenario_rss_kb': max_rss_kb() - rss_before,
+        'gc_objects': len(gc.get_objects()),
+    }
+
+
+def _run_scenario(args):
+    return run_scenario(*args)
+
+
+def run_suite(max_plants, ticks, scenarios=None):
+    results = []
+    for name, build in SCENARIOS:
+        if scenarios and name not in scenarios: continue
+        for plants in PLANTS:
+            if plants > max_plants: continue
+            pool = multiprocessing.Pool(1)
+            try:
+                results.append(pool.apply(_run_scenario, ((name, plants, ticks),)))
+            finally:
+                pool.close()
+                pool.join()
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.time(),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='flower benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('materials')
+    subparsers.add_parser('memory')
+    suite = subparsers.add_parser('suite')
+    suite.add_argument('--max-plants', type=int, default=PLANTS[-1])
+    suite.add_argument('--ticks', type=int, default=10)
+    suite.add_argument('--scenario', action='append', choices=[name for name, build in SCENARIOS])
+    suite.add_argument('--output', default='-')
+    args = parser.parse_args(argv)
+
+    if args.command == 'materials':
+        for label, result in sorted(bench_materials().items()):
+            print '%-6s %8.3f usec/tick %6d bytes/instance' % (label, result['usec_per_tick'], result['bytes_per_instance'])
+        return
+
+    if args.command == 'memory':
+        for name, result in sorted(bench_memory().items()):
+            print '%-20s %8.1f bytes/entity' % (name, result)
+        return
+
+    report = run_suite(args.max_plants, args.ticks, args.scenario)
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,24 @@
+import unittest
+from hamcrest import *
+
+from benchmark import *
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_scenarios_run(self):
+        for name, build in SCENARIOS:
+            result = run_scenario(name, 2, 2)
+            assert_that(result['scenario'], is_(name))
+            assert_that(result['ticks_per_second'], greater_than(0))
+            assert_that(result['usec_per_entity_tick'], greater_than(0))
+
+    def test_bloomed_flowers_have_ten_pollen(self):
+        World.reset()
+        build_bloomed(1)
+        assert_that([type(e).__name__ for e in World.current().entities].count('Pollen'), is_(10))
+
+    def test_bytes_per_entity(self):
+        world = World.reset()
+        build_bloomed(2)
+        assert_that(bytes_per_entity(world), greater_than(0))
+        assert_that([hasattr(e, '__dict__') for e in world.entities], only_contains(False))
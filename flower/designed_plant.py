@@ -1,9 +1,8 @@
 # coding: utf-8
 
-from pattern import switch
-
 from soil import *
 from plant import *
+from spatial import SpatialHash
 
 class Seed(PlantPart):
     '''
@@ -19,23 +18,36 @@ class Seed(PlantPart):
     to produce energy and regain heplon and mygen.
 
     '''
+    __slots__ = ('_root', '_stem')
+    STATES = [
+        ('seed', 'tick_for_seed', [('has_root', 'rooted')]),
+        ('rooted', 'tick_for_rooted', [('has_stem', 'sprouted')]),
+        ('sprouted', 'tick_for_sprouted', []),
+    ]
 
     def __init__(self, initial_contents, params):
         super(Seed, self).__init__('seed', Vein(), params)
         self._vein.pour_in(initial_contents, self)
 
+    @classmethod
+    def plant_many(cls, contents, params, locations=None):
+        '''plants a seed for each of contents and adds them to the world at once'''
+        world = World.current()
+        world.start_bulk(len(contents))
+        try:
+            for i, initial_contents in enumerate(contents):
+                seed = cls(initial_contents, params)
+                if locations is not None: seed.location = locations[i]
+        finally:
+            seeds = world.end_bulk()
+        return seeds
+
     def root(self):
         self._root = self.generate_part(Root)
 
     def sprout(self):
         self._stem = self.generate_part(Stem)
 
-    def tick(self):
-        switch(self.state(),
-               'seed', self.tick_for_seed,
-               'rooted', self.tick_for_rooted,
-               'sprouted', self.tick_for_sprouted)
-
     def tick_for_seed(self):
         self.take_in_from_environment({'water': self._params.seed.water_for_seed})
         if self._vein.pooled()['water'] >= self._params.seed.pooled_water_to_root:
@@ -48,28 +60,59 @@ class Seed(PlantPart):
                 break
 
     def tick_for_sprouted(self):
-        pass
+        self.sleep()
+
+    def flow(self):
+        if self.state() == 'seed':
+            return Flow().move(inflow={'water': self._params.seed.water_for_seed})
+        return Flow()
+
+    def quiet_ticks(self, course, limit):
+        state = self.state()
+        if state == 'seed':
+            return course.ticks_below('water', self._params.seed.pooled_water_to_root, limit)
+        if state == 'rooted':
+            # sprouts when both water and a root are enough
+            roots = min(root.growth.ticks_below(self._params.seed.length_to_sprout, limit) for root in self._vein.part('root'))
+            return max(roots, course.ticks_below('water', self._params.seed.pooled_water_to_sprout, limit))
+        return limit
+
+    def has_root(self):
+        return bool(self._vein.part('root'))
 
-    def state(self):
-        if not self._vein.part('root'):
-            return 'seed'
-        if not self._vein.part('stem'):
-            return 'rooted'
-        else:
-            return 'sprouted'
+    def has_stem(self):
+        return bool(self._vein.part('stem'))
 
 
 class Root(PlantPart):
+    __slots__ = ('growth',)
+
     def __init__(self, vein, params):
         super(Root, self).__init__('root', vein, params)
         self.growth = Growth(self, params.root.growth)
 
     def tick(self):
-        self.take_in_from_environment(self._params['root']['take_in_per_volume'] * self.growth.volume)
+        # a root reaches as deep as its volume
+        volume = self.growth.volume
+        self.take_in_from_earth(self._params.root.take_in_per_volume, volume, depth=volume)
         self.growth.grow()
 
+    def flow(self):
+        growth = self.growth.flow()
+        if growth is None or (self.world.ground is not None and self.location is not None): return None
+        take_in = Materials(self._params.root.take_in_per_volume)
+        return Flow().move(inflow=take_in * self.growth.volume, inflow_slope=take_in * self.growth.volume_slope()).add(growth)
+
+    def quiet_ticks(self, course, limit):
+        return self.growth.quiet_ticks(limit)
+
+    def skip(self, ticks):
+        self.growth.skip(ticks)
+
 
 class Stem(PlantPart):
+    __slots__ = ('growth', '_leaves')
+
     def __init__(self, vein, params):
         super(Stem, self).__init__('stem', vein, params)
         self.growth = Growth(self, params.stem.growth)
@@ -77,6 +120,16 @@ class Stem(PlantPart):
 
     def tick(self):
         self.growth.grow()
+        if self.growth.idle(): self.sleep()
+
+    def flow(self):
+        return self.growth.flow()
+
+    def quiet_ticks(self, course, limit):
+        return self.growth.quiet_ticks(limit)
+
+    def skip(self, ticks):
+        self.growth.skip(ticks)
 
     @EventDispatcher.event_handler
     def on_maxed(self):
@@ -85,61 +138,188 @@ class Stem(PlantPart):
 
 
 class Leaves(PlantPart):
+    __slots__ = ('growth',)
+
     def __init__(self, vein, params):
         super(Leaves, self).__init__('leaves', vein, params)
         self.growth = Growth(self, params.leaves.growth)
 
     def tick(self):
+        leaves = self._params.leaves
         self.growth.grow()
-        self.take_in_from_environment(self._params.leaves.take_in * self.growth.volume)
-        self.produce_material(self._params.leaves.produce_for_synthesis * self.growth.volume, self._params.leaves.consumption_for_synthesis * self.growth.volume)
+        volume = self.growth.volume
+        self.take_in_from_air(leaves.take_in, volume)
+        # depleted air leaves less to synthesize from than the volume asks for
+        volume = min(volume, self._vein.pooled().fits(leaves.consumption_for_synthesis))
+        self.produce_material(leaves.produce_for_synthesis, leaves.consumption_for_synthesis, volume)
+
+    def flow(self):
+        flow = self.growth.flow()
+        if flow is None or (self.world.air is not None and self.location is not None): return None
+        leaves = self._params.leaves
+        slope = self.growth.volume_slope()
+        # take-in and synthesis go by the volume after growing
+        volume = self.growth.volume + slope
+        take_in = Materials(leaves.take_in)
+        product = Materials(leaves.produce_for_synthesis)
+        source = Materials(leaves.consumption_for_synthesis)
+        flow.move(take_in * volume, take_in * slope)
+        return flow.move(product * volume, product * slope, source * volume, source * slope)
+
+    def quiet_ticks(self, course, limit):
+        return self.growth.quiet_ticks(limit)
+
+    def skip(self, ticks):
+        self.growth.skip(ticks)
 
 
 class Flower(PlantPart):
+    __slots__ = ('pollen_generation', 'egg_generation')
+    # once bloomed, stays in that status
+    STATES = [
+        ('growing', 'tick_for_growing', [('ready_to_bloom', 'blooming')]),
+        ('blooming', 'tick_for_blooming', []),
+    ]
+
     def __init__(self, vein, params):
         super(Flower, self).__init__('flower', vein, params)
         self.pollen_generation = PlantPartGeneration(self, params.flower.generation.pollen)
         self.egg_generation = PlantPartGeneration(self, params.flower.generation.egg)
-        self.is_blooming = False
 
-    def tick(self):
+    @property
+    def is_blooming(self):
+        return self._state == 'blooming'
+
+    def tick_for_growing(self):
         self.pollen_generation.tick()
         self.egg_generation.tick()
+        self.update_state()
+
+        generations = [self.pollen_generation, self.egg_generation]
+        if self.is_blooming:
+            self.sleep()
+        elif any(g.short_of_materials() for g in generations) and all(g.maxed_out() or g.short_of_materials() for g in generations):
+            # nothing to do until more materials come in
+            self._vein.wait_for_materials(self)
 
-        if self.pollen_generation.maxed_out() and self.egg_generation.maxed_out() and self.egg_generation._generated[0].is_ripen:
-            # once bloomed, stays in that status
-            self.is_blooming = True
+    def tick_for_blooming(self):
+        self.sleep()
+
+    def forget(self, part):
+        self.pollen_generation.forget(part)
+        self.egg_generation.forget(part)
+
+    def ready_to_bloom(self):
+        return self.pollen_generation.maxed_out() and self.egg_generation.maxed_out() and self.egg_generation._generated[0].is_ripen
+
+    def flow(self):
+        return Flow()
+
+    def quiet_ticks(self, course, limit):
+        if self.is_blooming: return limit
+        if self.pollen_generation.maxed_out() and self.egg_generation.maxed_out():
+            # blooms when the egg ripens, which the egg will not skip
+            return 0 if self.egg_generation._generated[0].is_ripen else limit
+        return min(self.pollen_generation.quiet_ticks(course, limit), self.egg_generation.quiet_ticks(course, limit))
 
 
 class Pollen(PlantPart):
+    __slots__ = ()
+    poolable = True
+
     def __init__(self, vein, params):
         super(Pollen, self).__init__('pollen', vein, params)
 
+    def tick(self):
+        # pollen floats with the wind if there is any
+        if not self._params.has_pollen:
+            self.sleep()
+            return
+        if self.location is None: return
+        dx, dy = self._params.pollen.drift
+        self.location = (self.location[0] + dx, self.location[1] + dy)
+
+    def flow(self):
+        return Flow()
+
+    def quiet_ticks(self, course, limit):
+        return limit
+
+    def skip(self, ticks):
+        if self.location is None or not self._params.has_pollen: return
+        dx, dy = self._params.pollen.drift
+        self.location = (self.location[0] + dx * ticks, self.location[1] + dy * ticks)
+
 
 class Egg(PlantPart):
+    __slots__ = ('growth', 'is_ripen', '_fertilized', '_seed')
+    STATES = [
+        ('to_ripe', None, [('is_fertilized', 'fertilized')]),
+        ('fertilized', None, [('has_seed', 'seeded')]),
+        ('seeded', None, []),
+    ]
+
     def __init__(self, vein, params):
         super(Egg, self).__init__('egg', vein, params)
-        self.growth = Growth(self, params.egg.growth)
         self.is_ripen = False
-        self.fertilized = False
-        self.seed = None
+        self._fertilized = False
+        self._seed = None
+        # the state is complete before the growth asks for it
+        self.growth = Growth(self, params.egg.growth)
+
+    # the state follows these as soon as they are set, between ticks too
+    def _get_fertilized(self):
+        return self._fertilized
+
+    def _set_fertilized(self, fertilized):
+        self._fertilized = fertilized
+        self.update_state()
+
+    fertilized = property(_get_fertilized, _set_fertilized)
+
+    def _get_seed(self):
+        return self._seed
+
+    def _set_seed(self, seed):
+        self._seed = seed
+        self.update_state()
+
+    seed = property(_get_seed, _set_seed)
 
     def tick(self):
         self.growth.grow()
+        if self.growth.idle(): self.sleep()
+
+    def flow(self):
+        return self.growth.flow()
+
+    def quiet_ticks(self, course, limit):
+        return self.growth.quiet_ticks(limit)
+
+    def skip(self, ticks):
+        self.growth.skip(ticks)
+
+    def fertilize(self):
+        self.fertilized = True
+        self.wake()
 
     @EventDispatcher.event_handler
     def on_maxed(self):
-        if self.state() == 'to_ripe':
+        state = self.state()
+        if state == 'to_ripe':
             self.is_ripen = True
-        elif self.state() == 'fertilized':
+        elif state == 'fertilized':
             self.seed = Seed({}, self._params)
+            self.seed.location = self.location
+            if self.world.journal: self.world.journal.generated(self, self.seed)
             self.seed.take_in_from_environment(self._fixed_materials)
-            self._fixed_materials.clear()
+            self.clear_fixed_materials()
+
+    def is_fertilized(self):
+        return self.fertilized
 
-    def state(self):
-        if self.seed: return 'seeded'
-        if self.fertilized: return 'fertilized'
-        return 'to_ripe'
+    def has_seed(self):
+        return self.seed is not None
 
 class ReproducingRule(object):
     def can_mate(self, egg, pollen):
@@ -148,6 +328,78 @@ class ReproducingRule(object):
         return False
 
     def mate(self, egg, pollen):
-        egg.fertilized = True
+        journal = egg.world.journal
+        if journal: journal.mated(egg, pollen)
+        egg.fertilize()
         pollen.remove()
         return
+
+
+class Pollination(WorldEntity, WorldListener):
+    '''
+    Mates pollen with ripe eggs within radius once per tick.
+
+    Pollen and eggs are kept in spatial hashes.  Pollen are re-indexed
+    as they float, so a tick costs about one neighbourhood query per
+    pollen.  Parts without a location are left out until they are
+    given one.  Create it in the world it should pollinate.
+    '''
+    def __init__(self, radius, rule=None):
+        super(Pollination, self).__init__()
+        self.radius = radius
+        self.rule = rule if rule else ReproducingRule()
+        # pollen in the order they were placed, and id -> pollen of the
+        # ones still placed; a pooled pollen comes back under its old id
+        self._pollen = []
+        self._placed = {}
+        self._pollen_index = SpatialHash(radius)
+        self._egg_index = SpatialHash(radius)
+        self._unplaced = []
+        self.world.listen(self)
+        for e in self.world.entities:
+            self.entity_added(e)
+
+    def entity_added(self, entity):
+        # placed on tick, the index is not changed while pollen are looked up
+        if isinstance(entity, (Pollen, Egg)) and entity.location is not None:
+            self._unplaced.append(entity)
+
+    def part_located(self, part):
+        # parts yet to join are taken by entity_added()
+        if isinstance(part, (Pollen, Egg)) and part in self.world.entities:
+            self._unplaced.append(part)
+
+    def entity_removed(self, entity):
+        if isinstance(entity, Pollen):
+            self._placed.pop(entity.id, None)
+            self._pollen_index.remove(entity)
+        elif isinstance(entity, Egg):
+            self._egg_index.remove(entity)
+
+    def tick(self):
+        placed = self._placed
+        self._pollen = [p for p in self._pollen if placed.get(p.id) is p]
+        self._place_new_entities()
+        for pollen in self._pollen:
+            # mated earlier in this tick
+            if placed.get(pollen.id) is not pollen: continue
+            self._pollen_index.move(pollen, pollen.location)
+            for egg in self._egg_index.near(pollen.location, self.radius):
+                if egg.is_ripen and not egg.fertilized and self.rule.can_mate(egg, pollen):
+                    self.rule.mate(egg, pollen)
+                    self._egg_index.remove(egg)
+                    break
+
+    def _place_new_entities(self):
+        for e in self._unplaced:
+            # part_located() hears of it again if it gets a new location
+            if getattr(e, 'destroyed', False) or e.location is None: continue
+            if isinstance(e, Pollen):
+                # listed twice if it was pooled and came back before being placed
+                if self._placed.get(e.id) is e: continue
+                self._placed[e.id] = e
+                self._pollen.append(e)
+                self._pollen_index.insert(e, e.location)
+            elif not e.fertilized:
+                self._egg_index.insert(e, e.location)
+        del self._unplaced[:]
@@ -0,0 +1,100 @@
+# coding: utf-8
+'''
+Parameter sets for designed plants, shared by the tests, the benchmarks
+and the server.
+'''
+
+from designed_plant import *
+
+
+PARTS = ('seed', 'root', 'stem', 'leaves', 'flower', 'egg')
+
+
+class Params(object):
+    @classmethod
+    def plant_parameters(cls, *parts, **replaced):
+        '''
+        PlantParameters of the parameter sets of parts, all of PARTS if
+        none are named, and of the parts given as keywords instead
+        '''
+        params = dict((part, getattr(cls, part)) for part in parts or PARTS)
+        params.update(replaced)
+        return PlantParameters(params)
+
+    seed = {
+        'pooled_water_to_root': 100,
+        'water_for_seed': 10,
+        'length_to_sprout': 1.0,
+        'pooled_water_to_sprout': 200,
+    }
+
+    root = {
+        'take_in_per_volume': Materials({'water': 10.0, 'heplon': 2.0}),
+        'growth': {
+            'default': {
+                'max_volume': 2.0,
+                'consumption_for_growth': Materials({'kledis': 1.0}),
+                'growth_volume': 0.1,
+            }
+        },
+    }
+
+    stem = {
+        'growth': {
+            'default': {
+                'max_volume': 0.5,
+                'consumption_for_growth': Materials({'kledis': 3.0}),
+                'growth_volume': 0.1,
+            }
+        }
+    }
+
+    leaves = {
+        'take_in': Materials({'mygen': 1.0}),
+        'consumption_for_synthesis': Materials({'mygen': 1.0, 'heplon': 1.0}),
+        'produce_for_synthesis': Materials({'kledis': 1.0}),
+        'growth': {
+            'default': {
+                'consumption_for_growth': Materials({}),
+                'growth_volume': 0.1,
+            }
+        }
+    }
+
+    flower = {
+        'growth': {
+            'default': {
+                'growth_volume': 0.0,
+            }
+        },
+        'generation': {
+            'pollen': {
+                'max_count': 10,
+                'source_material': Materials({'kledis': 1.0}),
+                'part_type': Pollen,
+            },
+            'egg': {
+                'max_count': 1,
+                'source_material': Materials({'kledis': 1.0}),
+                'part_type': Egg,
+            }
+        },
+    }
+
+    egg = {
+        'growth': {
+            'to_ripe': {
+                'max_volume': 5.0,
+                'consumption_for_growth': Materials({'kledis': 1.0}),
+                'growth_volume': 1.0,
+            },
+            'fertilized': {
+                'max_volume': 10.0,
+                'consumption_for_growth': Materials({'kledis': 1.0}),
+                'growth_volume': 1.0,
+            },
+            'seeded': {
+                'growth_volume': 0.0,
+            }
+        }
+    }
@@ -4,91 +4,13 @@ from hamcrest.core.base_matcher import BaseMatcher
 
 #from soil import *
 from designed_plant import *
+from designed_plant_params import Params
+from environment import Ground
 
 def tickn(n = 1):
+    world = World.current()
     for i in range(n):
-        World.tick()
-
-
-class Params(object):
-    seed = {
-        'pooled_water_to_root': 100,
-        'water_for_seed': 10,
-        'length_to_sprout': 1.0,
-        'pooled_water_to_sprout': 200,
-    }
-
-    root = {
-        'take_in_per_volume': Materials({'water': 10.0, 'heplon': 2.0}),
-        'growth': {
-            'default': {
-                'max_volume': 2.0,
-                'consumption_for_growth': Materials({'kledis': 1.0}),
-                'growth_volume': 0.1,
-            }
-        },
-    }
-
-    stem = {
-        'growth': {
-            'default': {
-                'max_volume': 0.5,
-                'consumption_for_growth': Materials({'kledis': 3.0}),
-                'growth_volume': 0.1,
-            }
-        }
-    }
-
-    leaves = {
-        'take_in': Materials({'mygen': 1.0}),
-        'consumption_for_synthesis': Materials({'mygen': 1.0, 'heplon': 1.0}),
-        'produce_for_synthesis': Materials({'kledis': 1.0}),
-        'growth': {
-            'default': {
-                'consumption_for_growth': Materials({}),
-                'growth_volume': 0.1,
-            }
-        }
-    }
-
-    flower = {
-        'growth': {
-            'default': {
-                'growth_volume': 0.0,
-            }
-        },
-        'generation': {
-            'pollen': {
-                'max_count': 10,
-                'source_material': Materials({'kledis': 1.0}),
-                'part_type': Pollen,
-            },
-            'egg': {
-                'max_count': 1,
-                'source_material': Materials({'kledis': 1.0}),
-                'part_type': Egg,
-            }
-        },
-    }
-
-    egg = {
-        'growth': {
-            'to_ripe': {
-                'max_volume': 5.0,
-                'consumption_for_growth': Materials({'kledis': 1.0}),
-                'growth_volume': 1.0,
-            },
-            'fertilized': {
-                'max_volume': 10.0,
-                'consumption_for_growth': Materials({'kledis': 1.0}),
-                'growth_volume': 1.0,
-            },
-            'seeded': {
-                'growth_volume': 0.0,
-            }
-        }
-    }
-
+        world.tick()
 
 
 class HasPart(BaseMatcher):
@@ -122,16 +44,19 @@ class DesignedPlantTest(unittest.TestCase):
         seed._stem.consume_material(Materials({'water': 10}))
         assert_that(seed._vein.pooled()['water'], is_(90))
 
+    def test_planting_many_seeds(self):
+        params = Params.plant_parameters('seed', 'root')
+        seeds = Seed.plant_many([{'kledis': 10.0}, {'kledis': 20.0}], params, locations=[(0.0, 0.0), (1.0, 0.0)])
+        assert_that([e for e in World.current().entities], is_(seeds))
+        assert_that([s._vein.pooled()['kledis'] for s in seeds], is_([10.0, 20.0]))
+        assert_that(seeds[1].location, is_((1.0, 0.0)))
+        assert_that(seeds[0]._vein, is_not(seeds[1]._vein))
+
     def test_all_growth(self):
         ground = Ground(size=(1000.0, 1000.0), depth=(10.0))
         seed = Seed(
             {'kledis': 100.0},
-            PlantParameters({
-                'seed': Params.seed,
-                'root': Params.root,
-                'stem': Params.stem,
-                'leaves': Params.leaves,
-            }))
+            Params.plant_parameters('seed', 'root', 'stem', 'leaves'))
         ground.plant(seed, location=(500.0, 500.0))
 
         assert_that(seed, has_part('seed'))
@@ -161,9 +86,7 @@ class DesignedPlantTest(unittest.TestCase):
     def test_leaves_synthesize_more_as_grow(self):
         leaves = Leaves(
             Vein(),
-            PlantParameters({
-                'leaves': Params.leaves,
-            }))
+            Params.plant_parameters('leaves'))
         leaves.take_in_from_environment(Materials({'kledis': 100, 'mygen': 100.0, 'heplon': 100.0}))
 
         leaves_volume = leaves.growth.volume
@@ -182,13 +105,7 @@ class FlowerTest(unittest.TestCase):
     def setUp(self):
         World.reset()
         vein = Vein()
-        self.flower = Flower(vein, PlantParameters({
-            'seed': Params.seed,
-            'root': Params.root,
-            'stem': Params.stem,
-            'flower': Params.flower,
-            'egg': Params.egg,
-        }))
+        self.flower = Flower(vein, Params.plant_parameters('seed', 'root', 'stem', 'flower', 'egg'))
 
     def test_bloom_with_enough_nourishment(self):
         self.flower.take_in_from_environment({'kledis': 20.0})
@@ -217,10 +134,43 @@ class FlowerTest(unittest.TestCase):
         reproducing.mate(egg, pollen)
         assert_that(egg.fertilized, is_(True))
         assert_that(pollen.destroyed, is_(True))
+        assert_that(self.flower._vein.has_part(pollen), is_(False), 'mated pollen leaves the vein')
         tickn(10)
         assert_that(egg.growth.volume, equal_to(10.0))
         assert_that(egg.seed, is_not(None))
 
+    def test_egg_state_follows_transitions_within_a_tick(self):
+        self.flower.take_in_from_environment({'kledis': 21.0})
+        tickn(10)
+        pollen = self.flower._vein.part('pollen')[0]
+        egg = self.flower._vein.part('egg')[0]
+        assert_that(egg.state(), is_('to_ripe'))
+        ReproducingRule().mate(egg, pollen)
+        assert_that(egg.state(), is_('fertilized'))
+        PlantPart.check_state = True
+        try:
+            tickn(10)
+        finally:
+            PlantPart.check_state = False
+        assert_that(egg.state(), is_('seeded'))
+
+    def test_state_follows_changes_between_ticks(self):
+        egg = Egg(self.flower._vein, self.flower._params)
+        assert_that(egg.state(), is_('to_ripe'))
+        egg.fertilized = True
+        assert_that(egg.state(), is_('fertilized'))
+
+    def test_stale_state_is_caught_in_check_mode(self):
+        egg = Egg(self.flower._vein, self.flower._params)
+        egg._fertilized = True
+        PlantPart.check_state = True
+        try:
+            self.assertRaises(AssertionError, egg.state)
+        finally:
+            PlantPart.check_state = False
+        egg.update_state()
+        assert_that(egg.state(), is_('fertilized'))
+
     def test_produced_seeds_will_live(self):
         self.flower.take_in_from_environment({'kledis': 21.0})
         tickn(10)
@@ -234,3 +184,178 @@ class FlowerTest(unittest.TestCase):
         assert_that(seed._vein.part('root'), is_([]))
         tickn(10)
         assert_that(seed._vein.part('root'), is_not([]), 'a new root is sprouted')
+
+
+class PartPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.pool = PartPool().attach(self.world)
+        self.params = Params.plant_parameters('flower', 'egg')
+
+    def test_removed_pollen_are_used_again(self):
+        flower = Flower(Vein(), self.params)
+        flower.take_in_from_environment({'kledis': 21.0})
+        tickn(10)
+        pollen = flower._vein.part('pollen')[0]
+        pollen_id = pollen.id
+        ReproducingRule().mate(flower._vein.part('egg')[0], pollen)
+        assert_that(len(self.pool), is_(1))
+        assert_that(pollen, is_not(is_in(flower.pollen_generation._generated)))
+        assert_that(flower.pollen_generation.maxed_out(), is_(True))
+        assert_that(pollen._vein, is_(None))
+        pollen.remove()
+        assert_that(len(self.pool), is_(1), 'removing twice does nothing')
+
+        other = Flower(Vein(), self.params)
+        other.take_in_from_environment({'kledis': 21.0})
+        tickn()
+        assert_that(len(self.pool), is_(0))
+        assert_that(other._vein.part('pollen'), is_([pollen]))
+        assert_that(pollen.destroyed, is_(False))
+        assert_that(pollen, is_in(self.world.entities))
+        assert_that(self.world.entities.get(pollen.id), is_(pollen))
+        assert_that(pollen.id, is_(pollen_id))
+        assert_that(flower._vein.has_part(pollen), is_(False))
+        assert_that(other.pollen_generation._generated, has_item(pollen))
+
+    def test_pooled_pollen_keep_pollinating(self):
+        Pollination(radius=1.0)
+        # fertilized eggs stay eggs
+        egg = {'growth': dict(Params.egg['growth'], fertilized={'growth_volume': 0.0})}
+        params = Params.plant_parameters('flower', egg=egg)
+        flowers = []
+        for i in range(3):
+            flower = Flower(Vein(), params)
+            flower.location = (0.0, 0.0)
+            flower.take_in_from_environment({'kledis': 21.0})
+            flowers.append(flower)
+            tickn(12)
+        pollen = []
+        for flower in flowers:
+            assert_that(flower._vein.part('egg')[0].fertilized, is_(True))
+            pollen.extend(flower._vein.part('pollen'))
+            # a flower only knows the pollen of its own plant
+            assert_that(flower.pollen_generation._generated, is_(flower._vein.part('pollen')))
+        assert_that(pollen, has_length(27))
+        assert_that(set(p.id for p in pollen), has_length(27))
+        # pooled pollen keep the id they were first given
+        assert_that(min(p.id for p in flowers[2]._vein.part('pollen')), less_than(flowers[2].id))
+
+    def test_not_used_again_in_the_tick_it_was_removed(self):
+        pollen = Pollen(Vein(), self.params)
+        self.world.tick_in_progress = True
+        try:
+            pollen.remove()
+            assert_that(self.pool.obtain(Pollen, Vein(), self.params), is_(None))
+        finally:
+            self.world.tick_in_progress = False
+
+
+class PollinationTest(unittest.TestCase):
+    def setUp(self):
+        World.reset()
+
+    def flower_at(self, location, **replaced):
+        flower = Flower(Vein(), Params.plant_parameters('seed', 'root', 'stem', 'flower', 'egg', **replaced))
+        flower.location = location
+        flower.take_in_from_environment({'kledis': 21.0})
+        return flower
+
+    def test_pollen_near_eggs_fertilize_them(self):
+        Pollination(radius=1.0)
+        flower = self.flower_at((0.0, 0.0))
+        far_flower = self.flower_at((100.0, 100.0))
+        tickn(10)
+        assert_that(flower._vein.part('egg')[0].fertilized, is_(True))
+        assert_that(flower._vein.part('pollen'), has_length(9))
+        assert_that(far_flower._vein.part('egg')[0].fertilized, is_(True))
+
+    def test_floating_pollen_reach_other_flowers(self):
+        Pollination(radius=1.0)
+        pollen = {'drift': (10.0, 0.0)}
+        flower = self.flower_at((0.0, 0.0), pollen=pollen)
+        flower_without_pollen = dict(Params.flower, generation={
+            'pollen': dict(Params.flower['generation']['pollen'], max_count=0),
+            'egg': Params.flower['generation']['egg'],
+        })
+        other = self.flower_at((50.0, 0.0), pollen=pollen, flower=flower_without_pollen)
+        other_egg = None
+        for i in range(20):
+            tickn()
+            if other._vein.part('egg') and not other_egg:
+                other_egg = other._vein.part('egg')[0]
+        assert_that(other._vein.part('pollen'), is_([]))
+        assert_that(other_egg.fertilized, is_(True), 'fertilized by floating pollen')
+
+    def test_parts_placed_late_are_pollinated(self):
+        pollination = Pollination(radius=1.0)
+        flower = self.flower_at(None)
+        tickn(10)
+        egg = flower._vein.part('egg')[0]
+        assert_that(egg.fertilized, is_(False))
+        assert_that(pollination._unplaced, is_([]), 'parts without a location are not looked at')
+        for part in [egg] + flower._vein.part('pollen'):
+            part.location = (0.0, 0.0)
+        tickn()
+        assert_that(egg.fertilized, is_(True))
+
+
+class AdvanceTest(unittest.TestCase):
+    def build(self):
+        world = World.reset()
+        for i in range(3):
+            seed = dict(Params.seed, water_for_seed=5 + i * 7)
+            Seed({'kledis': 100.0 + i}, Params.plant_parameters('root', 'stem', 'leaves', seed=seed))
+        flower = Flower(Vein(), Params.plant_parameters('flower', 'egg'))
+        flower.take_in_from_environment({'kledis': 25.0})
+        return world
+
+    def assert_same_worlds(self, world, expected):
+        assert_that(world.ticks, is_(expected.ticks))
+        assert_that([(e.id, type(e).__name__) for e in world.entities], is_([(e.id, type(e).__name__) for e in expected.entities]))
+        for e, f in zip(world.entities, expected.entities):
+            for name in Materials.NAMES:
+                assert_that(e._vein.pooled()[name], close_to(f._vein.pooled()[name], 1e-9))
+            if hasattr(e, 'growth'):
+                assert_that(e.growth.volume, close_to(f.growth.volume, 1e-9))
+
+    def test_same_as_ticking(self):
+        expected = self.build()
+        for i in range(100):
+            expected.tick()
+
+        world = self.build()
+        ticked = []
+        tick = world.tick
+        def counting_tick():
+            ticked.append(world.ticks)
+            tick()
+        world.tick = counting_tick
+        world.advance(60)
+        world.advance(40)
+        self.assert_same_worlds(world, expected)
+        assert_that(len(ticked), less_than(60))
+
+    def test_listeners_hear_once_per_skipped_stretch(self):
+        world = self.build()
+        ended = []
+        class Listener(WorldListener):
+            def tick_ended(self, world):
+                ended.append(world.ticks)
+        world.listen(Listener())
+        world.advance(100)
+        assert_that(len(ended), less_than(100))
+        assert_that(ended, is_(sorted(set(ended))))
+        assert_that(ended[-1], is_(100))
+
+    def test_steps_when_an_entity_cannot_tell_its_flow(self):
+        world = self.build()
+        Pollination(radius=1.0)
+        ticked = []
+        tick = world.tick
+        def counting_tick():
+            ticked.append(world.ticks)
+            tick()
+        world.tick = counting_tick
+        world.advance(30)
+        assert_that(ticked, is_(range(30)))
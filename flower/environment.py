@@ -0,0 +1,240 @@
+# coding: utf-8
+
+import math
+import os
+
+import numpy
+
+from soil import *
+
+
+class EnvironmentalGrid(WorldEntity):
+    '''
+    A medium such as air divided into square cells.
+
+    Concentrations are kept in one contiguous array shaped
+    (len(Materials.NAMES), rows, columns).  Every tick materials diffuse
+    between neighbouring cells; nothing leaves through the edges.
+    A location (x, y) falls in the cell (y / cell_size, x / cell_size).
+
+    Set it as the world's air to let Leaves breathe from it:
+
+        world.air = EnvironmentalGrid((1000, 1000), initial={'mygen': 10.0})
+    '''
+    def __init__(self, shape, cell_size=1.0, diffusion=0.1, initial=None):
+        super(EnvironmentalGrid, self).__init__()
+        assert 0.0 <= diffusion <= 0.25, 'diffusion over 0.25 is unstable'
+        self.shape = tuple(shape)
+        self.cell_size = cell_size
+        self.diffusion = diffusion
+        self.concentrations = numpy.zeros((len(Materials.NAMES),) + self.shape)
+        self._flow = numpy.zeros_like(self.concentrations)
+        self._row_difference = numpy.zeros_like(self.concentrations[:, 1:, :])
+        self._column_difference = numpy.zeros_like(self.concentrations[:, :, 1:])
+        if initial:
+            for name in initial:
+                self.concentrations[Materials.INDEX[name]] = initial[name]
+
+    def tick(self):
+        self.diffuse()
+
+    def diffuse(self):
+        c = self.concentrations
+        flow = self._flow
+        flow.fill(0.0)
+        difference = numpy.subtract(c[:, 1:, :], c[:, :-1, :], out=self._row_difference)
+        flow[:, :-1, :] += difference
+        flow[:, 1:, :] -= difference
+        difference = numpy.subtract(c[:, :, 1:], c[:, :, :-1], out=self._column_difference)
+        flow[:, :, :-1] += difference
+        flow[:, :, 1:] -= difference
+        flow *= self.diffusion
+        c += flow
+
+    def cell_of(self, location):
+        x, y = location
+        row = min(max(int(y / self.cell_size), 0), self.shape[0] - 1)
+        column = min(max(int(x / self.cell_size), 0), self.shape[1] - 1)
+        return row, column
+
+    def materials_at(self, location):
+        row, column = self.cell_of(location)
+        return Materials.from_values(self.concentrations[:, row, column].tolist())
+
+    def take(self, location, materials, factor=1):
+        '''takes materials * factor from the cell, as much as there is'''
+        row, column = self.cell_of(location)
+        cell = self.concentrations[:, row, column]
+        requested = Materials(materials)
+        requested *= factor
+        taken = numpy.minimum(numpy.maximum(requested.values(), 0.0), cell)
+        cell -= taken
+        return Materials.from_values(taken.tolist())
+
+    def release(self, location, materials, factor=1):
+        row, column = self.cell_of(location)
+        released = Materials(materials)
+        released *= factor
+        self.concentrations[:, row, column] += released.values()
+
+
+# what a voxel of Ground holds: Materials.NAMES, where water is the
+# moisture soaked into the earth, then liquid water
+LIQUID = len(Materials.NAMES)
+CHANNELS = Materials.NAMES + ['liquid']
+
+
+class Ground(WorldEntity):
+    '''
+    The earth as a 3D field of cubic voxels, size (x, y) wide and depth
+    deep, divided into chunks of chunk voxels a side.
+
+    A chunk is allocated the first time something is taken from or
+    poured into it, filled with initial; the rest of the ground is
+    initial everywhere and costs nothing.  With a directory, every
+    chunk is a file there mapped into memory, so the ground can be
+    larger than RAM and outlives the process; chunks already in the
+    directory are opened as they are.
+
+    Voxel (i, j, k) is x in [i, i + 1), y in [j, j + 1) and depth in
+    [k, k + 1), times voxel_size.  Every tick liquid water soaks into
+    the earth of its voxel up to capacity and drain of what is left
+    runs down into the voxel below, in the chunks that have any.
+    Liquid thinner than MIN_LIQUID soaks in whatever the capacity, so
+    that chunks dry up.
+
+    Set it as the world's ground to let Roots draw from the voxels
+    their growth volume reaches down to:
+
+        world.ground = Ground((100.0, 100.0), 10.0, initial={'water': 1.0, 'heplon': 1.0})
+    '''
+    MIN_LIQUID = 1e-6
+
+    def __init__(self, size, depth, voxel_size=1.0, chunk=16, initial=None, capacity=1.0, soak=0.5, drain=0.5, directory=None):
+        super(Ground, self).__init__()
+        self.size = size
+        self.depth = depth
+        self.voxel_size = voxel_size
+        self.chunk = chunk
+        self.shape = (int(math.ceil(size[0] / voxel_size)), int(math.ceil(size[1] / voxel_size)), int(math.ceil(depth / voxel_size)))
+        self.capacity = capacity
+        self.soak = soak
+        self.drain = drain
+        self.directory = directory
+        self.initial = numpy.zeros(len(CHANNELS))
+        if initial:
+            for name in initial:
+                self.initial[CHANNELS.index(name)] = initial[name]
+        self._chunks = {}
+        # keys of the chunks holding liquid water
+        self._wet = set()
+
+    def plant(self, target, location):
+        target.location = location
+
+    def _chunk(self, key):
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            shape = (len(CHANNELS), self.chunk, self.chunk, self.chunk)
+            if self.directory is None:
+                chunk = numpy.empty(shape)
+                chunk[...] = self.initial.reshape((-1, 1, 1, 1))
+            else:
+                path = os.path.join(self.directory, '%d_%d_%d.chunk' % key)
+                if os.path.exists(path):
+                    chunk = numpy.memmap(path, dtype=numpy.float64, mode='r+', shape=shape)
+                else:
+                    chunk = numpy.memmap(path, dtype=numpy.float64, mode='w+', shape=shape)
+                    chunk[...] = self.initial.reshape((-1, 1, 1, 1))
+            self._chunks[key] = chunk
+            if chunk[LIQUID].any(): self._wet.add(key)
+        return chunk
+
+    def voxel_of(self, location, depth=0.0):
+        x, y = location
+        return (min(max(int(x / self.voxel_size), 0), self.shape[0] - 1),
+                min(max(int(y / self.voxel_size), 0), self.shape[1] - 1),
+                min(max(int(depth / self.voxel_size), 0), self.shape[2] - 1))
+
+    def _column(self, location, depth):
+        '''yields (chunk key, x, y, slice of depth) of the voxels from the surface down to depth'''
+        i, j, k = self.voxel_of(location, depth)
+        n = self.chunk
+        for top in xrange(0, k + 1, n):
+            yield (i // n, j // n, top // n), i % n, j % n, slice(0, min(k + 1 - top, n))
+
+    def materials_at(self, location, depth=0.0):
+        i, j, k = self.voxel_of(location, depth)
+        n = self.chunk
+        chunk = self._chunks.get((i // n, j // n, k // n))
+        values = self.initial if chunk is None else chunk[:, i % n, j % n, k % n]
+        return Materials.from_values(values[:LIQUID].tolist())
+
+    def liquid_at(self, location, depth=0.0):
+        i, j, k = self.voxel_of(location, depth)
+        n = self.chunk
+        chunk = self._chunks.get((i // n, j // n, k // n))
+        return float(self.initial[LIQUID] if chunk is None else chunk[LIQUID, i % n, j % n, k % n])
+
+    def pour(self, location, liquid=0.0, materials=None, depth=0.0):
+        '''puts liquid water and materials into the voxel at location and depth'''
+        i, j, k = self.voxel_of(location, depth)
+        n = self.chunk
+        key = (i // n, j // n, k // n)
+        voxel = self._chunk(key)[:, i % n, j % n, k % n]
+        if materials: voxel[:LIQUID] += Materials(materials).values()
+        if liquid:
+            voxel[LIQUID] += liquid
+            self._wet.add(key)
+
+    def take(self, location, depth, materials, factor=1):
+        '''
+        takes materials * factor from the voxels under location down to
+        depth, evenly as a share of what each holds, as much as there is
+        '''
+        requested = numpy.maximum(Materials(materials).values(), 0.0) * factor
+        column = [(self._chunk(key), x, y, z) for key, x, y, z in self._column(location, depth)]
+        available = sum(chunk[:LIQUID, x, y, z].sum(axis=1) for chunk, x, y, z in column)
+        share = numpy.where(available > 0, numpy.minimum(requested / numpy.where(available > 0, available, 1.0), 1.0), 0.0)
+        for chunk, x, y, z in column:
+            chunk[:LIQUID, x, y, z] *= (1.0 - share)[:, numpy.newaxis]
+        return Materials.from_values((available * share).tolist())
+
+    def tick(self):
+        self.seep()
+
+    def seep(self):
+        '''soaks and drains the liquid water of the wet chunks'''
+        n = self.chunk
+        drains = []
+        for key in sorted(self._wet):
+            chunk = self._chunks[key]
+            liquid = chunk[LIQUID]
+            water = chunk[Materials.INDEX['water']]
+            soaked = numpy.minimum(liquid * self.soak, numpy.maximum(self.capacity - water, 0.0))
+            water += soaked
+            liquid -= soaked
+            drained = liquid * self.drain
+            # the bottom of the ground holds what reaches it
+            bottom = self.shape[2] - key[2] * n
+            if bottom <= n: drained[:, :, bottom - 1:] = 0.0
+            liquid -= drained
+            liquid[:, :, 1:] += drained[:, :, :-1]
+            drains.append((key, drained[:, :, -1]))
+        for key, drained in drains:
+            if not drained.any(): continue
+            below = (key[0], key[1], key[2] + 1)
+            self._chunk(below)[LIQUID, :, :, 0] += drained
+            self._wet.add(below)
+        for key in list(self._wet):
+            chunk = self._chunks[key]
+            liquid = chunk[LIQUID]
+            thin = liquid < Ground.MIN_LIQUID
+            chunk[Materials.INDEX['water']][thin] += liquid[thin]
+            liquid[thin] = 0.0
+            if not liquid.any():
+                self._wet.discard(key)
+
+    def flush(self):
+        for chunk in self._chunks.values():
+            if isinstance(chunk, numpy.memmap): chunk.flush()
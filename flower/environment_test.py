@@ -0,0 +1,132 @@
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+from environment import *
+
+
+class EnvironmentalGridTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+
+    def test_diffusion_spreads_and_conserves(self):
+        grid = EnvironmentalGrid((5, 5), diffusion=0.2)
+        grid.release((2.5, 2.5), {'mygen': 100.0})
+        tickn()
+        assert_that(grid.materials_at((2.5, 2.5))['mygen'], close_to(20.0, 0.0001))
+        assert_that(grid.materials_at((3.5, 2.5))['mygen'], close_to(20.0, 0.0001))
+        assert_that(grid.materials_at((3.5, 3.5))['mygen'], close_to(0.0, 0.0001))
+        tickn(50)
+        assert_that(grid.concentrations[Materials.INDEX['mygen']].sum(), close_to(100.0, 0.0001))
+        assert_that(grid.materials_at((0.0, 0.0))['mygen'], greater_than(0.0))
+
+    def test_uniform_air_stays_uniform(self):
+        grid = EnvironmentalGrid((3, 4), initial={'mygen': 1.0})
+        tickn(3)
+        assert_that(grid.concentrations.max(), close_to(1.0, 0.0001))
+        assert_that(grid.concentrations[Materials.INDEX['mygen']].min(), close_to(1.0, 0.0001))
+
+    def test_take_as_much_as_there_is(self):
+        grid = EnvironmentalGrid((10, 10), cell_size=10.0, initial={'mygen': 1.0})
+        taken = grid.take((55.0, 25.0), {'mygen': 0.4, 'water': 1.0}, 2)
+        assert_that(taken, equal_to(Materials({'mygen': 0.8})))
+        taken = grid.take((55.0, 25.0), {'mygen': 0.4}, 2)
+        assert_that(taken['mygen'], close_to(0.2, 0.0001))
+        assert_that(grid.materials_at((59.0, 29.0))['mygen'], close_to(0.0, 0.0001))
+        assert_that(grid.materials_at((45.0, 25.0))['mygen'], close_to(1.0, 0.0001))
+
+    def test_leaves_breathe_from_their_cell(self):
+        self.world.air = EnvironmentalGrid((10, 10), diffusion=0.0, initial={'mygen': 1.0})
+        leaves = Leaves(Vein(), Params.plant_parameters('leaves'))
+        leaves.location = (3.0, 4.0)
+        leaves.take_in_from_environment(Materials({'kledis': 100, 'mygen': 100.0, 'heplon': 100.0}))
+        tickn(20)
+        assert_that(self.world.air.materials_at((3.0, 4.0))['mygen'], close_to(0.0, 0.0001))
+        assert_that(self.world.air.materials_at((4.0, 4.0))['mygen'], close_to(1.0, 0.0001))
+        assert_that(leaves._vein.pooled()['mygen'], less_than(100.0 - 0.0001))
+
+    def test_leaves_synthesize_only_what_depleted_air_gives(self):
+        self.world.air = EnvironmentalGrid((10, 10), diffusion=0.0, initial={'mygen': 0.5})
+        leaves = Leaves(Vein(), Params.plant_parameters('leaves'))
+        leaves.location = (3.0, 4.0)
+        leaves.take_in_from_environment(Materials({'mygen': 1.0, 'heplon': 100.0}))
+        tickn(40)
+        pooled = leaves._vein.pooled()
+        assert_that(pooled['mygen'], close_to(0.0, 0.0001))
+        assert_that(pooled['kledis'], close_to(1.5, 0.0001))
+        assert_that(pooled['heplon'], close_to(98.5, 0.0001))
+
+    def test_generated_parts_share_location(self):
+        seed = Seed({}, Params.plant_parameters('seed', 'root'))
+        Ground(size=(1000.0, 1000.0), depth=10.0).plant(seed, location=(1.0, 2.0))
+        seed.root()
+        assert_that(seed._root.location, is_((1.0, 2.0)))
+
+
+class GroundTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+
+    def test_chunks_are_allocated_where_used(self):
+        ground = Ground((1000.0, 1000.0), 100.0, chunk=8, initial={'water': 1.0})
+        assert_that(ground.materials_at((500.0, 500.0), 50.0)['water'], is_(1.0))
+        ground.pour((500.0, 500.0), liquid=2.0)
+        assert_that(ground._chunks.keys(), is_([(62, 62, 0)]))
+
+    def test_water_soaks_and_runs_down_to_the_bottom(self):
+        ground = Ground((4.0, 4.0), 10.0, chunk=4, capacity=1.0)
+        ground.pour((1.0, 1.0), liquid=5.0)
+        tickn()
+        assert_that(ground.materials_at((1.0, 1.0))['water'], close_to(1.0, 0.0001))
+        assert_that(ground.liquid_at((1.0, 1.0), 1.0), close_to(2.0, 0.0001))
+        tickn(100)
+        column = [ground.materials_at((1.0, 1.0), z)['water'] + ground.liquid_at((1.0, 1.0), z) for z in range(10)]
+        assert_that(sum(column), close_to(5.0, 0.0001))
+        assert_that(min(column[:4]), close_to(1.0, 0.0001))
+        assert_that(column[4], less_than(1.0))
+        assert_that(sorted(ground._chunks.keys()), is_([(0, 0, 0), (0, 0, 1), (0, 0, 2)]))
+        assert_that(ground._wet, is_(set()))
+        assert_that(ground.materials_at((2.0, 1.0))['water'], is_(0.0))
+
+    def test_take_as_a_share_of_the_column(self):
+        ground = Ground((4.0, 4.0), 10.0, chunk=2, initial={'heplon': 1.0})
+        ground.pour((0.0, 0.0), materials={'heplon': 2.0}, depth=3.0)
+        taken = ground.take((0.0, 0.0), 3.5, {'heplon': 3.0, 'mygen': 1.0})
+        assert_that(taken['heplon'], close_to(3.0, 0.0001))
+        assert_that(taken['mygen'], is_(0.0))
+        assert_that(ground.materials_at((0.0, 0.0), 0.0)['heplon'], close_to(0.5, 0.0001))
+        assert_that(ground.materials_at((0.0, 0.0), 3.0)['heplon'], close_to(1.5, 0.0001))
+        assert_that(ground.materials_at((0.0, 0.0), 4.0)['heplon'], is_(1.0))
+        taken = ground.take((0.0, 0.0), 3.5, {'heplon': 100.0})
+        assert_that(taken['heplon'], close_to(3.0, 0.0001))
+
+    def test_chunks_in_files(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            ground = Ground((100.0, 100.0), 10.0, initial={'water': 1.0}, directory=directory)
+            ground.pour((10.0, 10.0), materials={'heplon': 3.0})
+            ground.flush()
+            again = Ground((100.0, 100.0), 10.0, initial={'water': 1.0}, directory=directory)
+            again.pour((90.0, 90.0), liquid=0.0)
+            assert_that(again.materials_at((10.0, 10.0))['heplon'], is_(0.0), 'not opened yet')
+            again.take((10.0, 10.0), 0.0, {})
+            assert_that(again.materials_at((10.0, 10.0))['heplon'], is_(3.0))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_roots_draw_from_the_voxels_they_reach(self):
+        self.world.ground = Ground((10.0, 10.0), 10.0, initial={'water': 1.0, 'heplon': 1.0})
+        root = Root(Vein(), Params.plant_parameters('root'))
+        root.location = (5.0, 5.0)
+        root.take_in_from_environment({'kledis': 100.0})
+        tickn(15)
+        assert_that(root.growth.volume, close_to(1.5, 0.0001))
+        assert_that(self.world.ground.materials_at((5.0, 5.0), 0.0)['water'], less_than(1.0))
+        assert_that(self.world.ground.materials_at((5.0, 5.0), 1.0)['water'], less_than(1.0))
+        assert_that(self.world.ground.materials_at((5.0, 5.0), 2.0)['water'], is_(1.0))
+        assert_that(self.world.ground.materials_at((6.0, 5.0), 0.0)['water'], is_(1.0))
+        assert_that(root._vein.pooled()['water'], close_to(2.0 - self.world.ground.materials_at((5.0, 5.0), 0.0)['water'] - self.world.ground.materials_at((5.0, 5.0), 1.0)['water'], 0.0001))
@@ -33,30 +33,113 @@ class EventDispatcher(object):
     because otherwise there will be no indications that they are
     event handlers.
 
+    Handlers are looked up once per observer class and bound when
+    they are triggered, so making a dispatcher costs the same however
+    large the observer is.
+
+    While EventDispatcher.queue is a list, triggered events are queued
+    instead of handled, and dispatch_queued() handles them later.
+    >>> EventDispatcher.queue = []
+    >>> events.trigger(events.ON_CLICK)
+    >>> EventDispatcher.dispatch_queued()
+    Observer.on_click!
+    >>> EventDispatcher.queue = None
+
+    An observer that belongs to a World uses the world's event_queue
+    and event_monitor instead, so worlds do not see each other's
+    events.  World.tick() queues events there when the world defers
+    events.
+
     '''
+    __slots__ = ('_names', '_observer', '_handlers')
+    # observer class -> {event name: handler name}
+    _handler_tables = {}
+    # event names -> set of event names, checked once
+    _event_sets = {}
+
     def __init__(self, event_names, observer=None):
-        assert all([n == n.upper() for n in event_names])
-        self.events = dict((s, None) for s in event_names)
-        for e in self.events:
-            setattr(self, e, e)
+        self._names = EventDispatcher._event_set(event_names)
+        self._observer = None
+        self._handlers = {}
         if observer:
             self.observer = observer
 
-    def _set_handler(self, event, handler):
-        self.events[event] = handler
+    @staticmethod
+    def _event_set(event_names):
+        key = tuple(event_names)
+        names = EventDispatcher._event_sets.get(key)
+        if names is None:
+            assert all([n == n.upper() for n in event_names])
+            names = frozenset(event_names)
+            EventDispatcher._event_sets[key] = names
+        return names
+
+    def __getattr__(self, name):
+        # event name constants
+        if name.startswith('_') or name not in self._names:
+            raise AttributeError(name)
+        return name
+
+    # an object with call_handler(event, handler) that calls handlers for us, e.g. to time them
+    monitor = None
+    # a list of (event, handler) to be handled later, or None to handle them at once
+    queue = None
 
     def trigger(self, event):
-        if self.events[event]:
-            self.events[event]()
+        if event not in self._names: raise KeyError(event)
+        handler_name = self._handlers.get(event)
+        if not handler_name: return
+        observer = self._observer
+        handler = getattr(observer, handler_name)
+        world = getattr(observer, 'world', None)
+        if world is None:
+            queue, monitor = EventDispatcher.queue, EventDispatcher.monitor
+        else:
+            queue, monitor = world.event_queue, world.event_monitor
+        if queue is not None:
+            queue.append((event, handler))
+        else:
+            EventDispatcher._call(event, handler, monitor)
+
+    @staticmethod
+    def _call(event, handler, monitor):
+        if monitor:
+            monitor.call_handler(event, handler)
+        else:
+            handler()
+
+    @staticmethod
+    def dispatch_queued(queue=None, monitor=None):
+        '''
+        handles queued events, including ones triggered by their
+        handlers; EventDispatcher.queue and monitor by default
+        '''
+        if queue is None:
+            queue, monitor = EventDispatcher.queue, EventDispatcher.monitor
+        i = 0
+        while i < len(queue):
+            event, handler = queue[i]
+            EventDispatcher._call(event, handler, monitor)
+            i += 1
+        del queue[:]
 
     def set_observer(self, target):
-        for attr in dir(target):
-            if hasattr(getattr(target, attr), '_EventDispatcher__marked_as_event_handler'):
-                self._set_handler(attr.upper(), getattr(target, attr))
+        self._observer = target
+        self._handlers = EventDispatcher._handler_table(type(target))
     observer = property(None, set_observer)
 
+    @staticmethod
+    def _handler_table(cls):
+        table = EventDispatcher._handler_tables.get(cls)
+        if table is None:
+            table = {}
+            for attr in dir(cls):
+                if hasattr(getattr(cls, attr), '_EventDispatcher__marked_as_event_handler'):
+                    table[attr.upper()] = attr
+            EventDispatcher._handler_tables[cls] = table
+        return table
+
     @staticmethod
     def event_handler(func):
         func.__marked_as_event_handler = True
         return func
-
@@ -0,0 +1,182 @@
+# coding: utf-8
+
+import numpy
+
+from soil import *
+
+
+class GrowthEngine(WorldEntity, WorldListener):
+    '''
+    Grows every Growth of one part type in a single batched step.
+
+    Volumes, the row of the current parameters and the vein of each
+    Growth are kept in arrays and advanced together when the engine
+    ticks, instead of one Growth.grow() call per part.
+    Install an engine in the current World before creating the parts:
+
+        GrowthEngine.install(Root)
+
+    Growths are grown at the engine's position in the World's tick
+    order rather than inside their part's tick().  Materials fixed by
+    growth are accumulated in the engine and moved to each part's
+    _fixed_materials before its ON_MAXED fires, or by flush().
+
+    The parameter row of a Growth whose parameters depend on its part's
+    state is looked up again only when the state changes.  Removing a
+    part detaches its Growth, which then stops growing.
+    '''
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, part_type):
+        super(GrowthEngine, self).__init__()
+        self.part_type = part_type
+        self._growths = []
+        self._volume = numpy.zeros(GrowthEngine.INITIAL_CAPACITY)
+        self._params_index = numpy.zeros(GrowthEngine.INITIAL_CAPACITY, dtype=numpy.intp)
+        self._vein_index = numpy.zeros(GrowthEngine.INITIAL_CAPACITY, dtype=numpy.intp)
+        self._fixed = numpy.zeros((GrowthEngine.INITIAL_CAPACITY, len(Materials.NAMES)))
+        self._veins = []
+        self._vein_positions = {}
+        self._rows = {}
+        self._row_params = []
+        self._growth_volume = numpy.zeros(0)
+        self._max_volume = numpy.zeros(0)
+        self._consumption = numpy.zeros((0, len(Materials.NAMES)))
+        # counts detaches, which move growths to other slots
+        self._moved = 0
+
+    def __getstate__(self):
+        # indexes are keyed by id(), rebuild them on restore
+        state = super(GrowthEngine, self).__getstate__()
+        del state['_vein_positions']
+        del state['_rows']
+        return state
+
+    def __setstate__(self, state):
+        super(GrowthEngine, self).__setstate__(state)
+        self._vein_positions = dict((id(vein), position) for position, vein in enumerate(self._veins))
+        self._rows = dict((id(params), row) for row, params in enumerate(self._row_params))
+
+    @staticmethod
+    def install(part_type):
+        engine = GrowthEngine(part_type)
+        engine.world.growth_engines[part_type] = engine
+        engine.world.listen(engine)
+        return engine
+
+    def attach(self, growth):
+        slot = len(self._growths)
+        if slot == len(self._volume):
+            self._grow_capacity()
+        self._growths.append(growth)
+        growth._engine = self
+        growth._slot = slot
+        self._volume[slot] = growth._volume
+        self._vein_index[slot] = self._vein_position(growth._target._vein)
+        self._params_index[slot] = self._row(growth.current_params())
+
+    def detach(self, growth):
+        '''stops growing growth and hands its volume and fixed materials back to it'''
+        slot = growth._slot
+        self._flush_slot(slot)
+        growth._volume = float(self._volume[slot])
+        growth._engine = None
+        # the last growth takes over the slot
+        last = len(self._growths) - 1
+        if slot != last:
+            moved = self._growths[last]
+            self._growths[slot] = moved
+            moved._slot = slot
+            self._volume[slot] = self._volume[last]
+            self._params_index[slot] = self._params_index[last]
+            self._vein_index[slot] = self._vein_index[last]
+            self._fixed[slot] = self._fixed[last]
+            self._fixed[last] = 0.0
+        self._growths.pop()
+        self._moved += 1
+
+    def state_changed(self, part, previous):
+        growth = getattr(part, 'growth', None)
+        if growth is not None and growth._engine is self:
+            self._params_index[growth._slot] = self._row(growth.current_params())
+
+    def volume_of(self, growth):
+        return float(self._volume[growth._slot])
+
+    def set_volume_of(self, growth, volume):
+        self._volume[growth._slot] = volume
+
+    def tick(self):
+        self.step()
+
+    def step(self):
+        n = len(self._growths)
+        if not n: return
+
+        rows = self._params_index[:n]
+        growth_volume = self._growth_volume[rows]
+        max_volume = self._max_volume[rows]
+        volume = self._volume[:n]
+        growing = (growth_volume != 0.0) & (volume < max_volume)
+        if not growing.any(): return
+
+        consumption = self._consumption[rows] * growing[:, numpy.newaxis]
+        self._consume(consumption)
+        self._fixed[:n] += consumption
+
+        volume += growth_volume * growing
+        maxed = growing & (volume >= max_volume)
+        volume[maxed] = max_volume[maxed]
+        for slot in numpy.flatnonzero(maxed):
+            growth = self._growths[slot]
+            self._flush_slot(slot)
+            growth.trigger_maxed()
+
+    def flush(self):
+        '''moves fixed materials accumulated in the engine to the parts'''
+        for slot in numpy.flatnonzero(self._fixed[:len(self._growths)].any(axis=1)):
+            self._flush_slot(slot)
+
+    def _flush_slot(self, slot):
+        self._growths[slot]._target.fix_materials(Materials.from_values(self._fixed[slot]))
+        self._fixed[slot] = 0.0
+
+    def _consume(self, consumption):
+        n = len(self._growths)
+        totals = numpy.zeros((len(self._veins), len(Materials.NAMES)))
+        numpy.add.at(totals, self._vein_index[:n], consumption)
+        for position in numpy.flatnonzero(totals.any(axis=1)):
+            vein = self._veins[position]
+            total = Materials.from_values(totals[position])
+            assert vein.pooled() >= total
+            vein.pooled().subtract(total)
+
+    def _row(self, params):
+        row = self._rows.get(id(params))
+        if row is not None: return row
+
+        row = len(self._row_params)
+        self._rows[id(params)] = row
+        self._row_params.append(params)
+        self._growth_volume = numpy.append(self._growth_volume, params.growth_volume or 0.0)
+        self._max_volume = numpy.append(self._max_volume, params.max_volume if params.has_max_volume else numpy.inf)
+        consumption = Materials(params.consumption_for_growth).values() if params.has_consumption_for_growth else [0.0] * len(Materials.NAMES)
+        self._consumption = numpy.vstack([self._consumption, consumption])
+        return row
+
+    def _vein_position(self, vein):
+        position = self._vein_positions.get(id(vein))
+        if position is None:
+            position = len(self._veins)
+            self._vein_positions[id(vein)] = position
+            self._veins.append(vein)
+        return position
+
+    def _grow_capacity(self):
+        capacity = len(self._volume) * 2
+        self._volume = numpy.resize(self._volume, capacity)
+        self._params_index = numpy.resize(self._params_index, capacity)
+        self._vein_index = numpy.resize(self._vein_index, capacity)
+        fixed = numpy.zeros((capacity, len(Materials.NAMES)))
+        fixed[:len(self._fixed)] = self._fixed
+        self._fixed = fixed
@@ -0,0 +1,84 @@
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from growth_engine import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+
+
+class GrowthEngineTest(unittest.TestCase):
+    def setUp(self):
+        World.reset()
+        self.params = Params.plant_parameters()
+
+    def grow_stems(self, count):
+        stems = []
+        for i in range(count):
+            stem = Stem(Vein(), self.params)
+            stem.take_in_from_environment({'kledis': 20.0 + i, 'heplon': 100.0})
+            stems.append(stem)
+        return stems
+
+    def test_engine_grows_like_growth(self):
+        expected = self.grow_stems(3)
+        tickn(3)
+
+        World.reset()
+        GrowthEngine.install(Stem)
+        stems = self.grow_stems(3)
+        tickn(3)
+
+        for stem, expected_stem in zip(stems, expected):
+            assert_that(stem.growth.volume, close_to(expected_stem.growth.volume, 0.0001))
+            assert_that(stem._vein.pooled(), equal_to(expected_stem._vein.pooled()))
+
+    def test_on_maxed_fires_for_maxed_parts_only(self):
+        GrowthEngine.install(Stem)
+        stem = self.grow_stems(1)[0]
+        late_stem = Stem(Vein(), self.params)
+        late_stem.take_in_from_environment({'kledis': 30.0, 'heplon': 100.0})
+        late_stem.growth.volume = -0.2
+        tickn(5)
+        assert_that(stem.growth.volume, equal_to(0.5))
+        assert_that(stem, has_property('_leaves', is_not(None)))
+        assert_that(late_stem._leaves, is_(None))
+        tickn(2)
+        assert_that(late_stem._leaves, is_not(None))
+        assert_that(stem._vein.part('leaves'), has_length(1))
+
+    def test_fixed_materials_are_flushed(self):
+        engine = GrowthEngine.install(Stem)
+        stem = self.grow_stems(1)[0]
+        tickn(2)
+        engine.flush()
+        assert_that(stem._fixed_materials['kledis'], close_to(6.0, 0.0001))
+        tickn(3)
+        assert_that(stem._fixed_materials['kledis'], close_to(15.0, 0.0001))
+
+    def test_state_dependent_params(self):
+        GrowthEngine.install(Egg)
+        egg = Egg(Vein(), self.params)
+        egg.take_in_from_environment({'kledis': 20.0})
+        tickn(10)
+        assert_that(egg.growth.volume, equal_to(5.0))
+        assert_that(egg.is_ripen, is_(True))
+        egg.fertilize()
+        tickn(10)
+        assert_that(egg.growth.volume, equal_to(10.0))
+        assert_that(egg.seed, is_not(None))
+        assert_that(egg.seed._vein.pooled()['kledis'], close_to(10.0, 0.0001))
+
+    def test_removed_parts_stop_growing(self):
+        engine = GrowthEngine.install(Stem)
+        vein = Vein()
+        stems = [Stem(vein, self.params) for i in range(3)]
+        vein.pour_in({'kledis': 100.0}, stems[0])
+        tickn(1)
+        stems[0].remove()
+        tickn(2)
+        assert_that(stems[0].growth.volume, close_to(0.1, 0.0001))
+        assert_that(stems[0]._fixed_materials['kledis'], close_to(3.0, 0.0001))
+        assert_that([s.growth.volume for s in stems[1:]], only_contains(close_to(0.3, 0.0001)))
+        assert_that(vein.pooled()['kledis'], close_to(100.0 - 3.0 * 7, 0.0001))
+        assert_that(engine._growths, is_([stems[2].growth, stems[1].growth]))
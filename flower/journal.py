@@ -0,0 +1,209 @@
+# coding: utf-8
+'''
+An append-only journal of what happens in a World.
+
+    journal = Journal('run.journal').attach(world)
+    ...
+    journal.close()
+
+    for entry in read('run.journal'):
+        print entry.tick, entry.event, entry.subject, entry.object
+
+Every entry is a fixed size binary record of the tick, the event and
+two numbers: entity ids, or the class for ADDED.  Class names are
+written once, the first time an entity of the class is added.  A
+journal holds one run; opening it again starts it over.
+
+Replay does not re-run the simulation.  It rebuilds only the lifecycle
+skeleton the entries tell: which entities lived when, what generated
+what, how often parts maxed out and which eggs were fertilized.  There
+are no materials, volumes or locations in a journal.  For the World
+itself, let a persistence Checkpointer of the same world write its
+checkpoints into the journal too; restore() then loads the last one
+taken at or before a tick and ticks on from there:
+
+    world = restore('run.journal', checkpointer.paths, 1200)
+'''
+
+import collections
+import itertools
+import struct
+
+import persistence
+
+ADDED = 1
+REMOVED = 2
+MAXED = 3
+GENERATED = 4
+MATED = 5
+CLASS = 6
+CHECKPOINT = 7
+
+NAMES = {
+    ADDED: 'ADDED',
+    REMOVED: 'REMOVED',
+    MAXED: 'MAXED',
+    GENERATED: 'GENERATED',
+    MATED: 'MATED',
+    CHECKPOINT: 'CHECKPOINT',
+}
+
+# tick, event, subject, object
+RECORD = struct.Struct('<IBQQ')
+
+Entry = collections.namedtuple('Entry', 'tick event subject object')
+
+
+class Journal(object):
+    '''
+    Buffers entries and appends them to path.  attach() it to a world.
+
+    ADDED: subject is the entity, object its class name when read
+    REMOVED: subject is the entity
+    MAXED: subject is the part whose Growth reached max_volume
+    GENERATED: subject generated object, e.g. a Flower and its Pollen
+    MATED: subject is the egg and object the pollen
+    CHECKPOINT: subject is the number of a Checkpointer's snapshot file
+    '''
+    def __init__(self, path, buffer_size=1 << 16):
+        self._file = open(path, 'wb', buffer_size)
+        self._classes = {}
+        self.world = None
+
+    def _write(self, event, subject, obj=0):
+        self._file.write(RECORD.pack(self.world.ticks, event, subject, obj))
+
+    def attach(self, world):
+        self.world = world
+        world.journal = self
+        return self
+
+    def added(self, entity):
+        cls = type(entity)
+        code = self._classes.get(cls)
+        if code is None:
+            code = len(self._classes)
+            self._classes[cls] = code
+            name = cls.__name__
+            self._file.write(RECORD.pack(self.world.ticks, CLASS, code, len(name)))
+            self._file.write(name)
+        self._write(ADDED, entity.id, code)
+
+    def removed(self, entity):
+        self._write(REMOVED, entity.id)
+
+    def maxed(self, part):
+        self._write(MAXED, part.id)
+
+    def generated(self, parent, part):
+        self._write(GENERATED, parent.id, part.id)
+
+    def mated(self, egg, pollen):
+        self._write(MATED, egg.id, pollen.id)
+
+    def checkpointed(self, number):
+        self._write(CHECKPOINT, number)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read(path, buffer_size=1 << 16):
+    '''yields Entries; ADDED entries carry the class name as object'''
+    classes = {}
+    with open(path, 'rb', buffer_size) as f:
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size: return
+            tick, event, subject, obj = RECORD.unpack(record)
+            if event == CLASS:
+                classes[subject] = f.read(obj)
+                continue
+            if event == ADDED:
+                obj = classes[obj]
+            yield Entry(tick, event, subject, obj)
+
+
+class ReplayedEntity(object):
+    def __init__(self, entity_id, class_name, tick):
+        self.id = entity_id
+        self.class_name = class_name
+        self.added_at = tick
+        self.removed_at = None
+        self.parent = None
+        self.children = []
+        self.maxed = 0
+        self.fertilized = False
+
+    def alive(self):
+        return self.removed_at is None
+
+
+class Replay(object):
+    '''
+    The shape of a world rebuilt from its journal up to a tick: which
+    entities exist, what generated what, how many times each part
+    maxed out and which eggs are fertilized.  Material amounts are not
+    journaled; restore a persistence snapshot for those.
+    '''
+    def __init__(self, entries, until=None):
+        self.entities = {}
+        self.ticks = 0
+        # the number of the last checkpoint taken
+        self.checkpoint = None
+        self._parents = {}
+        for entry in entries:
+            if until is not None and entry.tick >= until: break
+            self.apply(entry)
+
+    def apply(self, entry):
+        self.ticks = entry.tick
+        if entry.event == ADDED:
+            entity = ReplayedEntity(entry.subject, entry.object, entry.tick)
+            # parts generated during a tick are added after it
+            entity.parent = self._parents.pop(entry.subject, None)
+            self.entities[entry.subject] = entity
+        elif entry.event == REMOVED:
+            self.entities[entry.subject].removed_at = entry.tick
+        elif entry.event == MAXED:
+            self.entities[entry.subject].maxed += 1
+        elif entry.event == GENERATED:
+            self.entities[entry.subject].children.append(entry.object)
+            if entry.object in self.entities:
+                self.entities[entry.object].parent = entry.subject
+            else:
+                self._parents[entry.object] = entry.subject
+        elif entry.event == MATED:
+            self.entities[entry.subject].fertilized = True
+        elif entry.event == CHECKPOINT:
+            self.checkpoint = entry.subject
+
+    def count(self, class_name):
+        return len([e for e in self.entities.values() if e.class_name == class_name and e.alive()])
+
+
+def restore(path, checkpoint_paths, tick):
+    '''
+    the World as it was after tick ticks: loads the last checkpoint the
+    journal at path tells was taken by then and ticks it on to tick
+    '''
+    checkpoint = None
+    for entry in read(path):
+        if entry.tick > tick: break
+        if entry.event == CHECKPOINT: checkpoint = entry.subject
+    assert checkpoint is not None, 'no checkpoint was taken by tick %d' % tick
+    world = persistence.load(*checkpoint_paths[:checkpoint + 1])
+    while world.ticks < tick:
+        world.tick()
+    return world
+
+
+def first_divergence(entries, other_entries):
+    '''the first pair of entries that differ, or None if both are the same'''
+    for entry, other in itertools.izip_longest(entries, other_entries):
+        if entry != other:
+            return entry, other
+    return None
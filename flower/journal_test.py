@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from journal import *
+from persistence import Checkpointer
+from persistence_test import describe
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'run.journal')
+        self.params = Params.plant_parameters('seed', 'root', 'stem', 'flower', 'egg')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tick(self, n):
+        for i in range(n):
+            self.world.tick()
+
+    def run_flower(self, journal):
+        flower = Flower(Vein(), self.params)
+        flower.take_in_from_environment({'kledis': 21.0})
+        self.tick(10)
+        egg = flower._vein.part('egg')[0]
+        pollen = flower._vein.part('pollen')[0]
+        ReproducingRule().mate(egg, pollen)
+        self.tick(10)
+        journal.close()
+        return flower, egg, pollen
+
+    def test_journal_entries(self):
+        journal = Journal(self.path).attach(self.world)
+        flower, egg, pollen = self.run_flower(journal)
+        entries = list(read(self.path))
+        assert_that(entries[0], is_(Entry(0, ADDED, flower.id, 'Flower')))
+        assert_that(entries, has_item(Entry(0, GENERATED, flower.id, pollen.id)))
+        assert_that(entries, has_item(Entry(1, ADDED, pollen.id, 'Pollen')))
+        assert_that(entries, has_item(Entry(10, MATED, egg.id, pollen.id)))
+        assert_that(entries, has_item(Entry(10, REMOVED, pollen.id, 0)))
+        assert_that([e for e in entries if e.event == MAXED], is_([
+            Entry(5, MAXED, egg.id, 0),
+            Entry(14, MAXED, egg.id, 0),
+        ]))
+        assert_that(entries, has_item(Entry(14, GENERATED, egg.id, egg.seed.id)))
+
+    def test_replay(self):
+        journal = Journal(self.path).attach(self.world)
+        flower, egg, pollen = self.run_flower(journal)
+
+        replay = Replay(read(self.path))
+        assert_that(replay.count('Pollen'), is_(9))
+        assert_that(replay.count('Seed'), is_(1))
+        assert_that(replay.entities[egg.id].fertilized, is_(True))
+        assert_that(replay.entities[egg.id].maxed, is_(2))
+        assert_that(replay.entities[egg.id].parent, is_(flower.id))
+        assert_that(replay.entities[egg.seed.id].parent, is_(egg.id))
+
+        replay = Replay(read(self.path), until=5)
+        assert_that(replay.count('Pollen'), is_(4))
+        assert_that(replay.entities[egg.id].maxed, is_(0))
+        assert_that(egg.seed.id in replay.entities, is_(False))
+
+    def test_restore(self):
+        journal = Journal(self.path).attach(self.world)
+        checkpointer = Checkpointer(self.world, os.path.join(self.directory, 'run'))
+        flower = Flower(Vein(), self.params)
+        flower.take_in_from_environment({'kledis': 21.0})
+        described = {}
+        for i in range(20):
+            if i % 5 == 0: checkpointer.checkpoint()
+            self.tick(1)
+            described[self.world.ticks] = describe(self.world)
+        journal.close()
+
+        world = restore(self.path, checkpointer.paths, 12)
+        assert_that(world.ticks, is_(12))
+        assert_that(describe(world), equal_to(described[12]))
+        assert_that(Replay(read(self.path), until=12).checkpoint, is_(2))
+
+    def test_a_journal_holds_one_run(self):
+        Journal(self.path).attach(self.world)
+        self.run_flower(self.world.journal)
+        self.world = World.reset()
+        journal = Journal(self.path).attach(self.world)
+        Flower(Vein(), self.params)
+        journal.close()
+        assert_that(list(read(self.path)), has_length(1))
+
+    def test_first_divergence(self):
+        journal = Journal(self.path).attach(self.world)
+        self.run_flower(journal)
+        other_path = os.path.join(self.directory, 'other.journal')
+        self.world = World.reset()
+        self.params = Params.plant_parameters('flower', 'seed', egg={'growth': {
+            'to_ripe': Params.egg['growth']['to_ripe'],
+            'fertilized': dict(Params.egg['growth']['fertilized'], max_volume=9.0),
+            'seeded': Params.egg['growth']['seeded'],
+        }})
+        flower, egg, pollen = self.run_flower(Journal(other_path).attach(self.world))
+
+        assert_that(first_divergence(read(self.path), read(self.path)), is_(None))
+        entry, other = first_divergence(read(self.path), read(other_path))
+        assert_that(entry, is_(Entry(14, MAXED, egg.id, 0)))
+        assert_that(other, is_(Entry(13, MAXED, egg.id, 0)))
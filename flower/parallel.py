@@ -0,0 +1,262 @@
+# coding: utf-8
+'''
+Ticks the plants of one World on several processes.
+
+    parallel = ParallelWorld(world, processes=4)
+    parallel.run(1000)
+    parallel.gather()
+
+Parts of a plant only affect each other through their Vein, so the
+entities are split into shards of whole plants and each shard ticks in
+a worker process of its own, where it stays between run() calls.
+gather() brings the shards back, leaving the world as it would be
+after as many world.tick() calls: entities made during the ticks get
+the ids and order they would have got, and removed ones are gone.
+
+Every entity must be part of a plant, and the world must not have air,
+ground, growth engines, listeners, a journal, a profiler, a scheduler,
+aggregates, a part pool or deferred events, since those tie plants
+together.  The entities in the world are new copies after gather();
+look them up by id.
+
+Nothing is shared between the processes while they run: each worker
+ticks its own copy of its shard, and the world is only brought up to
+date by gather().  Until then the world is left as it was when the
+shards went out, and it refuses to tick, to add or remove entities or
+to be saved.  Use this for long batch runs; a world that must be seen
+or changed every tick has to tick in one process.
+'''
+
+import cPickle
+import itertools
+import multiprocessing
+import traceback
+from cStringIO import StringIO
+
+from soil import *
+
+
+def _dumps(obj, world, inside=None):
+    '''pickles obj with world left out; inside tells entities that may be pickled'''
+    f = StringIO()
+    pickler = cPickle.Pickler(f, 2)
+    def persistent_id(o):
+        if o is world: return 'world'
+        if inside is not None and isinstance(o, WorldEntity):
+            assert id(o) in inside, '%r is shared with another plant' % o
+        return None
+    pickler.inst_persistent_id = persistent_id
+    pickler.dump(obj)
+    return f.getvalue()
+
+
+def _loads(payload, world):
+    unpickler = cPickle.Unpickler(StringIO(payload))
+    unpickler.persistent_load = lambda key: world
+    return unpickler.load()
+
+
+def _check(world):
+    assert not world.tick_in_progress, 'cannot share out a world during a tick'
+    assert world.air is None and world.ground is None and not world.growth_engines and not world.listeners, 'plants must not share anything but their veins'
+    assert world.journal is None and world.profiler is None and world.scheduler is None and world.aggregates is None, 'detach the journal, profiler, scheduler and aggregates first'
+    assert world.part_pool is None, 'pooled parts would move between plants'
+    assert world._bulk is None, 'finish adding in bulk first'
+    assert not world.defer_events, 'events must be handled at once'
+    assert not world._periodic, 'entities must tick on every tick'
+    assert world.lent_out is None, 'the world is already out in worker processes'
+    for e in world.entities:
+        assert isinstance(getattr(e, '_vein', None), Vein), '%r is not part of a plant' % e
+
+
+def plants_of(world):
+    '''groups entities into plants: entities sharing a vein or referring to each other'''
+    parents = {}
+    def find(key):
+        while parents.setdefault(key, key) != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+    def union(a, b):
+        parents[find(a)] = find(b)
+
+    entities = list(world.entities)
+    for e in entities:
+        union(id(e), id(e._vein))
+        def persistent_id(o):
+            # note whom e refers to, without going into them
+            if isinstance(o, (WorldEntity, Vein, World)):
+                if o is not e and not isinstance(o, World):
+                    union(id(e), id(o))
+                return 'ref'
+            return None
+        pickler = cPickle.Pickler(StringIO(), 2)
+        pickler.inst_persistent_id = persistent_id
+        pickler.dump(dict((k, v) for k, v in e.__getstate__().items() if k != 'world'))
+
+    plants = {}
+    for e in entities:
+        plants.setdefault(find(id(e)), []).append(e)
+    return sorted(plants.values(), key=lambda plant: plant[0].id)
+
+
+def shards_of(world, count):
+    '''splits the entities into count lists of whole plants, keeping world order in each'''
+    position = dict((e.id, i) for i, e in enumerate(world.entities))
+    shards = [[] for i in xrange(count)]
+    for plant in sorted(plants_of(world), key=len, reverse=True):
+        min(shards, key=len).extend(plant)
+    for shard in shards:
+        shard.sort(key=lambda e: position[e.id])
+    return [shard for shard in shards if shard]
+
+
+class _InOrder(object):
+    '''
+    Ticks every entity like a World without a scheduler does, and
+    tells which one is ticking.
+    '''
+    def __init__(self, world):
+        self.world = world
+        self.ticking = None
+
+    def due(self):
+        for e in self.world.entities:
+            self.ticking = e
+            yield e
+        self.ticking = None
+
+    # sleeping is ignored without a scheduler
+    def sleep(self, entity): pass
+    def wake(self, entity): pass
+    def sleep_until(self, entity, tick): pass
+    def period_changed(self, entity): pass
+
+
+class _ShardWorld(World):
+    '''A World in a worker that notes which entity made each new entity'''
+    def __init__(self):
+        super(_ShardWorld, self).__init__()
+        self.scheduler = _InOrder(self)
+        self.created = []
+
+    def add(self, entity):
+        if self.tick_in_progress and getattr(entity, 'id', None) is None:
+            creator = self.scheduler.ticking
+            World.add(self, entity)
+            self.created.append((self.ticks, creator.id, entity.id))
+            return
+        World.add(self, entity)
+
+
+def _serve(connection):
+    world = _ShardWorld().activate()
+    state = _loads(connection.recv(), world)
+    world.ticks = state['ticks']
+    for e in state['entities']:
+        world.entities.add(e)
+    world.entities.reserve(state['next_id'] - 1)
+    while True:
+        command, argument = connection.recv()
+        try:
+            if command == 'run':
+                for i in xrange(argument):
+                    world.tick()
+                connection.send(('ok', None))
+            elif command == 'gather':
+                connection.send(('ok', _dumps({
+                    'entities': list(world.entities),
+                    'created': world.created,
+                }, world)))
+                return
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+            return
+
+
+class ParallelWorld(object):
+    def __init__(self, world, processes=None):
+        _check(world)
+        self.world = world
+        world.lent_out = self
+        self._positions = dict((e.id, i) for i, e in enumerate(world.entities))
+        self._ticks = 0
+        self._workers = []
+        for shard in shards_of(world, processes or multiprocessing.cpu_count()):
+            connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, args=(child_connection,))
+            process.daemon = True
+            process.start()
+            connection.send(_dumps({
+                'ticks': world.ticks,
+                'next_id': world.entities.next_id(),
+                'entities': shard,
+            }, world, inside=set(id(e) for e in shard)))
+            self._workers.append((process, connection))
+
+    def _call(self, command, argument=None):
+        for process, connection in self._workers:
+            connection.send((command, argument))
+        results = []
+        for process, connection in self._workers:
+            status, result = connection.recv()
+            if status == 'error':
+                self.close()
+                raise RuntimeError('worker failed:\n' + result)
+            results.append(result)
+        return results
+
+    def run(self, ticks):
+        self._call('run', ticks)
+        self._ticks += ticks
+
+    def gather(self):
+        '''puts the shards back into the world and stops the workers'''
+        shards = [_loads(payload, self.world) for payload in self._call('gather')]
+        self.close()
+
+        positions = self._positions
+        def tick_order(entity_id):
+            # where an entity comes in World.tick: the ones it started with, then new ones
+            return (0, positions[entity_id]) if entity_id in positions else (1, entity_id)
+
+        # new entities are numbered by tick, then by the turn of the
+        # entity that made them, then in the order they were made
+        ids = {}
+        def global_id(shard_index, entity_id):
+            return ids.get((shard_index, entity_id), entity_id)
+        created = []
+        for shard_index, shard in enumerate(shards):
+            for seq, (tick, creator, entity_id) in enumerate(shard['created']):
+                created.append((tick, shard_index, seq, creator, entity_id))
+        created.sort(key=lambda c: c[0])
+        next_id = self.world.entities.next_id()
+        for tick, batch in itertools.groupby(created, key=lambda c: c[0]):
+            batch = sorted(batch, key=lambda c: (tick_order(global_id(c[1], c[3])), c[1], c[2]))
+            for t, shard_index, seq, creator, entity_id in batch:
+                ids[(shard_index, entity_id)] = next_id
+                next_id += 1
+
+        entities = []
+        for shard_index, shard in enumerate(shards):
+            for e in shard['entities']:
+                e.id = global_id(shard_index, e.id)
+                entities.append(e)
+        entities.sort(key=lambda e: tick_order(e.id))
+
+        repository = WorldEntityRepository()
+        for e in entities:
+            repository.add(e)
+        repository.reserve(next_id - 1)
+        self.world.entities = repository
+        self.world.ticks += self._ticks
+        return self.world
+
+    def close(self):
+        '''stops the workers; the world goes on from where the shards went out unless gathered'''
+        for process, connection in self._workers:
+            connection.close()
+            process.join(1)
+            if process.is_alive(): process.terminate()
+        self._workers = []
+        self.world.lent_out = None
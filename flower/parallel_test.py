@@ -0,0 +1,91 @@
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from parallel import *
+
+
+def plant_seeds(count):
+    world = World.reset()
+    for i in range(count):
+        seed = dict(Params.seed)
+        seed['water_for_seed'] = 5 + i * 7
+        Seed({'kledis': 100.0 + i}, Params.plant_parameters('root', 'stem', 'leaves', seed=seed))
+    flower = Flower(Vein(), Params.plant_parameters('flower', 'egg'))
+    flower.take_in_from_environment({'kledis': 25.0})
+    return world
+
+
+def describe(world):
+    described = []
+    for e in world.entities:
+        growth = getattr(e, 'growth', None)
+        described.append((
+            e.id,
+            type(e).__name__,
+            e._vein.pooled().values(),
+            growth.volume if growth else None,
+            sorted(p.id for p in e._vein.part('root') + e._vein.part('stem') + e._vein.part('leaves')),
+        ))
+    return described, world.ticks, world.entities.next_id()
+
+
+class ParallelWorldTest(unittest.TestCase):
+    def test_same_as_serial_ticks(self):
+        world = plant_seeds(5)
+        for i in range(35):
+            world.tick()
+        expected = describe(world)
+
+        world = plant_seeds(5)
+        parallel = ParallelWorld(world, processes=3)
+        parallel.run(20)
+        parallel.run(15)
+        parallel.gather()
+        assert_that(describe(world), equal_to(expected))
+
+    def test_gathered_world_keeps_ticking(self):
+        world = plant_seeds(2)
+        parallel = ParallelWorld(world, processes=2)
+        parallel.run(10)
+        parallel.gather()
+        for i in range(25):
+            world.tick()
+
+        expected = plant_seeds(2)
+        for i in range(35):
+            expected.tick()
+        assert_that(describe(world), equal_to(describe(expected)))
+
+    def test_shards_are_whole_plants(self):
+        world = plant_seeds(3)
+        for i in range(20):
+            world.tick()
+        shards = shards_of(world, 2)
+        assert_that(sum(len(shard) for shard in shards), is_(len(world.entities)))
+        for shard in shards:
+            veins = set(id(e._vein) for e in shard)
+            for e in world.entities:
+                if id(e._vein) in veins:
+                    assert_that(e, is_in(shard))
+
+    def test_rejects_shared_things(self):
+        world = plant_seeds(1)
+        WorldEntity()
+        self.assertRaises(AssertionError, ParallelWorld, world)
+
+    def test_rejects_a_part_pool(self):
+        world = plant_seeds(1)
+        PartPool().attach(world)
+        self.assertRaises(AssertionError, ParallelWorld, world)
+
+    def test_world_waits_for_gather(self):
+        world = plant_seeds(1)
+        parallel = ParallelWorld(world, processes=1)
+        parallel.run(5)
+        self.assertRaises(AssertionError, world.tick)
+        self.assertRaises(AssertionError, Seed, {}, Params.plant_parameters('seed'))
+        parallel.gather()
+        world.tick()
+        assert_that(world.ticks, is_(6))
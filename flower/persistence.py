@@ -0,0 +1,420 @@
+# coding: utf-8
+'''
+Binary snapshots of a World.
+
+    save(world, 'world.snap')
+    world = load('world.snap')
+
+A Checkpointer writes a full snapshot first and then deltas holding
+only what changed since its previous checkpoint:
+
+    checkpointer = Checkpointer(world, 'run')
+    checkpointer.checkpoint()    # run.000000, full
+    checkpointer.checkpoint()    # run.000001, delta
+    world = load(*checkpointer.paths)
+
+A snapshot is a sequence of records, one per WorldEntity, Vein, Growth
+and parameter node, plus one for the World itself and one for the order
+of its entities.  Each record is a pickle of the object's state in which
+references to other recorded objects are replaced by their keys, so
+records can be written and replaced one by one.  Snapshots are taken
+between ticks.
+
+The Checkpointer follows the world as a listener.  A delta holds the
+entities that ticked, changed state, joined or left since the previous
+checkpoint, with the veins and growths they refer to, and the order only
+if entities joined or left.  Without a scheduler every entity ticks, so
+of those only the records whose digest changed are written.  Changes
+made between ticks by other means need a touch().  Records no longer
+reachable from the world's entities are deleted and their keys
+forgotten.
+
+Snapshots are read through mmap and records are unpickled straight
+from the mapped files.
+'''
+
+import collections
+import cPickle
+import hashlib
+import mmap
+import struct
+from cStringIO import StringIO
+
+from soil import *
+from plant import Growth, ConventionalDict, ParameterNode
+
+MAGIC = 'FLWRSNAP'
+VERSION = 1
+FULL = 'F'
+DELTA = 'D'
+STATE = 's'
+DELETED = 'x'
+
+# record type, object kind, key, class name length, payload length
+RECORD = struct.Struct('<ccQHI')
+HEADER = struct.Struct('<8sHc')
+
+# objects recorded on their own: kind and how to key them
+WORLD = 'w'
+ORDER = 'o'
+ENTITY = 'e'
+VEIN = 'v'
+GROWTH = 'g'
+PARAMETERS = 'p'
+SHARED_KINDS = [
+    (VEIN, Vein),
+    (GROWTH, Growth),
+    (PARAMETERS, ParameterNode),
+    ('c', ConventionalDict),
+]
+# kinds written again in a delta whenever a record in it refers to them;
+# parameters do not change and entities are written when they change
+REWRITTEN_KINDS = (VEIN, GROWTH)
+# World attributes that are rebuilt rather than saved
+WORLD_TRANSIENTS = ['entities', 'entities_to_add_after_tick', 'tick_in_progress', 'journal', 'profiler', 'event_monitor', 'part_pool', '_bulk', 'lent_out']
+
+
+def _class_name(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def _find_class(name):
+    module, _, cls = name.rpartition('.')
+    return getattr(__import__(module, fromlist=[cls]), cls)
+
+
+def _class_name_of(obj):
+    if isinstance(obj, ParameterNode):
+        return _class_name(obj._base)
+    return _class_name(type(obj))
+
+
+def _state_of(obj):
+    if isinstance(obj, ParameterNode):
+        # nested nodes stay references
+        return dict(obj.items())
+    if hasattr(type(obj), '__getstate__'):
+        return obj.__getstate__()
+    return obj.__dict__
+
+
+def _set_state(obj, state):
+    if hasattr(type(obj), '__setstate__'):
+        obj.__setstate__(state)
+    else:
+        obj.__dict__.update(state)
+
+
+class _Keys(object):
+    '''
+    Gives every recorded object a stable key.  Entities are keyed by
+    their id; other objects are kept alive until forgotten so that their
+    ids are not reused while their keys are.
+    '''
+    def __init__(self):
+        self._keys = {}
+        self._objects = {}
+        self._counters = dict((kind, 0) for kind, cls in SHARED_KINDS)
+
+    def key(self, obj):
+        if isinstance(obj, WorldEntity):
+            return (ENTITY, obj.id)
+        key = self._keys.get(id(obj))
+        if key: return key
+        for kind, cls in SHARED_KINDS:
+            if isinstance(obj, cls): break
+        else:
+            return None
+        key = (kind, self._counters[kind])
+        self._counters[kind] += 1
+        self._keys[id(obj)] = key
+        self._objects[key] = obj
+        return key
+
+    def forget(self, key):
+        obj = self._objects.pop(key, None)
+        if obj is not None: del self._keys[id(obj)]
+
+
+class _Writer(object):
+    '''
+    Pickles entities into records, along with the records they refer
+    to.  written holds the keys of the records of previous checkpoints;
+    of those, only veins and growths are written again.
+    '''
+    def __init__(self, world, keys, written=None):
+        assert not world.tick_in_progress, 'cannot take a snapshot during a tick'
+        assert world.lent_out is None, 'cannot take a snapshot while the world ticks in worker processes'
+        self._world = world
+        self._keys = keys
+        self._written = written
+        self._buffer = StringIO()
+        self._pickler = cPickle.Pickler(self._buffer, 2)
+        self._pickler.inst_persistent_id = self._persistent_id
+        self._queue = collections.deque()
+        self._queued = set()
+        self._refs = None
+
+    def _persistent_id(self, obj):
+        if obj is self._world:
+            return (WORLD, 0)
+        key = self._keys.key(obj)
+        if key is None: return None
+        self._refs.add(key)
+        if self._written is None or key not in self._written or key[0] in REWRITTEN_KINDS:
+            self._enqueue(key, obj)
+        return key
+
+    def _enqueue(self, key, obj):
+        if key not in self._queued:
+            self._queued.add(key)
+            self._queue.append((key, obj))
+
+    def _dumps(self, state):
+        self._refs = set()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._pickler.clear_memo()
+        self._pickler.dump(state)
+        return self._buffer.getvalue()
+
+    def records(self, entities, order=True):
+        '''
+        yields (key, class name, payload, keys referred to) of the world,
+        its order if order is set, entities and what they refer to
+        '''
+        world = self._world
+        state = dict((name, value) for name, value in world.__dict__.items() if name not in WORLD_TRANSIENTS)
+        state['listeners'] = [l for l in world.listeners if not isinstance(l, Checkpointer)]
+        yield (WORLD, 0), _class_name(World), self._dumps(state), self._refs
+        if order:
+            yield (ORDER, 0), '', self._dumps(([e.id for e in world.entities], world.entities.next_id())), self._refs
+
+        for e in entities:
+            self._enqueue(self._keys.key(e), e)
+        while self._queue:
+            key, obj = self._queue.popleft()
+            yield key, _class_name_of(obj), self._dumps(_state_of(obj)), self._refs
+
+
+def _write_header(f, kind):
+    f.write(HEADER.pack(MAGIC, VERSION, kind))
+
+
+def _write_record(f, record_type, key, class_name, payload):
+    f.write(RECORD.pack(record_type, key[0], key[1], len(class_name), len(payload)))
+    f.write(class_name)
+    f.write(payload)
+
+
+def save(world, path):
+    with open(path, 'wb') as f:
+        _write_header(f, FULL)
+        for key, class_name, payload, refs in _Writer(world, _Keys()).records(world.entities):
+            _write_record(f, STATE, key, class_name, payload)
+
+
+class Checkpointer(WorldListener):
+    '''
+    Writes a full snapshot and then deltas of the records that changed,
+    plus tombstones for the objects that are gone.
+    '''
+    def __init__(self, world, prefix):
+        self._world = world
+        self._prefix = prefix
+        self._keys = _Keys()
+        # key -> keys its record refers to, for every record written
+        self._refs = {}
+        # key -> keys of the records referring to it
+        self._referrers = {}
+        # key -> digest of its record, for every record written
+        self._digests = {}
+        self._dirty = set()
+        self._removed = {}
+        self._all_dirty = False
+        self._joined_or_left = False
+        self.paths = []
+        world.listen(self)
+
+    def entity_added(self, entity):
+        self._dirty.add(entity.id)
+        self._joined_or_left = True
+
+    def entity_removed(self, entity):
+        self._dirty.add(entity.id)
+        self._removed[entity.id] = entity
+        self._joined_or_left = True
+
+    def state_changed(self, part, previous):
+        self.touch(part)
+
+    def tick_ended(self, world):
+        if world.scheduler is not None:
+            self._dirty.update(world.scheduler.ticked)
+        else:
+            self._all_dirty = True
+
+    def touch(self, entity):
+        '''marks entity to be written at the next checkpoint'''
+        self._dirty.add(entity.id)
+        growth = getattr(entity, 'growth', None)
+        engine = getattr(growth, '_engine', None)
+        # the engine keeps the growth's volume and parameters
+        if engine is not None: self._dirty.add(engine.id)
+
+    def close(self):
+        self._world.listeners.remove(self)
+
+    def checkpoint(self):
+        path = '%s.%06d' % (self._prefix, len(self.paths))
+        full = not self.paths
+        if full or self._all_dirty:
+            entities = list(self._world.entities) + self._removed.values()
+        else:
+            entities = [e for e in (self._world.entities.get(entity_id) or self._removed.get(entity_id) for entity_id in self._dirty) if e is not None]
+        writer = _Writer(self._world, self._keys, None if full else self._refs)
+        with open(path, 'wb') as f:
+            _write_header(f, FULL if full else DELTA)
+            lost = set((ENTITY, entity_id) for entity_id in self._removed)
+            for key, class_name, payload, refs in writer.records(entities, full or self._joined_or_left):
+                digest = hashlib.md5(payload).digest()
+                if self._digests.get(key) == digest: continue
+                self._digests[key] = digest
+                _write_record(f, STATE, key, class_name, payload)
+                lost.update(self._refer(key, refs))
+            for key in self._collect(lost):
+                _write_record(f, DELETED, key, '', '')
+        self._dirty.clear()
+        self._removed.clear()
+        self._all_dirty = False
+        self._joined_or_left = False
+        if self._world.journal: self._world.journal.checkpointed(len(self.paths))
+        self.paths.append(path)
+        return path
+
+    def _refer(self, key, refs):
+        '''records that key refers to refs, and returns the keys it no longer refers to'''
+        previous = self._refs.get(key, ())
+        for ref in refs:
+            if ref not in previous: self._referrers.setdefault(ref, set()).add(key)
+        lost = [ref for ref in previous if ref not in refs]
+        for ref in lost:
+            self._referrers[ref].discard(key)
+        self._refs[key] = refs
+        return lost
+
+    def _is_root(self, key):
+        return key[0] in (WORLD, ORDER) or (key[0] == ENTITY and self._world.entities.get(key[1]) is not None)
+
+    def _collect(self, candidates):
+        '''
+        drops the records of candidates that cannot be reached from the
+        world any more, and of what only they referred to, and returns
+        their keys
+        '''
+        garbage = []
+        candidates = list(candidates)
+        while candidates:
+            key = candidates.pop()
+            if key not in self._refs or self._is_root(key): continue
+            # whatever refers to key, directly or not, is unreachable too
+            # unless one of them is a root
+            seen = set([key])
+            stack = [key]
+            reachable = False
+            while stack and not reachable:
+                for referrer in self._referrers.get(stack.pop(), ()):
+                    if referrer in seen: continue
+                    if self._is_root(referrer):
+                        reachable = True
+                        break
+                    seen.add(referrer)
+                    stack.append(referrer)
+            if reachable: continue
+            for dropped in seen:
+                for ref in self._refs.pop(dropped):
+                    self._referrers[ref].discard(dropped)
+                    candidates.append(ref)
+            for dropped in seen:
+                self._referrers.pop(dropped, None)
+                self._digests.pop(dropped, None)
+                self._keys.forget(dropped)
+                garbage.append(dropped)
+        return garbage
+
+
+def _read_records(path, records):
+    '''
+    reads records of a file into records, a dict of key to (class name,
+    payload), and returns the mapped file.  Payloads are buffers into it
+    and last until it is closed.
+    '''
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, version, kind = HEADER.unpack_from(mapped, 0)
+        assert magic == MAGIC and version == VERSION, '%s is not a snapshot' % path
+        if kind == FULL: records.clear()
+        offset = HEADER.size
+        while offset < len(mapped):
+            record_type, object_kind, key, name_length, payload_length = RECORD.unpack_from(mapped, offset)
+            offset += RECORD.size
+            class_name = mapped[offset:offset + name_length]
+            offset += name_length
+            if record_type == DELETED:
+                records.pop((object_kind, key), None)
+            else:
+                records[(object_kind, key)] = (class_name, buffer(mapped, offset, payload_length))
+            offset += payload_length
+    except:
+        mapped.close()
+        raise
+    return mapped
+
+
+def load(path, *delta_paths):
+    '''restores the world saved in a full snapshot followed by its deltas'''
+    records = {}
+    mapped = []
+    try:
+        for p in (path,) + delta_paths:
+            mapped.append(_read_records(p, records))
+        return _restore(records)
+    finally:
+        for m in mapped:
+            m.close()
+
+
+def _restore(records):
+    world = World()
+    objects = {(WORLD, 0): world}
+    for key, (class_name, payload) in records.items():
+        if key[0] in (WORLD, ORDER, PARAMETERS): continue
+        cls = _find_class(class_name)
+        objects[key] = cls.__new__(cls)
+
+    def persistent_load(key):
+        if key not in objects:
+            # parameters are read-only; compile them from their nested parameters up
+            class_name, payload = records[key]
+            objects[key] = _find_class(class_name).compile(loads(payload))
+        return objects[key]
+
+    def loads(payload):
+        unpickler = cPickle.Unpickler(StringIO(payload))
+        unpickler.persistent_load = persistent_load
+        return unpickler.load()
+
+    for key in records:
+        if key[0] == PARAMETERS: persistent_load(key)
+
+    for key in objects:
+        if key[0] in (WORLD, PARAMETERS): continue
+        _set_state(objects[key], loads(records[key][1]))
+
+    world.__dict__.update(loads(records[(WORLD, 0)][1]))
+    order, next_id = loads(records[(ORDER, 0)][1])
+    for entity_id in order:
+        world.entities.add(objects[(ENTITY, entity_id)])
+    world.entities.reserve(next_id - 1)
+    return world
@@ -0,0 +1,189 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+import persistence
+from persistence import *
+from aggregates import Aggregates
+from scheduler import Scheduler
+from growth_engine import GrowthEngine
+
+
+def describe(world):
+    described = []
+    for e in world.entities:
+        growth = getattr(e, 'growth', None)
+        vein = getattr(e, '_vein', None)
+        described.append((
+            type(e).__name__, e.id,
+            growth.volume if growth else None,
+            vein.pooled().values() if vein else None,
+            sorted(p.id for parts in vein._parts.values() for p in parts) if vein else None,
+            e._fixed_materials.values() if isinstance(e, PlantPart) else None,
+        ))
+    return described
+
+
+class PersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.directory = tempfile.mkdtemp()
+        self.params = Params.plant_parameters()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def tick(self, world, n):
+        for i in range(n):
+            world.tick()
+
+    def test_save_and_load(self):
+        Seed({'kledis': 100.0}, self.params)
+        self.tick(self.world, 30)
+        save(self.world, self.path('world.snap'))
+        restored = load(self.path('world.snap'))
+        assert_that(describe(restored), equal_to(describe(self.world)))
+        assert_that(restored.ticks, is_(30))
+
+        self.tick(self.world, 20)
+        self.tick(restored, 20)
+        assert_that(describe(restored), equal_to(describe(self.world)))
+        assert_that(restored.entities.get(0).world, is_(restored))
+
+    def test_restored_parts_keep_sharing_objects(self):
+        flower = Flower(Vein(), self.params)
+        flower.take_in_from_environment({'kledis': 21.0})
+        self.tick(self.world, 10)
+        egg = flower._vein.part('egg')[0]
+        ReproducingRule().mate(egg, flower._vein.part('pollen')[0])
+        save(self.world, self.path('world.snap'))
+        restored = load(self.path('world.snap'))
+
+        restored_flower = restored.entities.get(flower.id)
+        restored_egg = restored.entities.get(egg.id)
+        assert_that(restored_flower._vein, is_(restored_egg._vein))
+        assert_that(restored_flower.egg_generation._generated[0], is_(restored_egg))
+        assert_that(restored_flower._params, is_(restored_egg._params))
+        assert_that(restored_flower.pollen_generation._generated[0].destroyed, is_(True))
+        assert_that(restored_egg.fertilized, is_(True))
+
+        self.tick(restored, 10)
+        assert_that(restored_egg.seed, is_not(None))
+        assert_that(restored_egg.seed.world, is_(restored))
+        assert_that(restored_egg.seed.id, is_(restored.entities.next_id() - 1))
+
+    def test_growth_engines_survive_load(self):
+        Flower(Vein(), self.params)
+        engine = GrowthEngine.install(Stem)
+        stem = Stem(Vein(), self.params)
+        stem.take_in_from_environment({'kledis': 30.0, 'heplon': 100.0})
+        stem.growth.volume = -0.2
+        self.tick(self.world, 1)
+        save(self.world, self.path('world.snap'))
+        restored = load(self.path('world.snap'))
+
+        restored_engine = restored.growth_engines[Stem]
+        assert_that(restored_engine.id, is_(engine.id))
+        assert_that(restored_engine.world, is_(restored))
+        restored_engine.set_tick_period(1)
+        self.tick(self.world, 2)
+        self.tick(restored, 2)
+        assert_that(restored.entities.get(stem.id).growth.volume, is_(stem.growth.volume))
+        assert_that(describe(restored), equal_to(describe(self.world)))
+
+    def test_delta_checkpoints(self):
+        Seed({'kledis': 100.0}, self.params)
+        Seed({'kledis': 50.0}, self.params)
+        checkpointer = Checkpointer(self.world, self.path('run'))
+        checkpointer.checkpoint()
+        self.tick(self.world, 5)
+        checkpointer.checkpoint()
+        self.tick(self.world, 30)
+        checkpointer.checkpoint()
+
+        assert_that(checkpointer.paths, has_length(3))
+        assert_that(os.path.getsize(checkpointer.paths[1]), less_than(os.path.getsize(checkpointer.paths[0])))
+        restored = load(*checkpointer.paths)
+        assert_that(describe(restored), equal_to(describe(self.world)))
+        assert_that(describe(load(*checkpointer.paths[:2])), is_not(equal_to(describe(self.world))))
+
+    def test_deltas_without_scheduler_hold_what_changed(self):
+        for i in range(50):
+            Flower(Vein(), self.params)
+        flower = Flower(Vein(), self.params)
+        self.tick(self.world, 1)
+        checkpointer = Checkpointer(self.world, self.path('run'))
+        checkpointer.checkpoint()
+        flower.take_in_from_environment({'kledis': 21.0})
+        self.tick(self.world, 1)
+        checkpointer.checkpoint()
+        assert_that(os.path.getsize(checkpointer.paths[1]) * 10, less_than(os.path.getsize(checkpointer.paths[0])))
+        assert_that(describe(load(*checkpointer.paths)), equal_to(describe(self.world)))
+
+    def test_deltas_hold_what_changed(self):
+        Scheduler().attach(self.world)
+        seed = Seed({'kledis': 1000.0}, self.params)
+        flower = seed.generate_part(Flower)
+        flower.take_in_from_environment({'kledis': 25.0})
+        checkpointer = Checkpointer(self.world, self.path('run'))
+        checkpointer.checkpoint()
+        for i in range(6):
+            self.tick(self.world, 5)
+            if i == 2:
+                pollen = flower._vein.part('pollen')[0]
+                ReproducingRule().mate(flower._vein.part('egg')[0], pollen)
+            checkpointer.checkpoint()
+            assert_that(describe(load(*checkpointer.paths)), equal_to(describe(self.world)))
+        assert_that(pollen, is_not(is_in(self.world.entities)))
+
+        # only what is reachable from the world is kept
+        written = set(key for key, class_name, payload, refs in persistence._Writer(self.world, persistence._Keys()).records(self.world.entities))
+        assert_that(sorted(key for key in checkpointer._refs if key[0] == ENTITY), equal_to(sorted(key for key in written if key[0] == ENTITY)))
+        assert_that(len(checkpointer._refs), is_(len(written)))
+        assert_that(len(checkpointer._keys._objects), is_(len([key for key in written if key[0] not in (WORLD, 'o', ENTITY)])))
+
+    def test_forgets_what_left_the_world(self):
+        flower = Flower(Vein(), self.params)
+        checkpointer = Checkpointer(self.world, self.path('run'))
+        checkpointer.checkpoint()
+        vein = checkpointer._keys.key(flower._vein)
+        flower.remove()
+        checkpointer.checkpoint()
+        assert_that(checkpointer._refs, is_not(has_key((ENTITY, flower.id))))
+        assert_that(checkpointer._refs, is_not(has_key(vein)))
+        assert_that(checkpointer._keys._objects, is_({}))
+        assert_that(load(*checkpointer.paths).entities, has_length(0))
+
+    def test_touched_entities_are_written(self):
+        Scheduler().attach(self.world)
+        flower = Flower(Vein(), self.params)
+        self.tick(self.world, 1)
+        checkpointer = Checkpointer(self.world, self.path('run'))
+        checkpointer.checkpoint()
+        flower.tick_period = 3
+        checkpointer.touch(flower)
+        checkpointer.checkpoint()
+        restored = load(*checkpointer.paths)
+        assert_that(restored.entities.get(flower.id).tick_period, is_(3))
+
+    def test_aggregates_keep_counting_after_load(self):
+        Aggregates().attach(self.world)
+        flower = Flower(Vein(), self.params)
+        flower.take_in_from_environment({'kledis': 21.0})
+        save(self.world, self.path('world.snap'))
+        restored = load(self.path('world.snap'))
+        self.tick(self.world, 10)
+        self.tick(restored, 10)
+
+        aggregates = restored.aggregates
+        assert_that(aggregates, is_in(restored.listeners))
+        assert_that(aggregates.count_in_state(Flower, 'blooming'), is_(1))
+        assert_that(aggregates.count(Pollen), is_(self.world.aggregates.count(Pollen)))
+        assert_that(aggregates.total_fixed(), equal_to(self.world.aggregates.total_fixed()))
@@ -1,71 +1,342 @@
 # coding: utf-8
 
+import collections
+import re
+
 from event import EventDispatcher
 
 from soil import *
 
 class PlantPart(WorldEntity):
+    '''
+    A part of a plant connected to its Vein.
+
+    Subclasses with a lifecycle declare it in STATES, a list of
+
+        (state, tick handler name, [(guard name, next state), ...])
+
+    with the initial state first.  The current state is kept by the
+    part.  tick() calls the handler of the current state, and
+    update_state() moves on to the next state of the first guard that
+    holds, as many times as guards hold.  Call it after anything that
+    can make a guard hold.  Set PlantPart.check_state to have state()
+    check that no guard holds that update_state() has not followed.
+
+    Removed parts of a poolable class go to the world's PartPool, if it
+    has one, and generate_part() takes them from there.
+    '''
+    __slots__ = ('_vein', '_fixed_materials', '_params', '_location', '_state')
+    check_state = False
+    poolable = False
+    STATES = None
+
     def __init__(self, name, vein, params):
+        # set before joining the world, for listeners to see
+        self._state = StateMachine.of(type(self)).initial
+        self._fixed_materials = Materials()
+        self._location = None
         super(PlantPart, self).__init__()
         self._vein = vein
         self._vein.connect(name, self)
-        self._fixed_materials = Materials()
         self._params = params
 
-    def take_in_from_environment(self, materials):
-        self._vein.pour_in(materials, source=self)
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, location):
+        located = self._location is None and location is not None
+        self._location = location
+        if located:
+            for listener in self.world.listeners:
+                listener.part_located(self)
+
+    def take_in_from_environment(self, materials, factor=1):
+        self._vein.pour_in(materials, source=self, factor=factor)
+
+    def take_in_from_air(self, materials, factor=1):
+        air = self.world.air
+        if air is None or self.location is None:
+            self.take_in_from_environment(materials, factor)
+            return
+        self.take_in_from_environment(air.take(self.location, materials, factor))
+
+    def take_in_from_earth(self, materials, factor=1, depth=0.0):
+        '''takes materials from the world's ground, down to depth under the part'''
+        ground = self.world.ground
+        if ground is None or self.location is None:
+            self.take_in_from_environment(materials, factor)
+            return
+        self.take_in_from_environment(ground.take(self.location, depth, materials, factor))
 
     def consume_material(self, materials):
-        assert self._vein.pooled() >= materials
-        pumped_out = self._vein.pump_out(materials, self)
-        self._fixed_materials.add(pumped_out)
+        self._vein.transfer([(self, None, materials)])
+        self.fix_materials(materials)
 
-    def produce_material(self, product, source):
-        for name in source:
-            assert self._vein.pooled()[name] >= source[name]
-        self._vein.pump_out(source, self)
-        self._vein.pour_in(product, source=self)
+    def fix_materials(self, materials, factor=1):
+        '''adds materials * factor to what the part is made of'''
+        self._fixed_materials.add(materials, factor)
+        aggregates = self.world.aggregates
+        if aggregates is not None: aggregates.fixed(self, materials, factor)
+
+    def clear_fixed_materials(self):
+        aggregates = self.world.aggregates
+        if aggregates is not None: aggregates.fixed(self, self._fixed_materials, -1)
+        self._fixed_materials.clear()
+
+    def produce_material(self, product, source, factor=1):
+        self._vein.transfer([(self, product, source)], factor)
 
     def generate_part(self, cls):
-        return cls(self._vein, self._params)
+        pool = self.world.part_pool
+        part = pool.obtain(cls, self._vein, self._params) if pool is not None else None
+        if part is None:
+            part = cls(self._vein, self._params)
+        part.location = self.location
+        self.update_state()
+        journal = self.world.journal
+        if journal: journal.generated(self, part)
+        return part
+
+    def remove(self):
+        # a pooled part has let go of its vein already
+        if getattr(self, 'destroyed', False): return
+        super(PlantPart, self).remove()
+        growth = getattr(self, 'growth', None)
+        if growth is not None and growth._engine: growth._engine.detach(growth)
+        name = self._vein.disconnect(self)
+        pool = self.world.part_pool
+        if pool is not None and self.poolable: pool.release(self, name)
+
+    def reuse(self, name, vein, params):
+        '''
+        sets up a part given out by a PartPool as the constructor would,
+        keeping its id; poolable classes with more state extend it
+        '''
+        self._state = StateMachine.of(type(self)).initial
+        self._fixed_materials.clear()
+        self.destroyed = False
+        self.world.add(self)
+        self._vein = vein
+        self._vein.connect(name, self)
+        self._params = params
+        self.location = None
+
+    def forget(self, part):
+        '''drops what the part knows of part, which is leaving its plant for good'''
+        pass
+
+    def tick(self):
+        handler = StateMachine.of(type(self)).ticks.get(self._state)
+        if handler: handler(self)
 
     def state(self):
-        return None
+        if PlantPart.check_state:
+            state = StateMachine.of(type(self)).follow(self, self._state)
+            assert state == self._state, '%r is in state %r but should be %r' % (self, self._state, state)
+        return self._state
 
+    def update_state(self):
+        state = StateMachine.of(type(self)).follow(self, self._state)
+        if state == self._state: return
+        previous = self._state
+        self._state = state
+        for listener in self.world.listeners:
+            listener.state_changed(self, previous)
 
-class Growth(object):
+
+class StateMachine(object):
+    '''
+    The STATES of a PlantPart class compiled into tables of its tick
+    handlers and of its guards by state.  Compiled once per class.
+    '''
+    # part class -> StateMachine
+    _machines = {}
+
+    def __init__(self, cls):
+        states = cls.STATES or []
+        names = set(state for state, tick, transitions in states)
+        self.initial = states[0][0] if states else None
+        self.ticks = {}
+        self.transitions = {}
+        for state, tick, transitions in states:
+            if tick: self.ticks[state] = getattr(cls, tick)
+            for guard, next_state in transitions:
+                assert next_state in names, '%s has no state %r' % (cls.__name__, next_state)
+            self.transitions[state] = tuple((getattr(cls, guard), next_state) for guard, next_state in transitions)
+
+    @staticmethod
+    def of(cls):
+        machine = StateMachine._machines.get(cls)
+        if machine is None:
+            machine = StateMachine._machines[cls] = StateMachine(cls)
+        return machine
+
+    def follow(self, part, state):
+        '''the state part gets to from state by following the guards that hold'''
+        while True:
+            for guard, next_state in self.transitions.get(state, ()):
+                if guard(part):
+                    state = next_state
+                    break
+            else:
+                return state
+
+
+class PartPool(object):
+    '''
+    Free lists of removed PlantParts, so that short-lived parts like
+    Pollen are used again instead of allocated anew.
+
+        PartPool().attach(world)
+
+    A part removed during a tick is given out again from the next tick
+    on, when nothing is iterating over it any more.  A released part is
+    cut loose from its plant: its vein and params are dropped and the
+    parts that generated it forget it.  It joins the world again under
+    the id it had, set up by PlantPart.reuse() instead of its
+    constructor.
+    '''
+    def __init__(self, max_size=1 << 16):
+        self.world = None
+        self.max_size = max_size
+        # class -> deque of (first tick it can be used in, name in its vein, part)
+        self._free = {}
+
+    def attach(self, world):
+        self.world = world
+        world.part_pool = self
+        return self
+
+    def release(self, part, name):
+        '''keeps part, removed from the vein where it was connected as name'''
+        free = self._free.setdefault(type(part), collections.deque())
+        if len(free) >= self.max_size: return
+        world = self.world
+        free.append((world.ticks + 1 if world.tick_in_progress else world.ticks, name, part))
+        for parts in part._vein._parts.values():
+            for owner in parts:
+                owner.forget(part)
+        part._vein = None
+        part._params = None
+        part.location = None
+
+    def obtain(self, cls, vein, params):
+        '''a removed part of cls set up as cls(vein, params), or None'''
+        free = self._free.get(cls)
+        if not free or free[0][0] > self.world.ticks: return None
+        tick, name, part = free.popleft()
+        part.reuse(name, vein, params)
+        return part
+
+    def __len__(self):
+        return sum(len(free) for free in self._free.values())
+
+
+class Growth(SlotState):
     EVENTS = ['ON_MAXED']
+    __slots__ = ('_target', '_params', '_volume', '_engine', '_slot')
 
     def __init__(self, target, params):
         self._target = target
         self._params = params
-        self.volume = 0.0
-        self.events = EventDispatcher(Growth.EVENTS, observer=target)
+        self._volume = 0.0
+        self._engine = None
+        engine = target.world.growth_engines.get(type(target))
+        if engine: engine.attach(self)
+
+    @property
+    def events(self):
+        # made when needed; the handler table is shared by the target's class
+        return EventDispatcher(Growth.EVENTS, observer=self._target)
+
+    def _get_volume(self):
+        if self._engine: return self._engine.volume_of(self)
+        return self._volume
+
+    def _set_volume(self, volume):
+        if self._engine: self._engine.set_volume_of(self, volume)
+        else: self._volume = volume
+
+    volume = property(_get_volume, _set_volume)
 
     def grow(self):
+        # growths attached to a GrowthEngine are grown by the engine in a batch
+        if self._engine: return
+
         params = self.current_params()
-        if params.growth_volume == 0.0 or self.maxed_out(): return
+        if params.growth_volume == 0.0 or self.maxed_out(params): return
 
         self._target.consume_material(params.consumption_for_growth)
-        self.volume += params.growth_volume
-        if self.maxed_out():
-            self.volume = params.max_volume
-            self.events.trigger(self.events.ON_MAXED)
+        self._volume += params.growth_volume
+        if self.maxed_out(params):
+            self._volume = params.max_volume
+            self.trigger_maxed()
+
+    def trigger_maxed(self):
+        journal = self._target.world.journal
+        if journal: journal.maxed(self._target)
+        aggregates = self._target.world.aggregates
+        if aggregates is not None: aggregates.maxed(self._target)
+        events = self.events
+        events.trigger(events.ON_MAXED)
 
     def current_params(self):
         params = self._params.get(self._target.state(), None)
         if not params: params = self._params['default'] 
         return params
 
-    def maxed_out(self):
-        return self.current_params().has_max_volume and self.volume >= self.current_params().max_volume
+    def maxed_out(self, params=None):
+        if params is None: params = self.current_params()
+        return params.has_max_volume and self.volume >= params.max_volume
+
+    def flow(self):
+        '''the Flow of growing, while it does not max out'''
+        if self._engine: return None
+        if self.idle(): return Flow()
+        return Flow().move(outflow=self.current_params().consumption_for_growth)
+
+    def volume_slope(self):
+        '''how much the volume grows on each tick while nothing happens'''
+        if self.idle(): return 0.0
+        return self.current_params().growth_volume
 
+    def ticks_below(self, volume, limit):
+        '''how many ticks the volume stays below volume, growth of the tick included'''
+        slope = self.volume_slope()
+        return ticks_below_zero(self.volume + slope - volume, slope, 0, limit)
+
+    def quiet_ticks(self, limit):
+        '''how many ticks it grows without maxing out'''
+        params = self.current_params()
+        if self.idle() or not params.has_max_volume: return limit
+        return self.ticks_below(params.max_volume, limit)
+
+    def skip(self, ticks):
+        if self.idle(): return
+        params = self.current_params()
+        self._volume += params.growth_volume * ticks
+        if params.has_max_volume: self._volume = min(self._volume, params.max_volume)
+        if params.consumption_for_growth:
+            self._target.fix_materials(params.consumption_for_growth, ticks)
+
+    def idle(self):
+        '''True if grow() will do nothing until the target changes state'''
+        if self._engine: return True
+        params = self.current_params()
+        return params.growth_volume == 0.0 or self.maxed_out(params)
+
+
+class PlantPartGeneration(SlotState):
+    __slots__ = ('_target', '_params', '_generated', '_count')
 
-class PlantPartGeneration(object):
     def __init__(self, target, params):
         self._target = target
         self._params = params
         self._generated = []
+        # parts forgotten when pooled still count
+        self._count = 0
 
     def tick(self):
         if self.maxed_out(): return
@@ -74,9 +345,22 @@ class PlantPartGeneration(object):
             generated = self._target.generate_part(self._params.part_type)
             generated.consume_material(self._params.source_material)
             self._generated.append(generated)
+            self._count += 1
+
+    def forget(self, part):
+        if part in self._generated: self._generated.remove(part)
 
     def maxed_out(self):
-        return self._params.has_key('max_count') and len(self._generated) >= self._params['max_count']
+        return self._params.has_max_count and self._count >= self._params.max_count
+
+    def quiet_ticks(self, course, limit):
+        '''how many ticks it stays short of materials'''
+        if self.maxed_out(): return limit
+        source = Materials(self._params.source_material)
+        return max([course.ticks_below(name, source[name], limit) for name in Materials.NAMES if source[name] > 0] or [0])
+
+    def short_of_materials(self):
+        return not self.maxed_out() and not self._target._vein.pooled() >= self._params.source_material
 
 
 class ConventionalDict(object):
@@ -90,6 +374,8 @@ class ConventionalDict(object):
         return self._d.get(key)
 
     def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
         if name.startswith('has_'):
             return self._d.has_key(name[len('has_'):])
         return self[name]
@@ -101,7 +387,136 @@ class ConventionalDict(object):
     def has_key(self, key):
         return self._d.has_key(key)
 
+    def keys(self):
+        return self._d.keys()
+
+
+def _compile_parameters(base, d):
+    return base.compile(d)
+
+
+class ParameterNode(object):
+    '''
+    Read-only parameters compiled from a nested dict.
+
+    Each set of keys gets its own slotted class, so values are plain
+    attributes and has_<key> flags are class attributes.  Missing keys
+    read as None and their has_<key> as False, like ConventionalDict.
+    Nested dicts become nested nodes.
+    '''
+    __slots__ = ()
+    _keys = ()
+    _classes = {}
+
+    @classmethod
+    def compile(cls, d):
+        keys = tuple(sorted(d))
+        node_class = cls._class_for(keys)
+        node = object.__new__(node_class)
+        for key in keys:
+            value = d[key]
+            if isinstance(value, dict):
+                value = ParameterNode.compile(value)
+            object.__setattr__(node, key, value)
+        return node
+
+    @classmethod
+    def _class_for(cls, keys):
+        node_class = ParameterNode._classes.get((cls, keys))
+        if node_class: return node_class
+
+        for key in keys:
+            assert isinstance(key, basestring) and re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', key) and not key.startswith('_'), 'bad parameter name %r' % (key,)
+        attributes = {'__slots__': tuple(str(key) for key in keys), '_keys': keys, '_base': cls}
+        for key in keys:
+            if 'has_' + key not in keys:
+                attributes['has_' + str(key)] = True
+        node_class = type(cls.__name__, (cls,), attributes)
+        ParameterNode._classes[(cls, keys)] = node_class
+        return node_class
+
+    def __getattr__(self, name):
+        # only called for keys that are not there
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name.startswith('has_'):
+            return False
+        return None
+
+    def __setattr__(self, name, value):
+        raise AttributeError('parameters are read-only')
+
+    def __getitem__(self, key):
+        if key not in self._keys: return None
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        value = self[key]
+        return value if value else default
+
+    def has_key(self, key):
+        return key in self._keys
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._keys]
+
+    def as_dict(self):
+        return dict((key, value.as_dict() if isinstance(value, ParameterNode) else value) for key, value in self.items())
+
+    def __reduce__(self):
+        return (_compile_parameters, (self._base, self.as_dict()))
+
+    def __repr__(self):
+        return '%s(%r)' % (self._base.__name__, self.as_dict())
+
+
+class PlantParameters(ParameterNode):
+    '''
+    Parameters of a plant, compiled and checked once when they are made.
+
+        params = PlantParameters({'seed': {...}, 'root': {...}})
+        params.root.growth.default.max_volume
+    '''
+    __slots__ = ()
+
+    def __new__(cls, params):
+        if isinstance(params, ParameterNode):
+            params = params.as_dict()
+        node = cls.compile(params)
+        node.validate()
+        return node
 
-class PlantParameters(ConventionalDict):
     def __init__(self, params):
-        super(PlantParameters, self).__init__(params)
+        pass
+
+    def validate(self):
+        for name in ['root', 'stem', 'leaves', 'flower', 'egg']:
+            part = self[name]
+            if part and part.has_growth:
+                for state, growth in part.growth.items():
+                    _validate_growth('%s.growth.%s' % (name, state), growth)
+        if self.has_flower and self.flower.has_generation:
+            for name, generation in self.flower.generation.items():
+                _validate_generation('flower.generation.%s' % name, generation)
+        if self.has_pollen and self.pollen.has_drift:
+            assert len(self.pollen.drift) == 2, 'pollen.drift must be (dx, dy)'
+
+
+def _validate_growth(path, growth):
+    assert isinstance(growth, ParameterNode), '%s must be a dict' % path
+    assert isinstance(growth.growth_volume, (int, long, float)), '%s.growth_volume must be a number' % path
+    if growth.has_max_volume:
+        assert isinstance(growth.max_volume, (int, long, float)), '%s.max_volume must be a number' % path
+    if growth.has_consumption_for_growth:
+        assert isinstance(growth.consumption_for_growth, Materials), '%s.consumption_for_growth must be Materials' % path
+
+
+def _validate_generation(path, generation):
+    assert isinstance(generation, ParameterNode), '%s must be a dict' % path
+    assert isinstance(generation.part_type, type), '%s.part_type must be a class' % path
+    assert isinstance(generation.source_material, Materials), '%s.source_material must be Materials' % path
+    if generation.has_max_count:
+        assert isinstance(generation.max_count, (int, long)), '%s.max_count must be an integer' % path
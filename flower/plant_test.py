@@ -18,3 +18,120 @@ class ConventionalDictTest(unittest.TestCase):
         assert_that(d.has_key('key1'), is_(True))
         assert_that(d.has_key('key2'), is_(False))
 
+
+
+class PlantParametersTest(unittest.TestCase):
+    def setUp(self):
+        self.params = PlantParameters({
+            'seed': {'water_for_seed': 10},
+            'root': {
+                'take_in_per_volume': Materials({'water': 10.0}),
+                'growth': {
+                    'default': {
+                        'max_volume': 2.0,
+                        'consumption_for_growth': Materials({'kledis': 1.0}),
+                        'growth_volume': 0.1,
+                    }
+                },
+            },
+        })
+
+    def test_attribute_and_dict_access(self):
+        assert_that(self.params.seed.water_for_seed, is_(10))
+        assert_that(self.params['root']['take_in_per_volume'], equal_to(Materials({'water': 10.0})))
+        assert_that(self.params.root.growth.get('no such state', None), is_(None))
+        assert_that(self.params.root.growth['default'].max_volume, is_(2.0))
+        assert_that(self.params.no_such_key, is_(None))
+        assert_that(self.params['no_such_key'], is_(None))
+
+    def test_has_predicate(self):
+        assert_that(self.params.has_seed, is_(True))
+        assert_that(self.params.has_stem, is_(False))
+        assert_that(self.params.root.growth.default.has_max_volume, is_(True))
+        assert_that(self.params.has_key('root'), is_(True))
+        assert_that(self.params.has_key('stem'), is_(False))
+        assert_that(sorted(self.params.keys()), is_(['root', 'seed']))
+
+    def test_read_only(self):
+        try:
+            self.params.seed = None
+            self.fail('parameters must be read-only')
+        except AttributeError:
+            pass
+        assert_that(self.params.seed.water_for_seed, is_(10))
+
+    def test_same_keys_share_a_class(self):
+        other = PlantParameters({'seed': {'water_for_seed': 20}})
+        assert_that(type(other.seed) is type(self.params.seed), is_(True))
+        assert_that(isinstance(other, PlantParameters), is_(True))
+
+    def test_pickle(self):
+        import pickle
+        copied = pickle.loads(pickle.dumps(self.params, 2))
+        assert_that(copied.root.growth.default.consumption_for_growth, equal_to(Materials({'kledis': 1.0})))
+        assert_that(isinstance(copied, PlantParameters), is_(True))
+
+    def test_validation(self):
+        for params in [
+            {'root': {'growth': {'default': {'growth_volume': 'fast'}}}},
+            {'egg': {'growth': {'to_ripe': {'growth_volume': 1.0, 'consumption_for_growth': 1.0}}}},
+            {'flower': {'generation': {'pollen': {'part_type': 'Pollen', 'source_material': Materials()}}}},
+            {'flower': {'generation': {'pollen': {'part_type': object, 'source_material': Materials(), 'max_count': 1.5}}}},
+            {'seed': {'bad-name': 1}},
+        ]:
+            try:
+                PlantParameters(params)
+                self.fail('%r must be rejected' % (params,))
+            except AssertionError:
+                pass
+
+
+class StateMachineTest(unittest.TestCase):
+    class Bud(PlantPart):
+        STATES = [
+            ('closed', 'tick_closed', [('warm', 'open')]),
+            ('open', None, [('old', 'wilted')]),
+            ('wilted', None, []),
+        ]
+
+        def __init__(self, vein):
+            super(StateMachineTest.Bud, self).__init__('bud', vein, None)
+            self.ticked = 0
+            self.temperature = 0
+            self.age = 0
+
+        def tick_closed(self):
+            self.ticked += 1
+
+        def warm(self):
+            return self.temperature > 10
+
+        def old(self):
+            return self.age > 5
+
+    def setUp(self):
+        World.reset()
+        self.bud = StateMachineTest.Bud(Vein())
+
+    def test_ticks_by_state(self):
+        self.bud.tick()
+        assert_that(self.bud.ticked, is_(1))
+        self.bud.temperature = 20
+        self.bud.update_state()
+        self.bud.tick()
+        assert_that(self.bud.ticked, is_(1), 'no handler when open')
+
+    def test_follows_guards_until_none_holds(self):
+        assert_that(self.bud.state(), is_('closed'))
+        self.bud.temperature = 20
+        self.bud.age = 10
+        self.bud.update_state()
+        assert_that(self.bud.state(), is_('wilted'))
+
+    def test_compiled_once_per_class(self):
+        assert_that(StateMachine.of(StateMachineTest.Bud), is_(StateMachine.of(StateMachineTest.Bud)))
+
+    def test_next_states_must_be_declared(self):
+        class Broken(PlantPart):
+            STATES = [('a', None, [('tick', 'b')])]
+        self.assertRaises(AssertionError, StateMachine.of, Broken)
@@ -0,0 +1,104 @@
+# coding: utf-8
+'''
+Finds where tick time goes.
+
+    profiler = TickProfiler().attach(world)
+    ...
+    print profiler.report()
+    profiler.export('profile.json')
+    profiler.detach()
+
+While attached, World.tick times every entity tick by entity class and
+every event handler of the world by event and observer class, deferred
+ones included.  A detached world only pays for one None check per
+tick.
+'''
+
+import json
+import timeit
+
+timer = timeit.default_timer
+
+
+class _Stats(object):
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'seconds': self.seconds}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values: return None
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class TickProfiler(object):
+    def __init__(self):
+        self.entities = {}
+        self.handlers = {}
+        self.tick_seconds = []
+        self.world = None
+
+    def attach(self, world):
+        self.world = world
+        world.profiler = self
+        world.event_monitor = self
+        return self
+
+    def detach(self):
+        self.world.profiler = None
+        self.world.event_monitor = None
+        self.world = None
+
+    def _stats(self, table, key):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = _Stats()
+        return stats
+
+    def tick_entities(self, entities, dispatch_queued):
+        # entity times include the handlers they trigger; deferred
+        # handlers count in the tick but not in any entity
+        started = timer()
+        try:
+            for e in entities:
+                entity_started = timer()
+                e.tick()
+                stats = self._stats(self.entities, type(e).__name__)
+                stats.calls += 1
+                stats.seconds += timer() - entity_started
+            dispatch_queued()
+        finally:
+            self.tick_seconds.append(timer() - started)
+
+    def call_handler(self, event, handler):
+        started = timer()
+        try:
+            handler()
+        finally:
+            observer = type(getattr(handler, 'im_self', None)).__name__
+            stats = self._stats(self.handlers, '%s.%s' % (observer, event))
+            stats.calls += 1
+            stats.seconds += timer() - started
+
+    def report(self):
+        ticks = sorted(self.tick_seconds)
+        return {
+            'ticks': len(ticks),
+            'tick_seconds': {
+                'total': sum(ticks),
+                'p50': percentile(ticks, 0.5),
+                'p90': percentile(ticks, 0.9),
+                'p99': percentile(ticks, 0.99),
+                'max': ticks[-1] if ticks else None,
+            },
+            'entities': dict((name, stats.as_dict()) for name, stats in self.entities.items()),
+            'handlers': dict((name, stats.as_dict()) for name, stats in self.handlers.items()),
+        }
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+from profiler import *
+
+
+class TickProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.flower = Flower(Vein(), Params.plant_parameters('flower', 'egg'))
+        self.flower.take_in_from_environment({'kledis': 20.0})
+
+    def test_counts_ticks_by_class(self):
+        profiler = TickProfiler().attach(self.world)
+        tickn(10)
+        report = profiler.report()
+        assert_that(report['ticks'], is_(10))
+        assert_that(report['entities']['Flower']['calls'], is_(10))
+        assert_that(report['entities']['Egg']['calls'], is_(9))
+        assert_that(report['entities']['Pollen']['calls'], is_(45))
+        assert_that(report['handlers']['Egg.ON_MAXED']['calls'], is_(1))
+        assert_that(report['tick_seconds']['p50'], less_than_or_equal_to(report['tick_seconds']['max']))
+        assert_that(EventDispatcher.monitor, is_(None))
+
+    def test_times_deferred_handlers(self):
+        self.world.defer_events = True
+        profiler = TickProfiler().attach(self.world)
+        tickn(10)
+        assert_that(profiler.report()['handlers']['Egg.ON_MAXED']['calls'], is_(1))
+
+    def test_detach(self):
+        profiler = TickProfiler().attach(self.world)
+        tickn(2)
+        profiler.detach()
+        tickn(2)
+        assert_that(self.world.profiler, is_(None))
+        assert_that(profiler.report()['ticks'], is_(2))
+
+    def test_export(self):
+        profiler = TickProfiler().attach(self.world)
+        tickn(3)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            profiler.export(path)
+            with open(path) as f:
+                assert_that(json.load(f)['entities']['Flower']['calls'], is_(3))
+        finally:
+            os.remove(path)
@@ -0,0 +1,167 @@
+# coding: utf-8
+'''
+Records per-tick trajectories of chosen parts into fixed size buffers.
+
+    recorder = Recorder(world, roots, metrics=['pooled', 'volume'], every=10)
+    for i in xrange(1000):
+        world.tick()
+    columns = recorder.columns()
+    columns['volume'][-1]    # the volume of each root at the last sample
+
+Metrics are sampled after every every-th tick into preallocated arrays
+with a row per sample and a column per subject:
+
+    tick      the tick the sample was taken after
+    pooled    what the subject's vein has pooled, one value per material
+    volume    the volume of the subject's Growth, nan if it has none
+    blooming  whether the subject is a blooming Flower
+
+Without a prefix the buffers are rings holding the last capacity
+samples.  With a prefix a full buffer is appended to a file per metric,
+<prefix>.<metric>, so memory stays at capacity rows however long the
+run; read(prefix) loads them back and export() writes them into one
+.npz file.  A stretch skipped by World.advance() is sampled once, at
+its end, if a sample fell due in it.
+
+Volumes of Growths grown by a GrowthEngine are taken straight from
+the engine's arrays into scratch arrays made up front; where each
+subject sits in them is looked up again only after the engine has moved
+its growths.  The other values are streamed into one array per metric
+with numpy.fromiter, without building Python lists.
+'''
+
+import itertools
+import json
+
+import numpy
+
+from soil import *
+
+# metric -> (shape of a value, dtype)
+METRICS = {
+    'tick': ((), numpy.int64),
+    'pooled': ((len(Materials.NAMES),), numpy.float64),
+    'volume': ((), numpy.float64),
+    'blooming': ((), numpy.bool_),
+}
+
+
+class Recorder(WorldListener):
+    def __init__(self, world, subjects, metrics=('pooled', 'volume', 'blooming'), capacity=1024, every=1, prefix=None):
+        for name in metrics:
+            assert name in METRICS and name != 'tick', 'unknown metric %r' % name
+        self.world = world
+        self.subjects = list(subjects)
+        self.metrics = ['tick'] + list(metrics)
+        self.capacity = capacity
+        self.every = every
+        self.prefix = prefix
+        self.buffers = {}
+        for name in self.metrics:
+            shape, dtype = METRICS[name]
+            if name != 'tick': shape = (len(self.subjects),) + shape
+            self.buffers[name] = numpy.zeros((capacity,) + shape, dtype=dtype)
+        self._row = 0
+        self._wrapped = False
+        self._next_sample = (world.ticks // every + 1) * every
+        self._pooled = [e._vein.pooled() for e in self.subjects]
+        self._growths = [getattr(e, 'growth', None) for e in self.subjects]
+        self._volume_layout = None
+        self._blooming = numpy.array([i for i, e in enumerate(self.subjects) if hasattr(e, 'is_blooming')], dtype=numpy.intp)
+        self._flowers = [self.subjects[i] for i in self._blooming]
+        if prefix is not None:
+            with open(prefix + '.meta', 'w') as f:
+                json.dump({'subjects': [e.id for e in self.subjects], 'metrics': self.metrics}, f)
+            for name in self.metrics:
+                open('%s.%s' % (prefix, name), 'wb').close()
+        world.listen(self)
+
+    def tick_ended(self, world):
+        if world.ticks >= self._next_sample:
+            self.sample()
+            self._next_sample = (world.ticks // self.every + 1) * self.every
+
+    def sample(self):
+        row = self._row
+        buffers = self.buffers
+        buffers['tick'][row] = self.world.ticks
+        if 'pooled' in buffers:
+            pooled = buffers['pooled'][row]
+            pooled.reshape(-1)[:] = numpy.fromiter(itertools.chain.from_iterable(materials._values for materials in self._pooled), numpy.float64, pooled.size)
+        if 'volume' in buffers:
+            self._sample_volume(buffers['volume'][row])
+        if 'blooming' in buffers:
+            blooming = buffers['blooming'][row]
+            blooming[:] = False
+            blooming[self._blooming] = numpy.fromiter((e.is_blooming for e in self._flowers), numpy.bool_, len(self._flowers))
+        self._row += 1
+        if self._row == self.capacity:
+            if self.prefix is not None:
+                self.flush()
+            else:
+                self._row = 0
+                self._wrapped = True
+
+    def _sample_volume(self, volume):
+        layout = self._volume_layout
+        if layout is None or any(engine._moved != moved for engine, moved, columns, slots, scratch in layout[0]):
+            layout = self._volume_layout = self._layout_volume()
+        engines, columns, growths = layout
+        volume[:] = numpy.nan
+        for engine, moved, engine_columns, slots, scratch in engines:
+            volume[engine_columns] = numpy.take(engine._volume, slots, out=scratch)
+        volume[columns] = numpy.fromiter((growth.volume for growth in growths), numpy.float64, len(growths))
+
+    def _layout_volume(self):
+        '''the engine slots of the subjects' Growths, and the Growths grown on their own'''
+        by_engine = {}
+        columns = []
+        growths = []
+        for column, growth in enumerate(self._growths):
+            if growth is None: continue
+            if growth._engine is None:
+                columns.append(column)
+                growths.append(growth)
+            else:
+                engine_columns, slots = by_engine.setdefault(growth._engine, ([], []))
+                engine_columns.append(column)
+                slots.append(growth._slot)
+        engines = [(engine, engine._moved, numpy.array(engine_columns, dtype=numpy.intp), numpy.array(slots, dtype=numpy.intp), numpy.zeros(len(slots)))
+                   for engine, (engine_columns, slots) in by_engine.items()]
+        return engines, numpy.array(columns, dtype=numpy.intp), growths
+
+    def flush(self):
+        '''appends the buffered samples to the files and empties the buffers'''
+        assert self.prefix is not None, 'a recorder without a prefix keeps its samples in memory'
+        for name in self.metrics:
+            with open('%s.%s' % (self.prefix, name), 'ab') as f:
+                self.buffers[name][:self._row].tofile(f)
+        self._row = 0
+
+    def columns(self):
+        '''the samples in memory, oldest first, as arrays by metric'''
+        if not self._wrapped:
+            return dict((name, buffer[:self._row].copy()) for name, buffer in self.buffers.items())
+        return dict((name, numpy.concatenate([buffer[self._row:], buffer[:self._row]])) for name, buffer in self.buffers.items())
+
+    def close(self):
+        if self.prefix is not None: self.flush()
+        self.world.listeners.remove(self)
+
+
+def read(prefix):
+    '''the samples written by a Recorder with prefix, as arrays by metric'''
+    with open(prefix + '.meta') as f:
+        meta = json.load(f)
+    columns = {}
+    for name in meta['metrics']:
+        shape, dtype = METRICS[name]
+        if name != 'tick': shape = (len(meta['subjects']),) + shape
+        columns[name] = numpy.fromfile('%s.%s' % (prefix, name), dtype=dtype).reshape((-1,) + shape)
+    columns['subjects'] = numpy.array(meta['subjects'], dtype=numpy.int64)
+    return columns
+
+
+def export(prefix, path):
+    '''writes the samples of prefix into one .npz file'''
+    numpy.savez(path, **read(prefix))
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hamcrest import *
+
+import numpy
+
+from designed_plant import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+from growth_engine import *
+from recorder import *
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.flower = Flower(Vein(), Params.plant_parameters('flower', 'egg'))
+        self.flower.take_in_from_environment({'kledis': 21.0})
+        tickn(2)
+        self.egg = self.flower._vein.part('egg')[0]
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_samples_every_tick(self):
+        rec = Recorder(self.world, [self.flower, self.egg])
+        volumes = []
+        for i in range(3):
+            tickn()
+            volumes.append(self.egg.growth.volume)
+        columns = rec.columns()
+        assert_that(list(columns['tick']), is_([3, 4, 5]))
+        assert_that(list(columns['volume'][:, 1]), is_(volumes))
+        assert_that(numpy.isnan(columns['volume'][0, 0]), is_(True), 'flowers do not grow')
+        assert_that(columns['pooled'][-1, 0, 0], is_(self.flower._vein.pooled()['kledis']))
+
+    def test_reads_volumes_from_engines(self):
+        world = World.reset()
+        GrowthEngine.install(Stem)
+        params = Params.plant_parameters('stem', 'leaves')
+        stems = []
+        for i in range(3):
+            stem = Stem(Vein(), params)
+            stem.take_in_from_environment({'kledis': 30.0, 'heplon': 100.0})
+            stem.growth.volume = -0.2
+            stems.append(stem)
+        rec = Recorder(world, stems, metrics=['volume'])
+        tickn()
+        stems[0].remove()
+        tickn()
+        columns = rec.columns()
+        assert_that(list(columns['volume'][-1]), is_([stem.growth.volume for stem in stems]))
+        assert_that(columns['volume'][-1, 0], is_(columns['volume'][0, 0]), 'a removed stem stops growing')
+        assert_that(columns['volume'][-1, 2], greater_than(columns['volume'][0, 2]))
+
+    def test_ring_keeps_the_last_samples(self):
+        rec = Recorder(self.world, [self.flower], metrics=['blooming'], capacity=4, every=2)
+        tickn(10)
+        columns = rec.columns()
+        assert_that(list(columns['tick']), is_([6, 8, 10, 12]))
+        assert_that(columns['blooming'][-1, 0], is_(True))
+
+    def test_streams_to_files(self):
+        prefix = os.path.join(self.directory, 'run')
+        rec = Recorder(self.world, [self.flower, self.egg], capacity=3, prefix=prefix)
+        tickn(7)
+        assert_that(len(rec.columns()['tick']), is_(1), 'the rest is on disk')
+        rec.close()
+        columns = read(prefix)
+        assert_that(list(columns['tick']), is_(range(3, 10)))
+        assert_that(columns['pooled'].shape, is_((7, 2, len(Materials.NAMES))))
+        assert_that(list(columns['subjects']), is_([self.flower.id, self.egg.id]))
+
+        path = os.path.join(self.directory, 'run.npz')
+        export(prefix, path)
+        assert_that(list(numpy.load(path)['tick']), is_(range(3, 10)))
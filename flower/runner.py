@@ -0,0 +1,57 @@
+# coding: utf-8
+'''
+Runs many independent Worlds, e.g. PlantParameters variants, on a
+process pool.
+
+    def build(params):
+        Seed({'kledis': 100.0}, PlantParameters(params))
+
+    summaries = run_batch(build, [params1, params2], ticks=1000)
+
+build() is called in the worker with a fresh current World and must be
+picklable, i.e. a module level function.
+'''
+
+import multiprocessing
+import time
+
+from soil import *
+
+
+def summarize(world):
+    counts = {}
+    for e in world.entities:
+        name = type(e).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return {'entities': len(world.entities), 'counts': counts}
+
+
+def run_world(build, variant, ticks, summarize=summarize):
+    previous = World.current()
+    world = World().activate()
+    try:
+        build(variant)
+        started = time.time()
+        for i in xrange(ticks):
+            world.tick()
+    finally:
+        previous.activate()
+    summary = summarize(world)
+    summary['ticks'] = ticks
+    summary['seconds'] = time.time() - started
+    return summary
+
+
+def _run_job(job):
+    return run_world(*job)
+
+
+def run_batch(build, variants, ticks, processes=None, summarize=summarize):
+    '''returns summaries in the order of variants'''
+    jobs = [(build, variant, ticks, summarize) for variant in variants]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_run_job, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,32 @@
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from runner import *
+
+
+def build(water_for_seed):
+    seed = dict(Params.seed)
+    seed['water_for_seed'] = water_for_seed
+    Seed({'kledis': 100.0}, Params.plant_parameters('root', 'stem', 'leaves', seed=seed))
+
+
+class RunnerTest(unittest.TestCase):
+    def test_run_world(self):
+        summary = run_world(build, 10, ticks=10)
+        assert_that(summary['ticks'], is_(10))
+        assert_that(summary['counts'], is_({'Seed': 1, 'Root': 1}))
+
+    def test_run_world_does_not_touch_current_world(self):
+        world = World.reset()
+        run_world(build, 10, ticks=10)
+        assert_that(World.current(), is_(world))
+        assert_that(len(world.entities), is_(0))
+
+    def test_run_batch(self):
+        variants = [1, 10, 50]
+        summaries = run_batch(build, variants, ticks=10, processes=2)
+        expected = [run_world(build, variant, ticks=10) for variant in variants]
+        assert_that([s['counts'] for s in summaries], is_([s['counts'] for s in expected]))
+        assert_that(summaries[0]['counts'], is_({'Seed': 1}))
@@ -0,0 +1,231 @@
+# coding: utf-8
+'''
+Ticks only the entities that have something to do, when it is their
+turn.
+
+    Scheduler().attach(world)
+
+An entity calls sleep() when its tick would do nothing, and stays out
+of World.tick until something calls its wake().  sleep_for(n) wakes it
+again n ticks later.  PlantParts can also wait_for_materials(), which
+wakes them when materials flow into their Vein.
+
+An entity whose tick_period is n ticks once every n ticks, starting
+with the first tick after it joins the world.  Its tick() should do n
+ticks' worth of work.  Timed entities wait in a TimerWheel, so a tick
+only costs the entities due on it.  A world without a scheduler ticks
+periodic entities on the same ticks, but ignores sleeping and walks
+all of its entities on every tick.
+
+Due entities tick in id order, which is the order they were created
+in.  An entity woken during a tick ticks in the same tick if its turn
+has not passed yet, so results do not depend on who sleeps.
+'''
+
+import bisect
+
+from soil import *
+
+
+class TimerWheel(object):
+    '''
+    Hierarchical timing wheel of items keyed by the tick they are due.
+
+    Level 0 has a slot for each of the next SLOTS ticks, level 1 a slot
+    for each of the next SLOTS blocks of SLOTS ticks, and so on.  Items
+    move down a level when their block comes up, so inserting is O(1)
+    and a tick only looks at the items due on it.
+
+    >>> wheel = TimerWheel()
+    >>> wheel.insert(3, 'a'); wheel.insert(200, 'b'); wheel.insert(3, 'c')
+    >>> wheel.advance(3)
+    ['a', 'c']
+    >>> wheel.advance(199)
+    []
+    >>> wheel.advance(200)
+    ['b']
+    '''
+    BITS = 6
+    SLOTS = 1 << BITS
+    MASK = SLOTS - 1
+    LEVELS = 4
+
+    def __init__(self, now=0):
+        # the first tick not collected yet
+        self._now = now
+        self._wheels = [[[] for i in xrange(TimerWheel.SLOTS)] for level in xrange(TimerWheel.LEVELS)]
+        self._overflow = []
+        self._count = 0
+
+    def now(self):
+        return self._now
+
+    def insert(self, due, item):
+        assert due >= self._now, 'tick %d has passed' % due
+        self._place(due, item, self._now)
+        self._count += 1
+
+    def _place(self, due, item, now):
+        delta = due - now
+        for level in xrange(TimerWheel.LEVELS):
+            if delta < 1 << (TimerWheel.BITS * (level + 1)):
+                self._wheels[level][(due >> (TimerWheel.BITS * level)) & TimerWheel.MASK].append((due, item))
+                return
+        self._overflow.append((due, item))
+
+    def advance(self, now):
+        '''returns the items due on the ticks up to now'''
+        fired = []
+        t = self._now
+        while t <= now and self._count:
+            self._cascade(t)
+            slot = self._wheels[0][t & TimerWheel.MASK]
+            if slot:
+                fired.extend(item for due, item in slot)
+                self._count -= len(slot)
+                del slot[:]
+            t = self._next_tick(t)
+        self._now = max(self._now, now + 1)
+        return fired
+
+    def _next_tick(self, t):
+        '''the first tick after t that can have anything to do'''
+        for level in xrange(TimerWheel.LEVELS):
+            if any(self._wheels[level]):
+                if level == 0: return t + 1
+                break
+        else:
+            level = TimerWheel.LEVELS
+        step = 1 << (TimerWheel.BITS * level)
+        return (t // step + 1) * step
+
+    def _cascade(self, t):
+        if t & TimerWheel.MASK: return
+        if self._overflow and t % (1 << (TimerWheel.BITS * TimerWheel.LEVELS)) == 0:
+            overflow = self._overflow
+            self._overflow = []
+            for due, item in overflow:
+                self._place(due, item, t)
+        for level in xrange(TimerWheel.LEVELS - 1, 0, -1):
+            if t & ((1 << (TimerWheel.BITS * level)) - 1): continue
+            slot = self._wheels[level][(t >> (TimerWheel.BITS * level)) & TimerWheel.MASK]
+            entries = list(slot)
+            del slot[:]
+            for due, item in entries:
+                self._place(due, item, t)
+
+    def __len__(self):
+        return self._count
+
+
+class Scheduler(WorldListener):
+    def __init__(self):
+        self.world = None
+        self._awake = set()
+        # entities ticking every tick_period ticks
+        self._periodic = set()
+        # id -> the tick an entity is due on next, periodic or sleeping
+        self._timers = {}
+        self._wheel = None
+        self._now = None
+        self._due = None
+        self._cursor = None
+        # ids of the entities due on the last tick
+        self.ticked = []
+
+    def attach(self, world):
+        self.world = world
+        world.scheduler = self
+        world.listen(self)
+        # the scheduler keeps the periods from now on
+        world._periodic.clear()
+        self._wheel = TimerWheel(world.ticks)
+        for e in world.entities:
+            self._start(e, world.ticks)
+        return self
+
+    def entity_added(self, entity):
+        self._start(entity, self._wheel.now())
+
+    def entity_removed(self, entity):
+        self._stop(entity)
+
+    def _start(self, entity, due):
+        if entity.tick_period == 1:
+            self._awake.add(entity.id)
+        else:
+            self._periodic.add(entity.id)
+            self._set_timer(entity.id, due)
+
+    def _stop(self, entity):
+        self._awake.discard(entity.id)
+        self._periodic.discard(entity.id)
+        self._timers.pop(entity.id, None)
+
+    def _set_timer(self, entity_id, due):
+        self._timers[entity_id] = due
+        # the wheel has already given out this tick
+        if due == self._now: return
+        self._wheel.insert(due, entity_id)
+
+    def sleep(self, entity):
+        self._stop(entity)
+
+    def sleep_until(self, entity, tick):
+        self._stop(entity)
+        self._set_timer(entity.id, max(tick, self._wheel.now()))
+
+    def wake(self, entity):
+        entity_id = entity.id
+        if entity_id in self._awake or entity_id in self._periodic: return
+        if entity not in self.world.entities: return
+        self._timers.pop(entity_id, None)
+        if self._due is not None and entity_id > self._cursor:
+            self._start(entity, self._now)
+            bisect.insort(self._due, entity_id)
+        else:
+            self._start(entity, self._wheel.now())
+
+    def period_changed(self, entity):
+        if not self.is_awake(entity): return
+        self._stop(entity)
+        self._start(entity, self._wheel.now())
+
+    def is_awake(self, entity):
+        return entity.id in self._awake or entity.id in self._periodic
+
+    def __len__(self):
+        return len(self._awake) + len(self._periodic)
+
+    def _is_due(self, entity_id):
+        return entity_id in self._awake or self._timers.get(entity_id) == self._now
+
+    def due(self):
+        '''yields the entities to tick this tick'''
+        now = self._now = self.world.ticks
+        due = set(self._awake)
+        for entity_id in self._wheel.advance(now):
+            # timers are not taken out of the wheel when they are cancelled
+            if self._timers.get(entity_id) != now: continue
+            if entity_id not in self._periodic:
+                del self._timers[entity_id]
+                self._start(self.world.entities.get(entity_id), now)
+            due.add(entity_id)
+        self._due = self.ticked = sorted(due)
+        self._cursor = -1
+        try:
+            i = 0
+            while i < len(self._due):
+                entity_id = self._due[i]
+                i += 1
+                # slept since the tick started, or woken twice before its turn
+                if entity_id == self._cursor or not self._is_due(entity_id): continue
+                self._cursor = entity_id
+                entity = self.world.entities.get(entity_id)
+                yield entity
+                if entity_id in self._periodic and self._timers.get(entity_id) == now:
+                    self._set_timer(entity_id, now + entity.tick_period)
+        finally:
+            self._now = None
+            self._due = None
+            self._cursor = None
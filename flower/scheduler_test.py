@@ -0,0 +1,190 @@
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+from scheduler import *
+
+
+class Counter(WorldEntity):
+    def __init__(self, log):
+        super(Counter, self).__init__()
+        self.log = log
+        self.wakes = []
+
+    def tick(self):
+        self.log.append(self.id)
+        for e in self.wakes:
+            e.wake()
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.log = []
+        self.entities = [Counter(self.log) for i in range(3)]
+        self.scheduler = Scheduler().attach(self.world)
+
+    def test_ticks_awake_entities_only(self):
+        self.entities[1].sleep()
+        tickn()
+        assert_that(self.log, is_([0, 2]))
+        assert_that(len(self.scheduler), is_(2))
+
+        self.entities[1].wake()
+        tickn()
+        assert_that(self.log, is_([0, 2, 0, 1, 2]))
+
+    def test_woken_ahead_of_its_turn_ticks_in_the_same_tick(self):
+        self.entities[0].sleep()
+        self.entities[2].sleep()
+        self.entities[1].wakes = [self.entities[0], self.entities[2]]
+        tickn()
+        assert_that(self.log, is_([1, 2]), 'entity 0 has had its turn')
+        del self.log[:]
+        tickn()
+        assert_that(self.log, is_([0, 1, 2]))
+
+    def test_woken_twice_ticks_once(self):
+        self.entities[0].wakes = [self.entities[2]]
+        self.entities[1].wakes = [self.entities[2]]
+        self.entities[2].sleep()
+        tickn()
+        assert_that(self.log, is_([0, 1, 2]))
+
+    def test_new_entities_are_awake(self):
+        Counter(self.log)
+        tickn()
+        assert_that(self.log, is_([0, 1, 2, 3]))
+
+    def test_sleep_without_scheduler_is_ignored(self):
+        world = World.reset()
+        log = []
+        counter = Counter(log)
+        counter.sleep()
+        world.tick()
+        assert_that(log, is_([counter.id]))
+
+
+class TimerWheelTest(unittest.TestCase):
+    def test_gives_items_on_their_tick(self):
+        import random
+        rng = random.Random(1)
+        wheel = TimerWheel()
+        expected = {}
+        now = 0
+        for i in range(2000):
+            due = now + rng.choice([0, 1, 63, 64, 65, 4095, 4096, 300000, 20000000]) + rng.randint(0, 3)
+            wheel.insert(due, i)
+            expected.setdefault(due, []).append(i)
+            step = rng.randint(0, 5)
+            for t in range(now, now + step):
+                assert_that(sorted(wheel.advance(t)), is_(expected.pop(t, [])))
+            now += step
+        for t in sorted(expected):
+            assert_that(sorted(wheel.advance(t)), is_(expected[t]))
+        assert_that(len(wheel), is_(0))
+
+
+class PeriodicTest(unittest.TestCase):
+    class Slow(Counter):
+        tick_period = 3
+
+    def setUp(self):
+        self.world = World.reset()
+        self.log = []
+        self.fast = Counter(self.log)
+        self.slow = PeriodicTest.Slow(self.log)
+        self.scheduler = Scheduler().attach(self.world)
+        self.history = []
+
+    def tick_and_log(self, n):
+        for i in range(n):
+            del self.log[:]
+            tickn()
+            self.history.append(list(self.log))
+
+    def test_ticks_every_period(self):
+        self.tick_and_log(7)
+        assert_that(self.history, is_([[0, 1], [0], [0], [0, 1], [0], [0], [0, 1]]))
+
+    def test_sleep_for(self):
+        self.fast.sleep_for(2)
+        self.tick_and_log(3)
+        assert_that(self.history, is_([[1], [], [0]]))
+
+    def test_set_tick_period(self):
+        self.fast.set_tick_period(2)
+        self.slow.set_tick_period(1)
+        self.tick_and_log(4)
+        assert_that(self.history, is_([[0, 1], [1], [0, 1], [1]]))
+
+    def test_woken_early(self):
+        self.fast.sleep_for(100)
+        self.tick_and_log(1)
+        self.fast.wake()
+        self.tick_and_log(1)
+        assert_that(self.history, is_([[1], [0]]))
+
+    def test_same_periods_without_scheduler(self):
+        self.fast.set_tick_period(2)
+        self.tick_and_log(2)
+        scheduled = self.history
+
+        self.world = World.reset()
+        self.fast = Counter(self.log)
+        PeriodicTest.Slow(self.log)
+        self.history = []
+        self.fast.set_tick_period(2)
+        self.tick_and_log(2)
+        self.fast.set_tick_period(1)
+        self.tick_and_log(5)
+        assert_that(self.history[:2], is_(scheduled))
+        assert_that(self.history, is_([[0, 1], [], [0], [0, 1], [0], [0], [0, 1]]))
+
+
+    def test_periods_across_advance_without_scheduler(self):
+        self.world = World.reset()
+        PeriodicTest.Slow(self.log)
+        self.world.advance(7)
+        assert_that(self.log, is_([0, 0, 0]))
+        # a due tick left behind is taken on the next tick
+        self.world._periodic[0] = self.world.ticks - 2
+        self.tick_and_log(4)
+        assert_that(self.history, is_([[0], [], [], [0]]))
+
+class WaitForMaterialsTest(unittest.TestCase):
+    def setUp(self):
+        self.world = World.reset()
+        self.scheduler = Scheduler().attach(self.world)
+        self.flower = Flower(Vein(), Params.plant_parameters('flower', 'egg'))
+
+    def test_flower_waits_for_kledis(self):
+        tickn()
+        assert_that(self.scheduler.is_awake(self.flower), is_(False))
+        self.flower.take_in_from_environment({'kledis': 1.0})
+        assert_that(self.scheduler.is_awake(self.flower), is_(True))
+        tickn()
+        assert_that(self.flower._vein.part('pollen'), has_length(1))
+
+
+def grow_flower(scheduled):
+    world = World.reset()
+    if scheduled: Scheduler().attach(world)
+    seed = Seed({'kledis': 1000.0}, Params.plant_parameters())
+    flower = seed.generate_part(Flower)
+    flower.take_in_from_environment({'kledis': 25.0})
+    tickn(10)
+    ReproducingRule().mate(flower._vein.part('egg')[0], flower._vein.part('pollen')[0])
+    tickn(15)
+    return world, seed
+
+
+class ScheduledWorldTest(unittest.TestCase):
+    def test_same_results_as_ticking_everyone(self):
+        world, seed = grow_flower(scheduled=True)
+        expected_world, expected_seed = grow_flower(scheduled=False)
+        assert_that(seed._vein.pooled(), equal_to(expected_seed._vein.pooled()))
+        assert_that([type(e).__name__ for e in world.entities], is_([type(e).__name__ for e in expected_world.entities]))
+        assert_that(len(world.scheduler), less_than(len(world.entities)))
@@ -0,0 +1,347 @@
+# coding: utf-8
+'''
+Runs a World in real time and streams what happens to clients.
+
+    server = Server(world, 'flower.sock', rate=10, planter=plant_seed)
+    server.serve_forever()
+
+or from the command line
+
+    python server.py flower.sock --rate 10
+
+Clients connect to the local socket and talk in lines of JSON.  They
+send commands:
+
+    {"command": "subscribe"}
+    {"command": "unsubscribe"}
+    {"command": "plant", "contents": {"kledis": 100.0}}
+
+and subscribers get a line after every tick with what changed in it:
+
+    {"tick": 12, "added": [[7, "Pollen"]], "removed": [3],
+     "volumes": {"5": 2.5}, "blooming": {"6": true}}
+
+The world ticks rate times a second.  A round of the loop ticks at most
+max_ticks_behind ticks; ticks further behind than that are dropped, so
+the world slows down rather than stalls when it cannot keep up.
+Between ticks the server waits on its sockets with select, never longer
+than until the next tick is due.
+
+Every client has a queue of at most max_queue lines.  Sockets are
+written without blocking, so a slow subscriber only fills its own
+queue; when the queue is full the oldest lines are dropped, and a line
+saying how many comes before the next one:
+
+    {"dropped": 3}
+
+The changes of a tick are encoded once and the same line is queued for
+every subscriber.
+'''
+
+import argparse
+import collections
+import errno
+import json
+import os
+import select
+import socket
+import stat
+import time
+
+from soil import *
+
+
+def encode(message):
+    return json.dumps(message) + '\n'
+
+
+class StateWatcher(WorldListener):
+    '''
+    Tells what changed in a world since the previous call to changes():
+    entities added and removed, Growth volumes and blooming flowers.
+
+    It follows the world as a listener, so changes() only looks at the
+    parts that can still grow rather than at every entity.  A Growth
+    that is idle stays out of sight until its part changes state.
+    '''
+    def __init__(self, world):
+        self.world = world
+        self._added = []
+        self._removed = []
+        # id -> part whose Growth may grow
+        self._growing = {}
+        self._volumes = {}
+        self._blooming = {}
+        world.listen(self)
+        for e in world.entities:
+            self.entity_added(e)
+        self.changes()
+
+    def entity_added(self, entity):
+        # looked at in changes(), once the constructor has finished
+        self._added.append(entity)
+
+    def entity_removed(self, entity):
+        self._removed.append(entity.id)
+        self._growing.pop(entity.id, None)
+        self._volumes.pop(entity.id, None)
+        self._blooming.pop(entity.id, None)
+
+    def state_changed(self, part, previous):
+        if getattr(part, 'growth', None) is not None:
+            self._growing[part.id] = part
+        is_blooming = getattr(part, 'is_blooming', None)
+        if is_blooming is not None:
+            self._blooming[part.id] = is_blooming
+
+    def changes(self):
+        added = []
+        blooming = self._blooming
+        for e in self._added:
+            if e.id is None or getattr(e, 'destroyed', False): continue
+            added.append([e.id, type(e).__name__])
+            if getattr(e, 'growth', None) is not None:
+                self._growing[e.id] = e
+            is_blooming = getattr(e, 'is_blooming', None)
+            if is_blooming is not None:
+                blooming[e.id] = is_blooming
+
+        volumes = {}
+        for entity_id, e in self._growing.items():
+            growth = e.growth
+            volume = growth.volume
+            if self._volumes.get(entity_id) != volume:
+                volumes[entity_id] = self._volumes[entity_id] = volume
+            if growth.idle() and not growth._engine:
+                del self._growing[entity_id]
+
+        changes = {
+            'tick': self.world.ticks,
+            'added': added,
+            'removed': self._removed,
+            'volumes': volumes,
+            'blooming': blooming,
+        }
+        self._added = []
+        self._removed = []
+        self._blooming = {}
+        return changes
+
+
+class Client(object):
+    def __init__(self, connection, max_queue):
+        self.connection = connection
+        self.connection.setblocking(0)
+        self.subscribed = False
+        self.queue = collections.deque()
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._received = ''
+        self._sending = ''
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def send(self, line):
+        '''queues a line of JSON, encoded once however many clients get it'''
+        if len(self.queue) >= self.max_queue:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(line)
+
+    def wants_to_write(self):
+        return bool(self._sending or self.queue)
+
+    def write(self):
+        '''writes what the socket takes without blocking'''
+        while True:
+            if not self._sending:
+                if not self.queue: return
+                line = self.queue.popleft()
+                if self.dropped:
+                    line = json.dumps({'dropped': self.dropped}) + '\n' + line
+                    self.dropped = 0
+                self._sending = line
+            try:
+                sent = self.connection.send(self._sending)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK): return
+                raise
+            self._sending = self._sending[sent:]
+            if self._sending: return
+
+    def read(self):
+        '''returns the complete lines received, or None when the client has gone'''
+        try:
+            data = self.connection.recv(4096)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK): return []
+            return None
+        if not data: return None
+        lines = (self._received + data).split('\n')
+        self._received = lines.pop()
+        return [line for line in lines if line.strip()]
+
+    def close(self):
+        self.connection.close()
+
+
+class Server(object):
+    '''
+    Ticks world rate times a second and serves clients on address, a
+    path for a unix socket or a (host, port) pair.  planter(contents)
+    plants a seed for the plant command.
+    '''
+    def __init__(self, world, address, rate=10.0, planter=None, max_queue=256, max_ticks_behind=4):
+        self.world = world
+        self.interval = 1.0 / rate
+        self.planter = planter
+        self.max_queue = max_queue
+        self.max_ticks_behind = max_ticks_behind
+        self.dropped_ticks = 0
+        self.clients = []
+        self.watcher = StateWatcher(world)
+        self.commands = {
+            'subscribe': self.subscribe,
+            'unsubscribe': self.unsubscribe,
+            'plant': self.plant,
+        }
+        if isinstance(address, basestring):
+            if os.path.exists(address):
+                # left over from an earlier server; anything else is not ours to remove
+                if not stat.S_ISSOCK(os.stat(address).st_mode):
+                    raise OSError(errno.EEXIST, 'exists and is not a socket', address)
+                os.remove(address)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(16)
+        self.listener.setblocking(0)
+        self.address = self.listener.getsockname()
+        self._next_tick = None
+
+    def subscribe(self, client, message):
+        client.subscribed = True
+
+    def unsubscribe(self, client, message):
+        client.subscribed = False
+
+    def plant(self, client, message):
+        if self.planter is None:
+            return {'error': 'this server does not plant seeds'}
+        previous = World.current()
+        self.world.activate()
+        try:
+            seed = self.planter(message.get('contents', {}))
+        finally:
+            previous.activate()
+        return {'planted': seed.id}
+
+    def serve_forever(self):
+        while True:
+            self.serve(self.interval)
+
+    def serve(self, duration):
+        '''ticks and serves clients for duration seconds'''
+        end = time.time() + duration
+        while True:
+            now = time.time()
+            if now >= end: return
+            self._tick_due(now)
+            self._poll(min(end, self._next_tick) - time.time())
+
+    def _tick_due(self, now):
+        if self._next_tick is None:
+            self._next_tick = now
+        if now < self._next_tick: return
+        due = int((now - self._next_tick) / self.interval) + 1
+        self._next_tick += self.interval * due
+        if due > self.max_ticks_behind:
+            self.dropped_ticks += due - self.max_ticks_behind
+            due = self.max_ticks_behind
+        for i in xrange(due):
+            self.world.tick()
+            self._broadcast(self.watcher.changes())
+
+    def _broadcast(self, changes):
+        line = None
+        for client in self.clients:
+            if client.subscribed:
+                if line is None: line = encode(changes)
+                client.send(line)
+
+    def _poll(self, timeout):
+        writers = [client for client in self.clients if client.wants_to_write()]
+        readable, writable, failed = select.select([self.listener] + self.clients, writers, [], max(timeout, 0))
+        for client in writable:
+            try:
+                client.write()
+            except socket.error:
+                self._drop(client)
+        for r in readable:
+            if r is self.listener:
+                self._accept()
+            elif r in self.clients:
+                self._read(r)
+
+    def _accept(self):
+        try:
+            connection, address = self.listener.accept()
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK): return
+            raise
+        self.clients.append(Client(connection, self.max_queue))
+
+    def _read(self, client):
+        lines = client.read()
+        if lines is None:
+            self._drop(client)
+            return
+        for line in lines:
+            try:
+                message = json.loads(line)
+                reply = self.commands[message['command']](client, message)
+            except Exception as e:
+                reply = {'error': '%s: %s' % (type(e).__name__, e)}
+            if reply is not None:
+                client.send(encode(reply))
+
+    def _drop(self, client):
+        self.clients.remove(client)
+        client.close()
+
+    def close(self):
+        for client in list(self.clients):
+            self._drop(client)
+        self.listener.close()
+        if isinstance(self.address, basestring) and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+def main(argv=None):
+    from designed_plant import Seed
+    from designed_plant_params import Params
+
+    parser = argparse.ArgumentParser(description='Runs a world and streams it to clients.')
+    parser.add_argument('address', help='path of the unix socket to serve on')
+    parser.add_argument('--rate', type=float, default=10.0, help='ticks per second')
+    parser.add_argument('--max-queue', type=int, default=256, help='lines kept for a slow client')
+    args = parser.parse_args(argv)
+
+    params = Params.plant_parameters()
+    world = World.reset()
+    def planter(contents):
+        return Seed(contents, params)
+    server = Server(world, args.address, rate=args.rate, planter=planter, max_queue=args.max_queue)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from hamcrest import *
+
+from designed_plant import *
+from designed_plant_params import Params
+from designed_plant_test import tickn
+from server import *
+
+
+def planter(contents):
+    return Seed(contents, Params.plant_parameters('seed', 'root', 'stem', 'leaves'))
+
+
+class StateWatcherTest(unittest.TestCase):
+    def test_changes(self):
+        world = World.reset()
+        seed = planter({'kledis': 100.0})
+        watcher = StateWatcher(world)
+        while not seed._vein.part('root'):
+            tickn()
+        changes = watcher.changes()
+        root = seed._vein.part('root')[0]
+        assert_that(changes['added'], is_([[root.id, 'Root']]))
+        tickn()
+        changes = watcher.changes()
+        assert_that(changes['added'], is_([]))
+        assert_that(changes['volumes'], is_({root.id: root.growth.volume}))
+
+    def test_idle_parts_are_not_looked_at(self):
+        world = World.reset()
+        flower = Flower(Vein(), Params.plant_parameters('flower', 'egg'))
+        flower.take_in_from_environment({'kledis': 21.0})
+        watcher = StateWatcher(world)
+        blooming = {}
+        for i in range(10):
+            tickn()
+            blooming.update(watcher.changes()['blooming'])
+        assert_that(blooming, is_({flower.id: True}))
+        egg = flower._vein.part('egg')[0]
+        assert_that(watcher._growing, is_({}), 'a ripe egg waits to be fertilized')
+        egg.fertilize()
+        tickn()
+        assert_that(watcher.changes()['volumes'], is_({egg.id: 6.0}))
+
+
+class ClientTest(unittest.TestCase):
+    def test_drops_oldest_lines_of_a_slow_client(self):
+        near, far = socket.socketpair()
+        client = Client(near, max_queue=2)
+        for i in range(5):
+            client.send(encode({'tick': i}))
+        client.write()
+        lines = far.recv(4096).splitlines()
+        assert_that([json.loads(line) for line in lines], is_([{'dropped': 3}, {'tick': 3}, {'tick': 4}]))
+        near.close()
+        far.close()
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.world = World.reset()
+        self.server = Server(self.world, os.path.join(self.directory, 'flower.sock'), rate=100, planter=planter)
+        self.client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.client.connect(self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def receive(self):
+        self.client.settimeout(1)
+        data = ''
+        while not data.endswith('\n'):
+            data += self.client.recv(65536)
+        return [json.loads(line) for line in data.splitlines()]
+
+    def test_plants_and_streams_ticks(self):
+        self.client.sendall('{"command": "subscribe"}\n{"command": "plant", "contents": {"kledis": 100.0}}\n')
+        self.server.serve(0.1)
+        messages = self.receive()
+        assert_that(messages[0], has_entry('planted', 0))
+        ticks = [m['tick'] for m in messages[1:]]
+        assert_that(ticks, is_(range(ticks[0], ticks[0] + len(ticks))))
+        assert_that(len(ticks), greater_than(2))
+        assert_that(messages[1]['added'], is_([[0, 'Seed']]))
+
+    def test_replies_errors(self):
+        self.client.sendall('{"command": "dance"}\n')
+        self.server.serve(0.02)
+        assert_that(self.receive()[0], has_key('error'))
+
+    def test_replies_error_without_planter(self):
+        self.server.planter = None
+        self.client.sendall('{"command": "plant"}\n')
+        self.server.serve(0.02)
+        assert_that(self.receive()[0], is_({'error': 'this server does not plant seeds'}))
+
+    def test_leaves_other_files_alone(self):
+        path = os.path.join(self.directory, 'data')
+        with open(path, 'w') as f:
+            f.write('keep')
+        self.assertRaises(OSError, Server, self.world, path)
+        with open(path) as f:
+            assert_that(f.read(), is_('keep'))
+
+    def test_replaces_a_stale_socket(self):
+        path = self.server.address
+        self.server.listener.close()
+        self.server = Server(self.world, path, rate=100, planter=planter)
+        assert_that(self.server.address, is_(path))
+
+    def test_drops_ticks_when_behind(self):
+        self.server.serve(0.01)
+        ticks = self.world.ticks
+        import time
+        time.sleep(0.2)
+        self.server.serve(0.001)
+        assert_that(self.world.ticks - ticks, is_(self.server.max_ticks_behind))
+        assert_that(self.server.dropped_ticks, greater_than(0))
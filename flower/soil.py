@@ -1,146 +1,784 @@
 # coding: utf-8
 
+import math
+
+from event import EventDispatcher
+
+
 class Materials(object):
+    '''
+    Amounts of each material in Materials.NAMES.
+
+    The schema is fixed, so the amounts are kept in a list indexed by
+    Materials.INDEX.  Missing names read as 0.
+    '''
     NAMES = ['kledis', 'heplon', 'mygen', 'water']
+    INDEX = dict((name, i) for i, name in enumerate(NAMES))
+    __slots__ = ('_values',)
 
     def __init__(self, d=None):
-        self._contents = d if d else {}
+        if isinstance(d, Materials):
+            self._values = list(d._values)
+            return
+        self._values = [0] * len(Materials.NAMES)
+        if d:
+            for name in d:
+                self._values[Materials.INDEX[name]] = d[name]
 
     def __getitem__(self, key):
-        return self._contents.get(key, 0)
+        index = Materials.INDEX.get(key)
+        if index is None: return 0
+        return self._values[index]
 
     def __setitem__(self, key, val):
-        self._contents[key] = val
+        self._values[Materials.INDEX[key]] = val
+
+    def add(self, materials, factor=1):
+        '''adds materials * factor in place'''
+        values = self._values
+        if isinstance(materials, Materials):
+            others = materials._values
+            if factor == 1:
+                for i in xrange(len(values)):
+                    values[i] += others[i]
+            else:
+                for i in xrange(len(values)):
+                    values[i] += others[i] * factor
+        else:
+            for name in materials:
+                values[Materials.INDEX[name]] += materials[name] * factor
+
+    def subtract(self, materials, factor=1):
+        '''subtracts materials * factor in place'''
+        self.add(materials, -factor)
+
+    @staticmethod
+    def from_values(values):
+        materials = Materials.__new__(Materials)
+        materials._values = list(values)
+        return materials
+
+    def values(self):
+        return list(self._values)
 
-    def add(self, materials):
-        for name in materials:
-            self[name] += materials[name]
+    @staticmethod
+    def sum(materials_list):
+        total = Materials()
+        for materials in materials_list:
+            total.add(materials)
+        return total
 
     def clear(self):
-        self._contents.clear()
+        self._values = [0] * len(Materials.NAMES)
+
+    def fits(self, materials):
+        '''the largest factor that materials * factor can be taken out of these amounts by'''
+        times = float('inf')
+        for have, need in zip(self._values, Materials._values_of(materials)):
+            if need <= 0: continue
+            fit = max(have, 0) / float(need)
+            # keep need * fit from rounding above have
+            while fit > 0 and need * fit > have:
+                fit *= 1 - 1e-15
+            times = min(times, fit)
+        return times
+
+    def copy(self):
+        return Materials(self)
 
     def __iter__(self):
-        return self._contents.__iter__()
+        return iter(Materials.NAMES)
 
     def __repr__(self):
-        return 'Materials(%s)'%(repr(self._contents))
+        return 'Materials(%s)'%(repr(dict((name, v) for name, v in zip(Materials.NAMES, self._values) if v)))
 
     def __mul__(self, number):
-        return Materials(dict([(k, self._contents[k] * number) for k in self._contents]))
+        product = Materials.__new__(Materials)
+        product._values = [v * number for v in self._values]
+        return product
+
+    def __imul__(self, number):
+        values = self._values
+        for i in xrange(len(values)):
+            values[i] *= number
+        return self
+
+    def __iadd__(self, materials):
+        self.add(materials)
+        return self
+
+    def __isub__(self, materials):
+        self.add(materials, -1)
+        return self
+
+    @staticmethod
+    def _values_of(materials):
+        if isinstance(materials, Materials):
+            return materials._values
+        return Materials(materials)._values
 
     def __eq__(self, other):
-        return self._contents == other._contents
+        if not isinstance(other, (Materials, dict)): return NotImplemented
+        return self._values == Materials._values_of(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented: return NotImplemented
+        return not equal
 
     def __lt__(self, other):
-        return all(self[name] < other[name] for name in Materials.NAMES)
+        return all(a < b for a, b in zip(self._values, Materials._values_of(other)))
 
     def __le__(self, other):
-        return all(self[name] <= other[name] for name in Materials.NAMES)
+        return all(a <= b for a, b in zip(self._values, Materials._values_of(other)))
 
     def __gt__(self, other):
-        return all(self[name] > other[name] for name in Materials.NAMES)
+        return all(a > b for a, b in zip(self._values, Materials._values_of(other)))
 
     def __ge__(self, other):
-        return all(self[name] >= other[name] for name in Materials.NAMES)
+        return all(a >= b for a, b in zip(self._values, Materials._values_of(other)))
+
+class SlotState(object):
+    '''
+    Pickles the __slots__ of a class, and its __dict__ if a subclass
+    without __slots__ gives it one.  Unset slots are left out.
+    '''
+    __slots__ = ()
+    # class -> names of the slots of the class and its bases
+    _slot_names = {}
+
+    @classmethod
+    def _slots(cls):
+        names = SlotState._slot_names.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get('__slots__', ()):
+                    if name not in ('__dict__', '__weakref__') and name not in names:
+                        names.append(name)
+            names = SlotState._slot_names[cls] = tuple(names)
+        return names
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for name in self._slots():
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class WorldEntityRepository(object):
+    '''
+    Keeps WorldEntities in insertion order and gives each of them an id.
+
+    Removed entities leave a tombstone so that iterating while removing
+    is safe.  Tombstones are dropped by compact().
+    '''
+    def __init__(self):
+        self._slots = []
+        self._positions = {}
+        self._next_id = 0
+        self._tombstones = 0
+
+    def assign_id(self, entity):
+        if getattr(entity, 'id', None) is None:
+            entity.id = self._next_id
+        self.reserve(entity.id)
+
+    def add(self, entity):
+        if entity in self: return
+        self.assign_id(entity)
+        self._positions[entity.id] = len(self._slots)
+        self._slots.append(entity)
+
+    def add_many(self, entities):
+        '''adds entities that are not in the repository yet, in order'''
+        position = len(self._slots)
+        for entity in entities:
+            self.assign_id(entity)
+            self._positions[entity.id] = position
+            position += 1
+        self._slots.extend(entities)
+
+    def remove(self, entity):
+        if entity not in self: return
+        position = self._positions.pop(entity.id)
+        self._slots[position] = None
+        self._tombstones += 1
+
+    def reserve(self, entity_id):
+        '''ids up to entity_id will not be given to new entities'''
+        self._next_id = max(self._next_id, entity_id + 1)
+
+    def next_id(self):
+        return self._next_id
+
+    def get(self, entity_id):
+        position = self._positions.get(entity_id)
+        if position is None: return None
+        return self._slots[position]
+
+    def compact(self):
+        if not self._tombstones: return
+        self._slots = [e for e in self._slots if e is not None]
+        for position, entity in enumerate(self._slots):
+            self._positions[entity.id] = position
+        self._tombstones = 0
+
+    def __contains__(self, entity):
+        position = self._positions.get(getattr(entity, 'id', None))
+        return position is not None and self._slots[position] is entity
+
+    def __iter__(self):
+        # entities appended while iterating are not visited
+        slots = self._slots
+        for i in xrange(len(slots)):
+            entity = slots[i]
+            if entity is not None:
+                yield entity
+
+    def __len__(self):
+        return len(self._positions)
+
+
+class WorldListener(object):
+    '''
+    Base class for objects that follow what happens in a World.
+    Register with World.listen().  Entities are passed as soon as they
+    join the world, which may be before their constructor has finished.
+    '''
+    def entity_added(self, entity):
+        pass
+
+    def entity_removed(self, entity):
+        pass
+
+    def tick_ended(self, world):
+        '''called after every tick, once the parts made in it have joined'''
+        pass
+
+    def state_changed(self, part, previous):
+        '''called when a PlantPart moves out of state previous'''
+        pass
+
+    def part_located(self, part):
+        '''called when a PlantPart without a location is given one'''
+        pass
+
+
+class _Bulk(object):
+    '''Entities created in bulk, kept in a list allocated up front'''
+    __slots__ = ('_entities', '_count')
+
+    def __init__(self, count):
+        self._entities = [None] * count
+        self._count = 0
+
+    def append(self, entity):
+        if self._count < len(self._entities):
+            self._entities[self._count] = entity
+        else:
+            self._entities.append(entity)
+        self._count += 1
+
+    def entities(self):
+        if self._count < len(self._entities):
+            del self._entities[self._count:]
+        return self._entities
+
 
 class World(object):
-    entities = []
-    entities_to_add_after_tick = []
-    tick_in_progress = False
+    '''
+    A simulation.  WorldEntities belong to the world that is current
+    when they are created.  A world is current while it ticks, so parts
+    generated during a tick join the same world.
+
+    With defer_events set, events triggered during a tick are handled
+    together after every entity has ticked.  Events of the world's
+    entities are queued in its event_queue and handled through its
+    event_monitor, so worlds never share them.
+
+    Entities created between start_bulk() and end_bulk() are added
+    together by end_bulk(), in the order they were created.
+    '''
+    _current = None
+    MAX_SKIP_WAIT = 32
 
-    @staticmethod
-    def tick():
-        World.tick_in_progress = True
-        try:
-            for e in World.entities:
-                e.tick()
-        finally:
-            World.tick_in_progress = False
-            World._add_entities_after_tick()
+    def __init__(self):
+        self.entities = WorldEntityRepository()
+        self.entities_to_add_after_tick = []
+        self.tick_in_progress = False
+        self.growth_engines = {}
+        self.air = None
+        self.ground = None
+        self.listeners = []
+        self.ticks = 0
+        self.journal = None
+        self.profiler = None
+        self.aggregates = None
+        self.defer_events = False
+        self.event_queue = None
+        self.event_monitor = None
+        self.scheduler = None
+        self.part_pool = None
+        self._bulk = None
+        # the ParallelWorld ticking the entities elsewhere, if any
+        self.lent_out = None
+        # id -> the tick an entity with a tick_period over 1 is due on
+        # next, when there is no scheduler to keep it
+        self._periodic = {}
 
     @staticmethod
-    def _add_entities_after_tick():
-        for e in World.entities_to_add_after_tick:
-            World.add(e)
-        del(World.entities_to_add_after_tick[:])
+    def current():
+        if World._current is None:
+            World._current = World()
+        return World._current
 
     @staticmethod
-    def add(entity):
-        if entity in World.entities: return
+    def reset():
+        return World().activate()
+
+    def activate(self):
+        World._current = self
+        return self
+
+    def listen(self, listener):
+        self.listeners.append(listener)
 
-        if World.tick_in_progress:
-            World.entities_to_add_after_tick.append(entity)
+    def tick(self):
+        assert self.lent_out is None, 'the entities are ticking in worker processes until gathered'
+        previous = World._current
+        World._current = self
+        self.tick_in_progress = True
+        self.event_queue = [] if self.defer_events else None
+        try:
+            if self.scheduler is not None:
+                entities = self.scheduler.due()
+            elif self._periodic:
+                entities = self._due_entities()
+            else:
+                entities = self.entities
+            if self.profiler:
+                self.profiler.tick_entities(entities, self._dispatch_queued)
+            else:
+                for e in entities:
+                    e.tick()
+                self._dispatch_queued()
+        finally:
+            self.event_queue = None
+            self.tick_in_progress = False
+            self.ticks += 1
+            self.entities.compact()
+            self._add_entities_after_tick()
+            World._current = previous
+        for listener in self.listeners:
+            listener.tick_ended(self)
+
+    def _due_entities(self):
+        now = self.ticks
+        periodic = self._periodic
+        for e in self.entities:
+            due = periodic.get(e.id)
+            if due is not None:
+                # a due tick left behind, e.g. by a skip, is taken now
+                if due > now: continue
+                periodic[e.id] = now + e.tick_period
+            yield e
+
+    def period_changed(self, entity):
+        '''starts entity over at its tick_period from the next tick'''
+        if entity.tick_period == 1:
+            self._periodic.pop(entity.id, None)
+        elif entity in self.entities:
+            self._periodic[entity.id] = self.ticks + 1 if self.tick_in_progress else self.ticks
+
+    def _dispatch_queued(self):
+        if self.event_queue is not None:
+            EventDispatcher.dispatch_queued(self.event_queue, self.event_monitor)
+
+    def advance(self, ticks):
+        '''
+        Same as calling tick() ticks times, but skips stretches in which
+        every entity only moves steady flows of materials, working them
+        out in closed form.  The ticks on which something happens, like
+        a part growing to its max or a seed rooting, are ticked as usual.
+        Amounts agree with ticking up to floating point rounding.
+        Listeners get a single tick_ended() at the end of a skipped
+        stretch rather than one for every tick in it.
+        '''
+        end = self.ticks + ticks
+        wait = 1
+        while self.ticks < end:
+            if self._skip(end - self.ticks):
+                wait = 1
+                continue
+            # try again later, more rarely while nothing can be skipped
+            for i in xrange(min(wait, end - self.ticks)):
+                self.tick()
+            wait = min(wait * 2, World.MAX_SKIP_WAIT)
+
+    def _skip(self, limit):
+        '''skips up to limit ticks if nothing happens in them, and returns how many'''
+        if self.scheduler is not None or self._periodic: return 0
+        courses = {}
+        flows = []
+        for e in self.entities:
+            flow = e.flow()
+            if flow is None: return 0
+            if flow.is_zero(): continue
+            vein = e._vein
+            course = courses.get(id(vein))
+            if course is None:
+                course = courses[id(vein)] = Course(vein.pooled())
+            course.add(flow)
+
+        ticks = limit
+        for course in courses.values():
+            ticks = course.ticks_covered(ticks)
+            if ticks < 2: return 0
+        for e in self.entities:
+            vein = getattr(e, '_vein', None)
+            course = courses.get(id(vein)) if vein else None
+            ticks = e.quiet_ticks(course if course else Course(vein.pooled() if vein else Materials()), ticks)
+            if ticks < 2: return 0
+
+        for course in courses.values():
+            course.apply(ticks)
+        for e in self.entities:
+            e.skip(ticks)
+        self.ticks += ticks
+        for listener in self.listeners:
+            listener.tick_ended(self)
+        return ticks
+
+    def _add_entities_after_tick(self):
+        for e in self.entities_to_add_after_tick:
+            if getattr(e, 'destroyed', False): continue
+            self.add(e)
+        del(self.entities_to_add_after_tick[:])
+
+    def start_bulk(self, count=0):
+        '''collects the entities created from now on, room for count of them made at once'''
+        assert self._bulk is None, 'already adding in bulk'
+        self._bulk = _Bulk(count)
+
+    def end_bulk(self):
+        '''adds the entities created since start_bulk() and returns them'''
+        entities = self._bulk.entities()
+        self._bulk = None
+        self.add_many(entities)
+        return entities
+
+    def add_many(self, entities):
+        entities = [e for e in entities if e not in self.entities]
+        if self.tick_in_progress:
+            for e in entities:
+                self.entities.assign_id(e)
+            self.entities_to_add_after_tick.extend(entities)
             return
 
-        World.entities.append(entity)
+        self.entities.add_many(entities)
+        for e in entities:
+            if e.tick_period != 1: self.period_changed(e)
+            if self.journal: self.journal.added(e)
+            for listener in self.listeners:
+                listener.entity_added(e)
+
+    def add(self, entity):
+        assert self.lent_out is None, 'the entities are ticking in worker processes until gathered'
+        if self._bulk is not None:
+            self._bulk.append(entity)
+            return
+        if entity in self.entities: return
 
-    @staticmethod
-    def remove(entity):
-        if entity not in World.entities: return
-        World.entities.remove(entity)
+        if self.tick_in_progress:
+            self.entities.assign_id(entity)
+            self.entities_to_add_after_tick.append(entity)
+            return
 
-    @staticmethod
-    def reset():
-        World.entities = []
+        self.entities.add(entity)
+        if entity.tick_period != 1: self.period_changed(entity)
+        if self.journal: self.journal.added(entity)
+        for listener in self.listeners:
+            listener.entity_added(entity)
 
+    def remove(self, entity):
+        assert self.lent_out is None, 'the entities are ticking in worker processes until gathered'
+        if entity not in self.entities: return
+        self.entities.remove(entity)
+        self._periodic.pop(entity.id, None)
+        if self.journal: self.journal.removed(entity)
+        for listener in self.listeners:
+            listener.entity_removed(entity)
+
+
+class WorldEntity(SlotState):
+    '''
+    Something in a World that ticks.  Entities are slotted; subclasses
+    that are made in numbers declare __slots__ too.
+
+    An entity ticks once every tick_period ticks, 1 unless its class
+    says otherwise, starting with the first tick after it joins.
+    '''
+    __slots__ = ('world', 'id', 'destroyed', 'tick_period')
 
-class WorldEntity(object):
     def __init__(self):
-        World.add(self)
+        # a class attribute of a subclass without __slots__ hides the slot
+        if not hasattr(self, 'tick_period'): self.tick_period = 1
+        self.world = World.current()
+        self.world.add(self)
 
     def tick(self):
         pass
 
     def remove(self):
-        World.remove(self)
+        self.world.remove(self)
         self.destroyed = True
 
+    def sleep(self):
+        '''stops ticking until woken, if the world has a scheduler'''
+        scheduler = self.world.scheduler
+        if scheduler is not None: scheduler.sleep(self)
+
+    def wake(self):
+        scheduler = self.world.scheduler
+        if scheduler is not None: scheduler.wake(self)
+
+    def sleep_for(self, ticks):
+        '''stops ticking for ticks ticks, if the world has a scheduler'''
+        scheduler = self.world.scheduler
+        if scheduler is not None: scheduler.sleep_until(self, self.world.ticks + ticks)
+
+    def flow(self):
+        '''
+        The Flow of materials this entity steadily moves into its _vein
+        on each tick while nothing happens, or None if it cannot tell,
+        in which case World.advance() ticks one by one.
+        '''
+        return None
+
+    def quiet_ticks(self, course, limit):
+        '''how many of the next limit ticks do nothing but flow, given the Course of its vein'''
+        return 0
+
+    def skip(self, ticks):
+        '''does what ticks quiet ticks would do besides the flow'''
+        pass
+
+    def set_tick_period(self, period):
+        assert period >= 1
+        self.tick_period = period
+        scheduler = self.world.scheduler
+        if scheduler is not None: scheduler.period_changed(self)
+        else: self.world.period_changed(self)
+
+
+class Vein(SlotState):
+    __slots__ = ('_pooled', '_parts', '_part_names', '_waiting')
 
-class Vein(object):
     def __init__(self):
         self._pooled = Materials()
         self._parts = {}
+        self._part_names = {}
+        # parts waiting for materials, a list once any waits
+        self._waiting = None
+
+    def __getstate__(self):
+        # the index is keyed by id(), rebuild it on restore
+        state = SlotState.__getstate__(self)
+        del state['_part_names']
+        return state
+
+    def __setstate__(self, state):
+        SlotState.__setstate__(self, state)
+        self._part_names = dict((id(part), name) for name, parts in self._parts.items() for part in parts)
 
     def connect(self, name, part):
         assert not self.has_part(part), "cannot connect same part twice"
         if name not in self._parts:
             self._parts[name] = []
         self._parts[name].append(part)
+        self._part_names[id(part)] = name
+
+    def disconnect(self, part):
+        '''disconnects part and returns the name it was connected as'''
+        name = self._part_names.pop(id(part), None)
+        if name is None: return None
+        self._parts[name].remove(part)
+        if self._waiting and part in self._waiting: self._waiting.remove(part)
+        return name
 
     def part(self, name):
+        # the connected list itself, do not modify
         return self._parts.get(name, [])
 
-    def pour_in(self, materials, source):
+    def pour_in(self, materials, source, factor=1):
         assert self.has_part(source)
-        for name in materials:
-            self._pooled[name] += materials[name]
-
-    def pump_out(self, materials, dest):
+        self._pooled.add(materials, factor)
+        if self._waiting: self._wake_waiting()
+
+    def wait_for_materials(self, part):
+        '''puts part to sleep until materials flow in'''
+        if self._waiting is None:
+            self._waiting = []
+        if part not in self._waiting:
+            self._waiting.append(part)
+        part.sleep()
+
+    def _wake_waiting(self):
+        waiting = self._waiting
+        self._waiting = None
+        for part in waiting:
+            part.wake()
+
+    def pump_out(self, materials, dest, factor=1):
         assert self.has_part(dest)
-        out = Materials()
-        for name in materials:
-            self._pooled[name] -= materials[name]
-            out[name] += materials[name]
+        out = Materials(materials)
+        if factor != 1: out *= factor
+        self._pooled.subtract(out)
         return out
 
+    def transfer(self, moves, factor=1):
+        '''
+        Applies moves of (part, inflow, outflow) to the pool at once.
+        inflow is poured in from the part and outflow is pumped out to
+        it, both multiplied by factor.  Either can be None.
+        '''
+        inflows = Materials()
+        outflows = Materials()
+        for part, inflow, outflow in moves:
+            assert self.has_part(part)
+            if inflow: inflows.add(inflow, factor)
+            if outflow: outflows.add(outflow, factor)
+        assert self._pooled >= outflows
+        poured = self._waiting and any(inflows.values())
+        inflows.subtract(outflows)
+        self._pooled.add(inflows)
+        if poured: self._wake_waiting()
+
     def pooled(self):
         return self._pooled
 
     def has_part(self, part):
-        return any([part in parts for parts in self._parts.values()])
+        return id(part) in self._part_names
 
 
-class Ground(object):
-    def __init__(self, size, depth):
-        self.size = size
-        self.depth = depth
-
-    def plant(self, target, location):
-        pass
+class Flow(object):
+    '''
+    Materials moved steadily into and out of a vein, as moves in the
+    order a tick makes them.  On the t-th tick from now a move brings
+    in inflow + inflow_slope * t and takes out outflow + outflow_slope
+    * t, none of them negative.  Like Vein.transfer(), the pool must
+    cover the outflow of a move before its inflow comes in.
+    '''
+    def __init__(self):
+        self.moves = []
+
+    def move(self, inflow=None, inflow_slope=None, outflow=None, outflow_slope=None):
+        self.moves.append((Materials(inflow), Materials(inflow_slope), Materials(outflow), Materials(outflow_slope)))
+        return self
+
+    def add(self, other):
+        self.moves.extend(other.moves)
+        return self
+
+    def is_zero(self):
+        return not self.moves
+
+
+def ticks_below_zero(c0, c1, c2, limit):
+    '''
+    How many of t = 0, 1, ... limit-1 keep c0 + c1*t + c2*t*t below
+    zero, less one tick to spare the rounding.
+    >>> ticks_below_zero(-10.0, 1.0, 0.0, 100)
+    9
+    >>> ticks_below_zero(-10.0, -1.0, 0.0, 100)
+    100
+    >>> ticks_below_zero(-4.0, 0.0, 1.0, 100)
+    1
+    >>> ticks_below_zero(-1.0, 4.0, -1.0, 100)
+    0
+    '''
+    if c0 >= 0: return 0
+    if c2 == 0:
+        if c1 <= 0: return limit
+        first = -c0 / c1
+    else:
+        discriminant = c1 * c1 - 4 * c2 * c0
+        if c2 < 0 and (discriminant < 0 or c1 <= 0):
+            # never rises to zero for t >= 0
+            return limit
+        root = math.sqrt(discriminant)
+        # where it first rises to zero; the smaller root if c2 < 0, the larger if not
+        first = (-c1 + root) / (2 * c2)
+    if first >= limit + 1: return limit
+    ticks = max(0, int(math.ceil(first)) - 1)
+    while ticks > 0 and c0 + c1 * (ticks - 1) + c2 * (ticks - 1) * (ticks - 1) >= 0:
+        ticks -= 1
+    return min(ticks, limit)
+
+
+class Course(object):
+    '''
+    Where the pool of a vein goes while the Flows of its parts hold.
+    With a the net flow of a tick and b its slope, the pool at the
+    start of the t-th tick from now is pooled + a * t + b * t * (t - 1) / 2.
+    '''
+    def __init__(self, pooled):
+        self.pooled = pooled
+        self.moves = []
+
+    def add(self, flow):
+        self.moves.extend(flow.moves)
+
+    def _net(self, name, moves):
+        a = b = 0.0
+        for inflow, inflow_slope, outflow, outflow_slope in moves:
+            a += inflow[name] - outflow[name]
+            b += inflow_slope[name] - outflow_slope[name]
+        return a, b
+
+    def _coefficients(self, name):
+        # pooled + (a - b/2) t + (b/2) t^2
+        a, b = self._net(name, self.moves)
+        return self.pooled[name], a - b / 2.0, b / 2.0
+
+    def ticks_below(self, name, threshold, limit):
+        '''how many ticks the amount of name stays below threshold, even in the middle of a tick'''
+        p, c1, c2 = self._coefficients(name)
+        inflow = sum(move[0][name] for move in self.moves)
+        inflow_slope = sum(move[1][name] for move in self.moves)
+        return ticks_below_zero(p + inflow - threshold, c1 + inflow_slope, c2, limit)
+
+    def ticks_covered(self, limit):
+        '''how many ticks the pool covers every outflow'''
+        for name in Materials.NAMES:
+            p, c1, c2 = self._coefficients(name)
+            for i, (inflow, inflow_slope, outflow, outflow_slope) in enumerate(self.moves):
+                if not outflow[name] and not outflow_slope[name]: continue
+                a, b = self._net(name, self.moves[:i])
+                # outflow - (pooled + the moves before) must not go above zero
+                c = (outflow[name] - p - a, outflow_slope[name] - c1 - b, -c2)
+                if c == (0.0, 0.0, 0.0): continue
+                limit = ticks_below_zero(c[0], c[1], c[2], limit)
+        return limit
+
+    def apply(self, ticks):
+        steps = ticks * (ticks - 1) / 2.0
+        for name in Materials.NAMES:
+            # net first, so that flows cancelling each other leave the pool as it is
+            a, b = self._net(name, self.moves)
+            if a or b:
+                self.pooled[name] += a * ticks + b * steps
 
 
 def main():
-    pass
+    import server
+    server.main()
 
 if __name__=='__main__':
     main()
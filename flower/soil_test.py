@@ -4,6 +4,52 @@ from should_dsl import *
 
 from soil import *
 
+class MaterialsTest(unittest.TestCase):
+    def test_missing_names_read_as_zero(self):
+        m = Materials({'water': 10})
+        assert_that(m['water'], is_(10))
+        assert_that(m['kledis'], is_(0))
+        assert_that(m['no such material'], is_(0))
+
+    def test_in_place_arithmetic(self):
+        m = Materials({'water': 10, 'kledis': 1.0})
+        m.add(Materials({'water': 2}), 3)
+        assert_that(m, equal_to(Materials({'water': 16, 'kledis': 1.0})))
+        m.subtract({'kledis': 0.5})
+        assert_that(m['kledis'], close_to(0.5, 0.001))
+        m *= 2
+        assert_that(m, equal_to(Materials({'water': 32, 'kledis': 1.0})))
+
+    def test_mul_returns_new_materials(self):
+        m = Materials({'water': 10})
+        product = m * 0.5
+        assert_that(product['water'], is_(5.0))
+        assert_that(m['water'], is_(10))
+
+    def test_comparisons_use_all_names(self):
+        assert_that(Materials({'water': 10}) >= Materials({'water': 5}), is_(True))
+        assert_that(Materials({'water': 10}) >= Materials({'water': 5, 'kledis': 1}), is_(False))
+        assert_that(Materials({'water': 10}) <= {'water': 10}, is_(True))
+        assert_that(Materials({'water': 10, 'kledis': 1}) > Materials({'water': 5}), is_(False))
+
+    def test_equality(self):
+        assert_that(Materials({'water': 1}) == {'water': 1}, is_(True))
+        assert_that(Materials({'water': 1}) != Materials({'water': 2}), is_(True))
+        assert_that(Materials() == None, is_(False))
+        assert_that(Materials() != None, is_(True))
+        assert_that(Materials() == 0, is_(False))
+
+    def test_fits(self):
+        pooled = Materials({'mygen': 0.3, 'heplon': 10.0})
+        assert_that(pooled.fits({'mygen': 1.0, 'heplon': 1.0}), close_to(0.3, 0.0001))
+        assert_that(pooled >= Materials({'mygen': 0.1}) * pooled.fits({'mygen': 0.1}), is_(True))
+        assert_that(pooled.fits({'kledis': 1.0}), is_(0.0))
+
+    def test_sum(self):
+        total = Materials.sum([Materials({'water': 1}), Materials({'water': 2, 'mygen': 1})])
+        assert_that(total, equal_to(Materials({'water': 3, 'mygen': 1})))
+
+
 class VeinTest(unittest.TestCase):
     def setUp(self):
         World.reset()
@@ -40,10 +86,47 @@ class VeinTest(unittest.TestCase):
         vein = Vein()
         vein.part('no such part') |should_be.equal_to| []
 
+    def test_disconnect(self):
+        vein = Vein()
+        part1 = object()
+        part2 = object()
+        vein.connect('part', part1)
+        vein.connect('part', part2)
+        vein.disconnect(part1)
+        assert_that(vein.has_part(part1), is_(False))
+        assert_that(vein.has_part(part2), is_(True))
+        vein.part('part') |should_be.equal_to| [part2]
+
+    def test_transfer(self):
+        vein = Vein()
+        part1 = object()
+        part2 = object()
+        vein.connect('part1', part1)
+        vein.connect('part2', part2)
+        vein.pour_in({'water': 10, 'kledis': 5}, source=part1)
+        vein.transfer([
+            (part1, Materials({'mygen': 1}), Materials({'water': 2})),
+            (part2, None, Materials({'kledis': 1})),
+        ], factor=2)
+        assert_that(vein.pooled(), equal_to(Materials({'water': 6, 'kledis': 3, 'mygen': 2})))
+
+    def test_transfer_needs_enough_materials(self):
+        vein = Vein()
+        part1 = object()
+        vein.connect('part1', part1)
+        vein.pour_in({'water': 1}, source=part1)
+        ex = None
+        try:
+            vein.transfer([(part1, Materials({'water': 10}), Materials({'water': 2}))])
+        except AssertionError, ex:
+            pass
+        assert_that(ex, is_(not_none()))
+        assert_that(vein.pooled()['water'], is_(1))
+
 
 class WorldTest(unittest.TestCase):
     def setUp(self):
-        World.reset()
+        self.world = World.reset()
 
     class TestEntity(WorldEntity):
         ticked = False
@@ -54,28 +137,180 @@ class WorldTest(unittest.TestCase):
 
     def test_creation(self):
         entity = WorldTest.TestEntity()
-        assert_that(entity, is_in(World.entities), 'entities are automatically assigned')
+        assert_that(entity, is_in(self.world.entities), 'entities are automatically assigned')
 
     def test_tick(self):
         entity = WorldTest.TestEntity()
         assert_that(entity.ticked, is_(False), 'tick is not called')
-        World.tick()
+        self.world.tick()
         assert_that(entity.ticked, is_(True), 'tick is called')
 
     def test_tick_add_multiple_times(self):
         entity = WorldTest.TestEntity()
-        World.add(entity)
-        World.add(entity)
-        World.add(entity)
+        self.world.add(entity)
+        self.world.add(entity)
+        self.world.add(entity)
         assert_that(entity.ticked_count, is_(0))
-        World.tick()
+        self.world.tick()
         assert_that(entity.ticked_count, is_(1), 'tick() is called only once')
 
     def test_destroy_entity_from_the_world(self):
         entity = WorldTest.TestEntity()
         entity.remove()
         assert_that(entity.destroyed, is_(True))
-        assert_that(entity, not(is_in(World.entities)))
+        assert_that(entity, not(is_in(self.world.entities)))
+
+    def test_entities_have_ids(self):
+        entity1 = WorldTest.TestEntity()
+        entity2 = WorldTest.TestEntity()
+        assert_that(entity1.id, is_not(entity2.id))
+        assert_that(self.world.entities.get(entity1.id), is_(entity1))
+        assert_that(self.world.entities.get(entity2.id), is_(entity2))
+
+    def test_remove_entity_during_tick(self):
+        class RemovingEntity(WorldEntity):
+            def tick(self):
+                victim.remove()
+        RemovingEntity()
+        victim = WorldTest.TestEntity()
+        survivor = WorldTest.TestEntity()
+        self.world.tick()
+        assert_that(victim.ticked_count, is_(0), 'removed entity is not ticked')
+        assert_that(survivor.ticked_count, is_(1), 'following entity is still ticked')
+        assert_that(list(self.world.entities), is_not(has_item(victim)))
+        assert_that(len(self.world.entities), is_(2))
+
+    def test_entities_belong_to_the_world_they_are_created_in(self):
+        entity = WorldTest.TestEntity()
+        other_world = World().activate()
+        other_entity = WorldTest.TestEntity()
+        assert_that(entity.world, is_(self.world))
+        assert_that(other_entity.world, is_(other_world))
+        self.world.tick()
+        assert_that(entity.ticked_count, is_(1))
+        assert_that(other_entity.ticked_count, is_(0))
+        assert_that(other_entity in self.world.entities, is_(False))
+
+    def test_entities_created_during_tick_join_the_ticking_world(self):
+        world = self.world
+        created = []
+        class GeneratingEntity(WorldEntity):
+            def tick(self):
+                created.append(WorldTest.TestEntity())
+        GeneratingEntity()
+        World().activate()
+        world.tick()
+        assert_that(created[0].world, is_(world))
+        assert_that(created[0] in world.entities, is_(True))
+
+    def test_listeners_follow_additions_and_removals(self):
+        class Listener(WorldListener):
+            def __init__(self):
+                self.added = []
+                self.removed = []
+            def entity_added(self, entity):
+                self.added.append(entity)
+            def entity_removed(self, entity):
+                self.removed.append(entity)
+        listener = Listener()
+        self.world.listen(listener)
+        entity = WorldTest.TestEntity()
+        entity.remove()
+        entity.remove()
+        assert_that(listener.added, is_([entity]))
+        assert_that(listener.removed, is_([entity]))
+
+    def test_adding_in_bulk(self):
+        existing = WorldTest.TestEntity()
+        self.world.start_bulk()
+        entities = [WorldTest.TestEntity() for i in range(3)]
+        assert_that(len(self.world.entities), is_(1), 'added by end_bulk')
+        assert_that(self.world.end_bulk(), is_(entities))
+        assert_that(list(self.world.entities), is_([existing] + entities))
+        assert_that([e.id for e in entities], is_([1, 2, 3]))
+
+    def test_adding_more_than_made_room_for_in_bulk(self):
+        self.world.start_bulk(2)
+        entities = [WorldTest.TestEntity() for i in range(3)]
+        assert_that(self.world.end_bulk(), is_(entities))
+        self.world.start_bulk(2)
+        assert_that(self.world.end_bulk(), is_([]))
+
+
+class DeferredEventsTest(unittest.TestCase):
+    class Trigger(WorldEntity):
+        def __init__(self, log):
+            super(DeferredEventsTest.Trigger, self).__init__()
+            self.log = log
+            self.events = EventDispatcher(['ON_FIRED'], observer=self)
+
+        def tick(self):
+            self.log.append(('tick', self.id))
+            self.events.trigger(self.events.ON_FIRED)
+
+        @EventDispatcher.event_handler
+        def on_fired(self):
+            self.log.append(('fired', self.id))
+            if len(self.log) < 8:
+                DeferredEventsTest.Trigger(self.log)
+
+    def setUp(self):
+        self.world = World.reset()
+        self.log = []
+        self.first = DeferredEventsTest.Trigger(self.log)
+        self.second = DeferredEventsTest.Trigger(self.log)
+
+    def test_handled_at_once_by_default(self):
+        self.world.tick()
+        assert_that(self.log, is_([('tick', 0), ('fired', 0), ('tick', 1), ('fired', 1)]))
+
+    def test_handled_after_all_entities_ticked(self):
+        self.world.defer_events = True
+        self.world.tick()
+        assert_that(self.log, is_([('tick', 0), ('tick', 1), ('fired', 0), ('fired', 1)]))
+        assert_that(self.world.event_queue, is_(None))
+        assert_that(len(self.world.entities), is_(4), 'entities made by handlers join after the tick')
+
+    def test_worlds_keep_their_own_queues(self):
+        other = World()
+        self.world.defer_events = True
+        self.world.tick()
+        other.activate()
+        outsider = DeferredEventsTest.Trigger([])
+        self.world.activate()
+        seen = []
+        def tick():
+            # the other world does not defer its events
+            outsider.events.trigger(outsider.events.ON_FIRED)
+            seen.extend(outsider.log)
+        self.first.tick = tick
+        self.world.tick()
+        assert_that(seen, is_([('fired', outsider.id)]))
+
+
+class WorldEntityRepositoryTest(unittest.TestCase):
+    def test_iterates_in_insertion_order(self):
+        repository = WorldEntityRepository()
+        entities = [WorldEntity.__new__(WorldEntity) for i in range(5)]
+        for e in entities:
+            repository.add(e)
+        repository.remove(entities[1])
+        repository.remove(entities[3])
+        assert_that(list(repository), is_([entities[0], entities[2], entities[4]]))
+        repository.compact()
+        assert_that(list(repository), is_([entities[0], entities[2], entities[4]]))
+        assert_that(repository.get(entities[4].id), is_(entities[4]))
+
+    def test_readded_entity_keeps_its_id(self):
+        repository = WorldEntityRepository()
+        entity = WorldEntity.__new__(WorldEntity)
+        repository.add(entity)
+        entity_id = entity.id
+        repository.remove(entity)
+        assert_that(entity in repository, is_(False))
+        repository.add(entity)
+        assert_that(entity.id, is_(entity_id))
+        assert_that(entity in repository, is_(True))
 
 if __name__=='__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import math
+
+
+class SpatialHash(object):
+    '''
+    Finds entities near a location.
+
+    Entities are bucketed into square cells of cell_size by their
+    location (x, y).  Queries only look at the cells overlapping the
+    search radius, so choose a cell size close to the usual radius.
+    '''
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self._cells = {}
+        self._keys = {}
+
+    def _key(self, location):
+        return (int(math.floor(location[0] / self.cell_size)),
+                int(math.floor(location[1] / self.cell_size)))
+
+    def insert(self, entity, location):
+        assert entity not in self._keys, 'cannot insert same entity twice'
+        key = self._key(location)
+        self._keys[entity] = key
+        self._cells.setdefault(key, []).append(entity)
+
+    def move(self, entity, location):
+        '''inserts the entity if it is not indexed yet'''
+        key = self._key(location)
+        old_key = self._keys.get(entity)
+        if old_key == key: return
+        if old_key is not None:
+            self._remove_from_cell(entity, old_key)
+        self._keys[entity] = key
+        self._cells.setdefault(key, []).append(entity)
+
+    def remove(self, entity):
+        key = self._keys.pop(entity, None)
+        if key is None: return
+        self._remove_from_cell(entity, key)
+
+    def _remove_from_cell(self, entity, key):
+        cell = self._cells[key]
+        cell.remove(entity)
+        if not cell:
+            del self._cells[key]
+
+    def near(self, location, radius):
+        '''entities within radius of location, in a deterministic order'''
+        x, y = location
+        x_min, y_min = self._key((x - radius, y - radius))
+        x_max, y_max = self._key((x + radius, y + radius))
+        found = []
+        for i in xrange(x_min, x_max + 1):
+            for j in xrange(y_min, y_max + 1):
+                for entity in self._cells.get((i, j), ()):
+                    ex, ey = entity.location
+                    if (ex - x) ** 2 + (ey - y) ** 2 <= radius ** 2:
+                        found.append(entity)
+        return found
+
+    def __contains__(self, entity):
+        return entity in self._keys
+
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,36 @@
+import unittest
+from hamcrest import *
+
+from spatial import *
+
+
+class Located(object):
+    def __init__(self, location):
+        self.location = location
+
+
+class SpatialHashTest(unittest.TestCase):
+    def test_near(self):
+        index = SpatialHash(1.0)
+        a = Located((0.5, 0.5))
+        b = Located((1.2, 0.5))
+        c = Located((5.0, 5.0))
+        for e in [a, b, c]:
+            index.insert(e, e.location)
+        assert_that(index.near((0.4, 0.4), 1.0), contains_inanyorder(a, b))
+        assert_that(index.near((0.4, 0.4), 0.5), is_([a]))
+        assert_that(index.near((5.0, 4.0), 1.0), is_([c]))
+        assert_that(index.near((-3.0, -3.0), 1.0), is_([]))
+
+    def test_move_and_remove(self):
+        index = SpatialHash(1.0)
+        a = Located((0.5, 0.5))
+        index.insert(a, a.location)
+        a.location = (10.5, -3.5)
+        index.move(a, a.location)
+        assert_that(index.near((0.5, 0.5), 1.0), is_([]))
+        assert_that(index.near((10.0, -3.0), 1.0), is_([a]))
+        index.remove(a)
+        assert_that(a in index, is_(False))
+        assert_that(len(index), is_(0))
+        assert_that(index.near((10.0, -3.0), 1.0), is_([]))